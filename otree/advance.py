@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Advance participants through their pages without HTTP requests.
+
+Timeouts, auto play and the session monitor's "advance slowest
+participants" button used to drive pages with fake requests through
+``django.test.Client``: middleware, session, CSRF, template rendering and a
+chain of followed redirects, just to submit a page. Here the page view is
+instantiated directly and only its logic runs: for a form page,
+``before_next_page`` and ``_increment_index_in_pages``; for a wait page,
+arriving on it.
+
+Then the participant continues like their browser would after the
+redirect: pages that are not displayed are skipped, wait pages are
+arrived on, and the next form page is visited, which starts its timeout.
+Nothing is rendered. The page still gets a request, built with
+``RequestFactory``, because user code may read ``self.request``.
+
+"""
+
+import collections
+import logging
+
+import django.test
+from django.conf import settings
+from django.db import transaction
+
+import otree.channels.broadcast
+import otree.common_internal
+import otree.db.idmap
+from otree import constants_internal
+from otree.models.participant import Participant
+from otree.views.abstract import participant_lock
+
+
+logger = logging.getLogger(__name__)
+
+request_factory = django.test.RequestFactory()
+
+
+def advance_participant(participant, auto_submit=True, page_index=None):
+    """
+    submit the participant's current page.
+    with auto_submit, the page's timeout_submission values are used,
+    and timeout_happened is True, like when the page times out.
+    a participant who hasn't opened their start URL yet is started.
+
+    if page_index is given, do nothing unless the participant is
+    still on that page.
+
+    returns the participant's new _index_in_pages.
+
+    don't call it from inside a page, because it uses its own
+    idmap cache.
+    """
+    return _advance(participant.code, auto_submit, page_index)
+
+
+def advance_participants(participants, auto_submit=True, submit=True,
+                         skip_errors=False):
+    """
+    advance_participant for each participant.
+    participants who are no longer on the page they were on
+    when they were loaded are skipped.
+    the clients of each session are told which participants advanced
+    in one message, rather than one message per participant.
+
+    without submit, the current page is only loaded, like when the
+    browser reloads it: a wait page is passed if the group is ready,
+    and a form page is not submitted but its timeout is started.
+
+    with skip_errors, an error while advancing a participant is logged,
+    and the next participants are still advanced.
+    returns the participants who failed.
+    """
+    new_indexes_by_session = collections.defaultdict(dict)
+    failed = []
+    try:
+        for participant in participants:
+            # a participant who fails isn't in the batch
+            new_indexes = {}
+            try:
+                _advance(
+                    participant.code, auto_submit,
+                    page_index=participant._index_in_pages,
+                    new_indexes=new_indexes, submit=submit)
+                new_indexes_by_session[participant.session_id].update(
+                    new_indexes)
+            except Exception:
+                if not skip_errors:
+                    raise
+                logger.exception(
+                    'Could not advance participant {}'.format(
+                        participant.code))
+                failed.append(participant)
+    finally:
+        # the participants who advanced before an error are still told
+        for session_pk, new_indexes in new_indexes_by_session.items():
+            otree.channels.broadcast.send_auto_advance_batch(
+                session_pk, new_indexes)
+    return failed
+
+
+def _request_transaction():
+    # like FormPageOrInGameWaitPageMixin._request_transaction
+    if settings.ATOMIC_PAGE_REQUESTS:
+        return transaction.atomic()
+    return otree.common_internal.no_op_context_manager()
+
+
+def _advance(participant_code, auto_submit, page_index=None,
+             new_indexes=None, submit=True):
+    # channel messages etc. are sent once everything is saved,
+    # i.e. after the lock's and the request's transactions closed
+    after_commit_calls = []
+    with participant_lock(participant_code), \
+            otree.db.idmap.use_cache(), \
+            _request_transaction():
+        participant = Participant.objects.select_related(
+            'session').get(code=participant_code)
+        if (page_index is not None and
+                participant._index_in_pages != page_index):
+            return participant._index_in_pages
+
+        if participant._index_in_pages == 0:
+            participant._initialize()
+            participant.save()
+        elif submit:
+            page = _get_page(participant, after_commit_calls, new_indexes)
+            if page is None:
+                # finished all pages
+                return participant._index_in_pages
+            if auto_submit:
+                data = {constants_internal.auto_submit: True}
+            else:
+                data = {}
+            page.request = request_factory.post(page.request.path, data)
+            page._advance(auto_submit)
+            page.save_objects()
+
+        # follow the redirects, until a page the participant stays on
+        while True:
+            page = _get_page(participant, after_commit_calls, new_indexes)
+            if page is None:
+                break
+            stays = page._visit()
+            page.save_objects()
+            if stays:
+                break
+
+    for func, args in after_commit_calls:
+        func(*args)
+    return participant._index_in_pages
+
+
+def _get_page(participant, after_commit_calls, new_indexes):
+    """the view of the participant's current page, set up like
+    FormPageOrInGameWaitPageMixin._dispatch does.
+    None if the participant is past the last page.
+    """
+    if participant._index_in_pages > participant._max_page_index:
+        return None
+    Page = participant._current_page_location().Page
+    page = Page()
+    page.request = request_factory.get(
+        Page.url(participant, participant._index_in_pages))
+    page.participant = participant
+    page._index_in_pages = participant._index_in_pages
+    page.index_in_pages = page._index_in_pages
+    page._measurement = None
+    page._after_commit_calls = after_commit_calls
+    page._batched_new_indexes = new_indexes
+    page.load_objects()
+    participant._current_page_name = Page.__name__
+    return page
@@ -8,6 +8,7 @@ from django.apps import AppConfig, apps
 from django.conf import settings
 from django.db.models import signals
 
+import otree.db.bulk
 from otree.models_concrete import StubModel
 from otree.models.session import GlobalSingleton
 
@@ -55,8 +56,19 @@ class OtreeConfig(AppConfig):
     def setup_create_singleton_objects(self):
         signals.post_migrate.connect(create_singleton_objects)
 
+    def setup_flush_buffers_on_sigterm(self):
+        if not settings.PAGE_COMPLETION_BUFFER_SIZE:
+            # no buffer to flush
+            return
+        try:
+            otree.db.bulk.install_sigterm_handler()
+        except ValueError:
+            # only the main thread can set signal handlers
+            logger.debug('Not flushing buffers on SIGTERM')
+
     def ready(self):
         self.setup_create_singleton_objects()
+        self.setup_flush_buffers_on_sigterm()
         if getattr(settings, 'CREATE_DEFAULT_SUPERUSER', False):
             self.setup_create_default_superuser()
         # self.init_celery()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Messages that make many clients of a session redirect at once.
+
+To keep all clients from re-requesting their page within the same few
+milliseconds, messages carry ``stagger_ms``: each client waits a random
+time between 0 and ``stagger_ms`` before redirecting. The window grows
+with the number of clients that redirect.
+
+"""
+
+import json
+
+from channels import Group
+
+from otree.common_internal import (
+    channels_session_group_name, channels_wait_page_group_name)
+
+
+STAGGER_MS_PER_CLIENT = 10
+MAX_STAGGER_MS = 5000
+
+
+def stagger_ms(num_clients):
+    return min(MAX_STAGGER_MS, STAGGER_MS_PER_CLIENT * max(num_clients - 1, 0))
+
+
+def wait_page_ready_message(num_clients):
+    return {'text': json.dumps(
+        {'status': 'ready', 'stagger_ms': stagger_ms(num_clients)})}
+
+
+def send_auto_advance_batch(session_pk, new_indexes):
+    """tell the form pages of the session which participants advanced,
+    in one message to the session's group rather than one message per
+    participant. each client picks its own entry.
+
+    new_indexes: {id_in_session: new _index_in_pages}.
+    not keyed by participant code, because every participant of the
+    session gets the message, and the code gives access to their pages.
+    """
+    if not new_indexes:
+        return
+    Group(channels_session_group_name(session_pk)).send(
+        {'text': json.dumps({
+            'new_indexes': new_indexes,
+            'stagger_ms': stagger_ms(len(new_indexes)),
+        })}
+    )
+
+
+def send_lobby_ready(session_pk, page_index, participant_pks):
+    """tell the participants waiting on a group_by_arrival_time wait page
+    that their group was formed. each of them listens on their own
+    channel group, since the group didn't exist when they arrived.
+    """
+    message = wait_page_ready_message(len(participant_pks))
+    for participant_pk in participant_pks:
+        Group(channels_wait_page_group_name(
+            session_pk, page_index, 'lobby', participant_pk)).send(message)
@@ -6,12 +6,13 @@ import json
 from channels import Group
 
 from otree.models import Participant
-from otree.models_concrete import (
-    CompletedGroupWaitPage, CompletedSubsessionWaitPage)
 from otree.common_internal import (
-    channels_wait_page_group_name, channels_create_session_group_name)
+    channels_wait_page_group_name, channels_create_session_group_name,
+    channels_session_group_name)
 
+import otree.readiness
 import otree.session
+import otree.views.abstract
 from otree.models import Session
 from otree.models_concrete import (
     FailedSessionCreation,
@@ -33,18 +34,8 @@ def connect_wait_page(message, params):
     group.add(message.reply_channel)
 
     # in case message was sent before this web socket connects
-    if model_name == 'group':
-        ready = CompletedGroupWaitPage.objects.filter(
-            page_index=page_index,
-            group_pk=model_pk,
-            session_pk=session_pk,
-            after_all_players_arrive_run=True).exists()
-    else:  # subsession
-        ready = CompletedSubsessionWaitPage.objects.filter(
-            page_index=page_index,
-            session_pk=session_pk,
-            after_all_players_arrive_run=True).exists()
-    if ready:
+    if otree.readiness.is_ready(
+            session_pk, page_index, model_name, model_pk):
         message.reply_channel.send(
             {'text': json.dumps(
                 {'status': 'ready'})})
@@ -62,9 +53,21 @@ def disconnect_wait_page(message, params):
     group.discard(message.reply_channel)
 
 
+def _auto_advance_params(params):
+    """the session pk in the URL is not trusted: it only tells that the
+    page handles the batches of send_auto_advance_batch. the session
+    group joined is the participant's own"""
+    params = params.split(',')
+    participant_code, page_index = params[:2]
+    # pages rendered before the session pk was added to the URL
+    # (e.g. open during a deploy) only send the first 2
+    handles_batches = len(params) > 2
+    return participant_code, int(page_index), handles_batches
+
+
 def connect_auto_advance(message, params):
-    participant_code, page_index = params.split(',')
-    page_index = int(page_index)
+    participant_code, page_index, handles_batches = _auto_advance_params(
+        params)
 
     group = Group('auto-advance-{}'.format(participant_code))
     group.add(message.reply_channel)
@@ -79,6 +82,10 @@ def connect_auto_advance(message, params):
                 # doesn't get shown because not yet localized
                 {'error': 'Participant not found in database.'})})
         return
+    if handles_batches:
+        # for otree.channels.broadcast.send_auto_advance_batch
+        Group(channels_session_group_name(participant.session_id)).add(
+            message.reply_channel)
     if participant._index_in_pages > page_index:
         message.reply_channel.send(
             {'text': json.dumps(
@@ -86,10 +93,17 @@ def connect_auto_advance(message, params):
 
 
 def disconnect_auto_advance(message, params):
-    participant_code, page_index = params.split(',')
+    participant_code, page_index, handles_batches = _auto_advance_params(
+        params)
 
     group = Group('auto-advance-{}'.format(participant_code))
     group.discard(message.reply_channel)
+    if handles_batches:
+        session_pks = Participant.objects.filter(
+            code=participant_code).values_list('session_id', flat=True)
+        for session_pk in session_pks:
+            Group(channels_session_group_name(session_pk)).discard(
+                message.reply_channel)
 
 
 def create_session(message):
@@ -114,6 +128,10 @@ def create_session(message):
     group.send({'text': json.dumps({'status': 'ready'})})
 
 
+def after_all_players_arrive(message):
+    otree.views.abstract.run_after_all_players_arrive(message.content)
+
+
 def connect_wait_for_session(message, pre_create_id):
     group = Group(channels_create_session_group_name(pre_create_id))
     group.add(message.reply_channel)
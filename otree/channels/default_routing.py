@@ -23,5 +23,8 @@ channel_routing = [
           path=r'^/wait_for_session/(?P<pre_create_id>\w+)/$'),
     route('websocket.disconnect', consumers.disconnect_wait_for_session,
           path=r'^/wait_for_session/(?P<pre_create_id>\w+)/$'),
-    route('otree.create_session', consumers.create_session)
+    route('otree.create_session', consumers.create_session),
+    route(
+        'otree.after_all_players_arrive',
+        consumers.after_all_players_arrive),
 ]
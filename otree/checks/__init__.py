@@ -8,6 +8,8 @@ import inspect
 from importlib import import_module
 from functools import wraps
 
+import six
+
 from django.apps import apps
 from django.conf import settings
 from django.core.checks import register, Error
@@ -309,6 +311,26 @@ def pages_function(rules, **kwargs):
                 if cond:
                     msg = 'views.py: "{}" is not a valid page'.format(ViewCls)
                     rules.push_error(msg)
+                elif getattr(ViewCls, 'group_by_arrival_time', False):
+                    _group_by_arrival_time_page(rules, ViewCls)
+
+
+def _group_by_arrival_time_page(rules, ViewCls):
+    if ViewCls.wait_for_all_groups:
+        rules.push_error(
+            'views.py: "{}" cannot have both group_by_arrival_time and '
+            'wait_for_all_groups'.format(ViewCls.__name__))
+    try:
+        Constants = rules.get_module_attr('models', 'Constants')
+    except (ImportError, AttributeError):
+        # reported by the other checks
+        return
+    players_per_group = getattr(Constants, 'players_per_group', None)
+    if not isinstance(players_per_group, six.integer_types):
+        rules.push_error(
+            'views.py: "{}" has group_by_arrival_time, so '
+            '\'Constants.players_per_group\' must be a number'.format(
+                ViewCls.__name__))
 
 
 @register_rules(id='otree.E005')
@@ -430,6 +430,10 @@ def check_pypi_for_updates(print_message=True):
             return update_message
 
 
+def channels_session_group_name(session_pk):
+    return 'session-{}'.format(session_pk)
+
+
 def channels_create_session_group_name(pre_create_id):
     return 'wait_for_session_{}'.format(pre_create_id)
 
@@ -47,6 +47,8 @@ session_id = 'session_id'
 session_code = 'session_code'
 wait_page_http_header = 'oTree-Wait-Page'
 redisplay_with_errors_http_header = 'oTree-Redisplay-With-Errors'
+page_stats_http_header = 'oTree-Page-Stats'
+query_budget_exceeded_http_header = 'oTree-Query-Budget-Exceeded'
 user_type = 'user_type'
 user_type_participant = 'p'
 success = True
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import collections
+import logging
+import signal
+import threading
+import weakref
+
+import six
+from django.db import connection
+from django.db.models import Case, F, Model, Value, When, signals
+from otree_save_the_change.mixins import SaveTheChange
+
+
+logger = logging.getLogger(__name__)
+
+
+# every BulkCreateBuffer of the process, to flush when it exits
+_buffers = weakref.WeakSet()
+
+
+def flush_all_buffers():
+    for buffer in list(_buffers):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception(
+                'Failed to flush {} records'.format(buffer.model.__name__))
+
+
+atexit.register(flush_all_buffers)
+
+
+def install_sigterm_handler():
+    """by default, SIGTERM (e.g. from the process manager during a
+    deploy) kills the process without running the atexit hooks.
+    make it exit the process normally instead, so that the buffers are
+    flushed. if the server handles SIGTERM itself, nothing changes.
+    must be called from the main thread.
+
+    """
+    if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+
+def _exit_on_sigterm(signum, frame):
+    # don't flush here: the signal can arrive while this thread holds a
+    # buffer's lock, or in the middle of a transaction. the exception
+    # unwinds them, then the atexit hook flushes.
+    raise SystemExit(128 + signum)
+
+
+class BulkCreateBuffer(object):
+    """Collects unsaved model instances and inserts them with one
+    ``bulk_create`` once ``max_size`` instances are waiting,
+    or ``max_seconds`` after the oldest one was added.
+
+    Instances are held in the memory of the current process,
+    so they are only for records that nothing reads back during the
+    request (like PageCompletion). Whatever is left is flushed
+    when the process exits normally or gets SIGTERM (see
+    install_sigterm_handler, which oTree calls when buffering is on);
+    records added less than ``max_seconds`` before a crash are lost.
+
+    A flush inserts the instances of every request that added them, on
+    the connection of the thread that flushes. So don't call ``add`` or
+    ``flush`` inside a transaction that may roll back: the other
+    requests' records would be rolled back with it. Pages add their
+    records once their request committed (see ``_run_after_commit``).
+
+    """
+
+    def __init__(self, model, max_size, max_seconds):
+        self.model = model
+        self.max_size = max_size
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._instances = []
+        self._timer = None
+        _buffers.add(self)
+
+    def add(self, instance):
+        with self._lock:
+            self._instances.append(instance)
+            is_full = len(self._instances) >= self.max_size
+            if not is_full and self._timer is None:
+                self._timer = threading.Timer(
+                    self.max_seconds, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if is_full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            instances = self._instances
+            self._instances = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if instances:
+            self.model.objects.bulk_create(instances)
+        return len(instances)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception(
+                'Failed to flush {} records'.format(self.model.__name__))
+        finally:
+            # the timer thread has its own DB connection
+            connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._instances)
+
+
+# maximum number of rows per UPDATE statement of bulk_update
+MAX_BULK_UPDATE_ROWS = 1000
+
+
+def bulk_update(queryset, values):
+    """Write different values to many rows, with one
+    ``UPDATE ... SET field = CASE WHEN pk = ... THEN ... END``
+    per batch of rows, rather than one UPDATE per row.
+
+    values: {field_name: {pk: value}}
+
+    """
+    model = queryset.model
+    pks = sorted(set(pk for by_pk in values.values() for pk in by_pk))
+    # each row needs 2 query parameters per field and 1 for the pk filter
+    batch_size = connection.ops.bulk_batch_size(
+        [None] * (2 * len(values) + 1), pks)
+    batch_size = max(1, min(batch_size, MAX_BULK_UPDATE_ROWS))
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        updates = {}
+        for field_name, by_pk in values.items():
+            field = model._meta.get_field(field_name)
+            whens = [
+                When(pk=pk, then=Value(by_pk[pk], output_field=field))
+                for pk in batch if pk in by_pk]
+            if whens:
+                # rows without a value keep theirs. on Postgres, the
+                # column in the CASE also gives the parameters their type
+                updates[field_name] = Case(
+                    *whens, default=F(field_name), output_field=field)
+        queryset.filter(pk__in=batch).update(**updates)
+
+
+def forget_changes(instance, field_names):
+    """the fields of the instance were written with bulk_update,
+    so SaveTheChange doesn't need to write them again"""
+    changed_fields = getattr(instance, '_changed_fields', None)
+    if not changed_fields:
+        return
+    for field_name in field_names:
+        field = instance._meta.get_field(field_name)
+        changed_fields.pop(field.name, None)
+        changed_fields.pop(field.attname, None)
+
+
+def _has_own_receivers(signal, model):
+    """whether receivers are connected to signal with model as sender.
+    receivers for every sender (like the idmap cache's) don't count."""
+    # the keys are (receiver id, sender id), see django.dispatch
+    return any(
+        sender_id == id(model) for (receiver_id, sender_id), receiver
+        in signal.receivers)
+
+
+def _can_bulk_save(model):
+    """whether bulk_update writes model like save() would:
+    save() is not overridden (beyond SaveTheChange),
+    and no pre_save/post_save receivers are connected for it"""
+    from otree.models.varsmixin import _SaveTheChangeWithCustomFieldSupport
+    plain_saves = [
+        six.get_unbound_function(cls.save) for cls in
+        [Model, SaveTheChange, _SaveTheChangeWithCustomFieldSupport]]
+    if six.get_unbound_function(model.save) not in plain_saves:
+        return False
+    return not (_has_own_receivers(signals.pre_save, model) or
+                _has_own_receivers(signals.post_save, model))
+
+
+def bulk_save(instances):
+    """Save the changes that SaveTheChange recorded on many instances,
+    with bulk_update rather than one UPDATE per instance.
+    Instances without changes are not written.
+
+    bulk_update bypasses save() and the pre_save/post_save signals, so
+    instances of models that override save() or have receivers for those
+    signals are saved normally, one by one, and so are instances of
+    models without SaveTheChange.
+
+    """
+    changed_values = collections.defaultdict(
+        lambda: collections.defaultdict(dict))
+    changed_instances = []
+    can_bulk_save = {}
+    for instance in instances:
+        model = type(instance)
+        if model not in can_bulk_save:
+            can_bulk_save[model] = _can_bulk_save(model)
+        if not can_bulk_save[model]:
+            instance.save()
+            continue
+        # e.g. the vars JSONField, see otree.models.varsmixin
+        if hasattr(instance, '_save_the_change_update_changed_fields'):
+            instance._save_the_change_update_changed_fields()
+        changed_fields = getattr(instance, '_changed_fields', None)
+        if changed_fields is None:
+            instance.save()
+            continue
+        if not changed_fields:
+            continue
+        values = changed_values[type(instance)]
+        for name in changed_fields:
+            field = instance._meta.get_field(name)
+            values[field.name][instance.pk] = getattr(
+                instance, field.attname)
+        changed_instances.append(instance)
+    for model, values in changed_values.items():
+        bulk_update(model.objects.all(), values)
+    for instance in changed_instances:
+        instance._changed_fields.clear()
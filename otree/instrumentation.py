@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Opt-in measurements of what each page request costs:
+number of SQL queries, time spent in SQL, time spent waiting for the
+participant lock, and time spent rendering the template.
+
+Turn it on for all pages with ``PAGE_INSTRUMENTATION = True`` in settings.py.
+A page that declares a ``query_budget`` is always measured, so that
+bots fail when the page runs more queries than its budget.
+
+The numbers of the current request are sent in the ``oTree-Page-Stats``
+response header, and aggregates per page class are shown in the admin
+(see ``otree.views.admin.PageStats``).
+
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import otree.constants_internal as constants
+
+
+logger = logging.getLogger(__name__)
+
+# number of recent requests per page used to compute percentiles
+NUM_RECENT_SAMPLES = 200
+
+
+def is_enabled(page):
+    return bool(
+        getattr(settings, 'PAGE_INSTRUMENTATION', False) or
+        getattr(page, 'query_budget', None) is not None)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class PageStats(object):
+    """aggregated measurements of one page class, in this process"""
+
+    metrics = ['queries', 'sql_ms', 'lock_wait_ms', 'render_ms', 'total_ms']
+
+    def __init__(self, page_name):
+        self.page_name = page_name
+        self.requests = 0
+        self.over_budget = 0
+        self.totals = dict.fromkeys(self.metrics, 0)
+        self.maxima = dict.fromkeys(self.metrics, 0)
+        self.recent = {
+            metric: collections.deque(maxlen=NUM_RECENT_SAMPLES)
+            for metric in self.metrics}
+
+    def record(self, measurement):
+        self.requests += 1
+        if measurement.over_budget:
+            self.over_budget += 1
+        for metric in self.metrics:
+            value = getattr(measurement, metric)
+            self.totals[metric] += value
+            self.maxima[metric] = max(self.maxima[metric], value)
+            self.recent[metric].append(value)
+
+    def as_rows(self):
+        """one (metric, mean, p95, max) row per metric"""
+        rows = []
+        for metric in self.metrics:
+            rows.append((
+                metric,
+                self.totals[metric] / float(self.requests),
+                percentile(list(self.recent[metric]), 0.95),
+                self.maxima[metric]))
+        return rows
+
+
+_page_stats = collections.OrderedDict()
+_page_stats_lock = threading.Lock()
+
+
+def record(measurement):
+    with _page_stats_lock:
+        page_stats = _page_stats.get(measurement.page_name)
+        if page_stats is None:
+            page_stats = PageStats(measurement.page_name)
+            _page_stats[measurement.page_name] = page_stats
+        page_stats.record(measurement)
+
+
+def get_page_stats():
+    with _page_stats_lock:
+        return list(_page_stats.values())
+
+
+def reset():
+    with _page_stats_lock:
+        _page_stats.clear()
+
+
+class SaveStats(object):
+    """counts what SaveObjectsMixin.save_objects did with the instances
+    it looked at: written, or skipped because nothing changed
+    (writes coalesced away).
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.checked = 0
+            self.written = 0
+
+    def record(self, checked, written):
+        with self._lock:
+            self.requests += 1
+            self.checked += checked
+            self.written += written
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'checked': self.checked,
+                'written': self.written,
+                'coalesced': self.checked - self.written,
+            }
+
+
+save_stats = SaveStats()
+
+
+class PageMeasurement(object):
+    """measurements of a single page request.
+
+    the page view fills in ``lock_wait_ms`` and ``render_ms``;
+    queries and total time are measured by ``measure()``.
+
+    """
+
+    def __init__(self, page):
+        self.page_name = page.__class__.__name__
+        self.query_budget = getattr(page, 'query_budget', None)
+        self.queries = 0
+        self.sql_ms = 0
+        self.lock_wait_ms = 0
+        self.render_ms = 0
+        self.total_ms = 0
+
+    @property
+    def over_budget(self):
+        return (
+            self.query_budget is not None and
+            self.queries > self.query_budget)
+
+    @contextlib.contextmanager
+    def measure(self):
+        start_time = time.time()
+        with CaptureQueriesContext(connection) as captured:
+            yield self
+        self.total_ms = (time.time() - start_time) * 1000
+        self.queries = len(captured)
+        self.sql_ms = sum(
+            float(query['time']) for query in captured.captured_queries
+        ) * 1000
+
+    @contextlib.contextmanager
+    def timing(self, metric):
+        start_time = time.time()
+        yield
+        setattr(self, metric, (time.time() - start_time) * 1000)
+
+    def header_value(self):
+        return '; '.join(
+            '{}={}'.format(metric, round(getattr(self, metric), 1))
+            for metric in PageStats.metrics)
+
+    def add_headers(self, response):
+        response[constants.page_stats_http_header] = self.header_value()
+        if self.over_budget:
+            logger.warning(
+                'Page {} ran {} queries, but its query_budget is {}'.format(
+                    self.page_name, self.queries, self.query_budget))
+            response[constants.query_budget_exceeded_http_header] = (
+                '{}/{}'.format(self.queries, self.query_budget))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Group by arrival time.
+
+A wait page with ``group_by_arrival_time = True`` is a lobby: instead of
+waiting for the group they were put in when the session was created,
+participants are grouped in the order they arrive on it. As soon as
+``Constants.players_per_group`` participants are waiting, they are moved
+into a new group, in this round and in the later rounds of the app, and
+they pass the wait page. So participants who drop out before the lobby
+don't keep anyone waiting; they stay in the groups the session was
+created with. Groups left empty are deleted.
+
+The queue is the ``LobbyArrival`` table, in order of arrival. Groups are
+formed under the subsession's scoped lock (see ``otree.locks``), in a
+transaction that is committed before the lock is released, so that
+requests in other processes see the queue as it is. Each arrival reads
+only the first ``players_per_group`` waiting rows, and a group's rows are
+written with a few bulk queries, whatever the number of participants.
+
+Waiting participants are told their group is ready through their own
+wait page channel group (model name ``'lobby'``, with the participant's
+pk), because their group doesn't exist when they arrive.
+
+"""
+
+from django.db.models import Max
+
+import otree.channels.broadcast
+import otree.common_internal
+import otree.locks
+import otree.readiness
+from otree.models.group import set_players_of_groups
+from otree.models_concrete import LobbyArrival, PairHistory
+
+
+def arrive(page):
+    """the participant arrived on the lobby wait page.
+    returns True if they are in their new group and can proceed.
+    """
+    arrival, created = LobbyArrival.objects.get_or_create(
+        participant_pk=page.participant.pk,
+        page_index=page._index_in_pages,
+        defaults={'session_pk': page.session.pk})
+    if arrival.group_pk is not None:
+        return True
+    # with ATOMIC_PAGE_REQUESTS, the arrival is only visible to other
+    # processes once the request committed, so form the groups then.
+    # the participant is then told to reload through their channel.
+    page._run_after_commit(
+        form_groups, page.subsession._meta.app_config.name,
+        page.session.pk, page.round_number, page._index_in_pages)
+    return LobbyArrival.objects.filter(
+        pk=arrival.pk, group_pk__isnull=False).exists()
+
+
+def form_groups(app_name, session_pk, round_number, page_index):
+    """put the participants waiting on the lobby into new groups,
+    players_per_group at a time, in order of arrival.
+    returns the new groups of the round.
+    """
+    models_module = otree.common_internal.get_models_module(app_name)
+    subsession = models_module.Subsession.objects.get(
+        session_id=session_pk, round_number=round_number)
+    group_size = models_module.Constants.players_per_group
+
+    formed = []
+    with otree.locks.scoped_lock(subsession), \
+            otree.common_internal.transaction_atomic():
+        while True:
+            waiting = LobbyArrival.objects.filter(
+                session_pk=session_pk,
+                page_index=page_index,
+                group_pk__isnull=True,
+            ).order_by('pk').values_list('pk', 'participant_pk')
+            waiting = list(waiting[:group_size])
+            if len(waiting) < group_size:
+                break
+            arrival_pks, participant_pks = zip(*waiting)
+            group = _create_group(subsession, participant_pks)
+            LobbyArrival.objects.filter(pk__in=arrival_pks).update(
+                group_pk=group.pk)
+            formed.append((group, participant_pks))
+
+    for group, participant_pks in formed:
+        for participant_pk in participant_pks:
+            otree.readiness.mark_ready(
+                session_pk, page_index, 'lobby', participant_pk)
+        otree.channels.broadcast.send_lobby_ready(
+            session_pk, page_index, participant_pks)
+    return [group for group, participant_pks in formed]
+
+
+def _create_group(subsession, participant_pks):
+    """move the players of the participants into a new group,
+    in this round and the later rounds of the app, with their
+    id_in_group in the order of participant_pks.
+    returns the group of this round.
+    """
+    GroupClass = subsession._GroupClass()
+    PlayerClass = subsession.player_set.model
+    session_pk = subsession.session_id
+    later_subsessions = list(type(subsession).objects.filter(
+        session_id=session_pk,
+        round_number__gte=subsession.round_number,
+    ).order_by('round_number'))
+
+    # new groups come after the ones the session was created with,
+    # in every round
+    max_id_in_subsession = GroupClass.objects.filter(
+        session_id=session_pk,
+        round_number__gte=subsession.round_number,
+    ).aggregate(Max('id_in_subsession'))['id_in_subsession__max'] or 0
+    id_in_subsession = max_id_in_subsession + 1
+    GroupClass.objects.bulk_create([
+        GroupClass(
+            session_id=session_pk, subsession=later_subsession,
+            round_number=later_subsession.round_number,
+            id_in_subsession=id_in_subsession)
+        for later_subsession in later_subsessions])
+    # bulk_create doesn't set the pks
+    groups = {
+        group.round_number: group
+        for group in GroupClass.objects.filter(
+            session_id=session_pk,
+            round_number__gte=subsession.round_number,
+            id_in_subsession=id_in_subsession)}
+
+    players = {
+        (player.round_number, player.participant_id): player
+        for player in PlayerClass.objects.filter(
+            session_id=session_pk,
+            round_number__gte=subsession.round_number,
+            participant_id__in=participant_pks)}
+    old_group_pks = set(
+        player.group_id for player in players.values()
+        if player.group_id is not None)
+    set_players_of_groups([
+        (group, [players[round_number, pk] for pk in participant_pks])
+        for round_number, group in groups.items()])
+
+    still_used = PlayerClass.objects.filter(
+        group_id__in=old_group_pks).values_list('group_id', flat=True)
+    GroupClass.objects.filter(
+        pk__in=old_group_pks - set(still_used)).delete()
+
+    PairHistory.regrouped(subsession, subsession.round_number)
+    otree.readiness.invalidate_groups(session_pk)
+
+    return groups[subsession.round_number]
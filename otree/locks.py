@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Backends for the locks oTree takes while handling requests:
+
+- the participant lock prevents the same participant from executing
+  a page twice at the same time (e.g. after a double click).
+- scoped locks serialize code paths that read and then write
+  data shared by a session, subsession or group (e.g. tallying who
+  arrived on a wait page). Requests in unrelated scopes never wait
+  for each other.
+
+The backend is chosen with the ``LOCK_BACKEND`` setting:
+
+- ``'table'``: (default) polls the ``ParticipantLockModel`` and
+  ``ScopedLockModel`` tables. Works on every database.
+- ``'select_for_update'``: ``SELECT ... FOR UPDATE`` on the participant row
+  (or the ``ScopedLockModel`` row).
+  The request runs inside a transaction, and the lock is released when it
+  commits. Needs a database that supports row locks (Postgres, MySQL).
+- ``'advisory'``: Postgres session-level advisory locks.
+- ``'inprocess'``: a lock table in the memory of the current process.
+  Only correct if the server runs a single process.
+
+You can also give the dotted path to your own subclass of
+``BaseLockBackend``.
+
+Every backend records how long requests waited to acquire the lock,
+so that the backends can be compared under the same load
+(see ``BaseLockBackend.stats``).
+
+"""
+
+import contextlib
+import hashlib
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import (
+    IntegrityError, OperationalError, connection, transaction)
+from django.http import Http404
+from django.utils.module_loading import import_string
+
+from otree.models.participant import Participant
+from otree.models_concrete import ParticipantLockModel, ScopedLockModel
+
+
+# seconds after which we give up on acquiring a lock
+LOCK_TIMEOUT = 10
+
+
+def participant_not_found(participant_code):
+    msg = (
+        "This user ({}) does not exist in the database. "
+        "Maybe the database was recreated."
+    ).format(participant_code)
+    return Http404(msg)
+
+
+def participant_lock_stuck(participant_code):
+    return Exception(
+        'Request for participant {} is stuck'.format(participant_code))
+
+
+class LockStats(object):
+    """Running totals of the time spent waiting for a lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.acquisitions = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record(self, wait):
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        with self._lock:
+            if self.acquisitions:
+                mean_wait = self.total_wait / self.acquisitions
+            else:
+                mean_wait = 0.0
+            return {
+                'acquisitions': self.acquisitions,
+                'total_wait': self.total_wait,
+                'mean_wait': mean_wait,
+                'max_wait': self.max_wait,
+            }
+
+
+def lock_scope(instance):
+    """the scope key of a session, subsession or group,
+    e.g. 'my_app.group-15'
+
+    """
+    return '{}.{}-{}'.format(
+        instance._meta.app_label, instance._meta.model_name, instance.pk)
+
+
+def _session_pk(instance):
+    if instance._meta.model_name == 'session':
+        return instance.pk
+    return instance.session_id
+
+
+def scoped_lock(instance):
+    """serialize a code path for one session, subsession or group,
+    so that requests in other sessions/groups don't have to wait.
+    use the narrowest scope that contains all the data that is
+    read and then written inside the block.
+
+    """
+    return get_lock_backend().scoped_lock(
+        lock_scope(instance), session_pk=_session_pk(instance))
+
+
+def create_lock_scopes(instances):
+    """create the ScopedLockModel rows of a new session and its
+    subsessions, so that taking their lock doesn't have to.
+    they are deleted with the session.
+
+    """
+    ScopedLockModel.objects.bulk_create([
+        ScopedLockModel(
+            scope=lock_scope(instance), session_pk=_session_pk(instance))
+        for instance in instances])
+
+
+def _create_lock_scope(scope, session_pk):
+    # another request may be creating it at the same time
+    try:
+        with transaction.atomic():
+            ScopedLockModel.objects.create(
+                scope=scope, session_pk=session_pk)
+    except IntegrityError:
+        pass
+
+
+def scoped_lock_stuck(scope):
+    return Exception('Request for lock on {} is stuck'.format(scope))
+
+
+class BaseLockBackend(object):
+    """Subclasses implement ``_acquire_participant`` and ``_acquire_scope``,
+    context managers that block until the lock is held and release it
+    on exit.
+
+    """
+
+    def __init__(self):
+        self.stats = {
+            'participant': LockStats(),
+            'scoped': LockStats(),
+        }
+
+    @contextlib.contextmanager
+    def participant_lock(self, participant_code):
+        """yields the number of seconds spent waiting for the lock"""
+        start_time = time.time()
+        with self._acquire_participant(participant_code):
+            wait = time.time() - start_time
+            self.stats['participant'].record(wait)
+            yield wait
+
+    @contextlib.contextmanager
+    def scoped_lock(self, scope, session_pk=None):
+        """yields the number of seconds spent waiting for the lock.
+        session_pk: the session the scope belongs to, if any"""
+        start_time = time.time()
+        with self._acquire_scope(scope, session_pk):
+            wait = time.time() - start_time
+            self.stats['scoped'].record(wait)
+            yield wait
+
+    def _acquire_participant(self, participant_code):
+        raise NotImplementedError()
+
+    def _acquire_scope(self, scope, session_pk=None):
+        raise NotImplementedError()
+
+
+class TableLockBackend(BaseLockBackend):
+    """the original implementation: poll an UPDATE on the lock row
+    until it succeeds.
+
+    """
+
+    recheck_interval = 0.2
+    scope_recheck_interval = 0.1
+
+    @contextlib.contextmanager
+    def _acquire_participant(self, participant_code):
+        start_time = time.time()
+        checked_exists = False
+        while time.time() - start_time < LOCK_TIMEOUT:
+            updated_locks = ParticipantLockModel.objects.filter(
+                participant_code=participant_code,
+                locked=False
+            ).update(locked=True)
+            if updated_locks:
+                break
+            # fail fast rather than waiting for the timeout
+            # if there is nothing to lock
+            if not checked_exists:
+                exists = ParticipantLockModel.objects.filter(
+                    participant_code=participant_code
+                ).exists()
+                if not exists:
+                    raise participant_not_found(participant_code)
+                checked_exists = True
+            time.sleep(self.recheck_interval)
+        else:
+            raise participant_lock_stuck(participant_code)
+        try:
+            yield
+        finally:
+            ParticipantLockModel.objects.filter(
+                participant_code=participant_code,
+            ).update(locked=False)
+
+    @contextlib.contextmanager
+    def _acquire_scope(self, scope, session_pk=None):
+        start_time = time.time()
+        checked_exists = False
+        while time.time() - start_time < LOCK_TIMEOUT:
+            updated_locks = ScopedLockModel.objects.filter(
+                scope=scope,
+                locked=False
+            ).update(locked=True)
+            if updated_locks:
+                break
+            # the rows of sessions and subsessions are created with the
+            # session. other scopes get theirs the first time
+            if not checked_exists:
+                checked_exists = True
+                if not ScopedLockModel.objects.filter(scope=scope).exists():
+                    _create_lock_scope(scope, session_pk)
+                    continue
+            time.sleep(self.scope_recheck_interval)
+        else:
+            raise scoped_lock_stuck(scope)
+        try:
+            yield
+        finally:
+            ScopedLockModel.objects.filter(scope=scope).update(locked=False)
+
+
+@contextlib.contextmanager
+def database_lock_timeout():
+    """make the database give up waiting for a row lock after
+    LOCK_TIMEOUT, raising OperationalError, rather than wait forever.
+    must be used inside a transaction.
+
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # LOCAL: only until the end of the transaction
+            cursor.execute(
+                "SET LOCAL lock_timeout = '{}s'".format(LOCK_TIMEOUT))
+            try:
+                yield
+            finally:
+                cursor.execute('SET LOCAL lock_timeout TO DEFAULT')
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SET SESSION innodb_lock_wait_timeout = {}'.format(
+                    LOCK_TIMEOUT))
+            try:
+                yield
+            finally:
+                cursor.execute(
+                    'SET SESSION innodb_lock_wait_timeout = DEFAULT')
+        else:
+            yield
+
+
+class SelectForUpdateLockBackend(BaseLockBackend):
+    """blocks in the database on a row lock of the participant
+    (or of the scope's ScopedLockModel), for at most LOCK_TIMEOUT.
+    Row locks are held until the end of the transaction,
+    so the whole locked block runs in a transaction.
+
+    """
+
+    @contextlib.contextmanager
+    def _acquire_participant(self, participant_code):
+        with transaction.atomic():
+            try:
+                with database_lock_timeout():
+                    # values_list, so that the locked row doesn't end up
+                    # in the idmap cache
+                    locked_pks = list(
+                        Participant.objects.select_for_update().filter(
+                            code=participant_code
+                        ).values_list('pk', flat=True))
+            except OperationalError:
+                raise participant_lock_stuck(participant_code)
+            if not locked_pks:
+                raise participant_not_found(participant_code)
+            yield
+
+    @contextlib.contextmanager
+    def _acquire_scope(self, scope, session_pk=None):
+        # if we are already inside a transaction (e.g. the participant
+        # lock), the row stays locked until that transaction commits.
+        with transaction.atomic():
+            if not self._lock_scope_row(scope):
+                # see TableLockBackend._acquire_scope
+                _create_lock_scope(scope, session_pk)
+                self._lock_scope_row(scope)
+            yield
+
+    def _lock_scope_row(self, scope):
+        """returns False if the scope has no row yet"""
+        try:
+            with database_lock_timeout():
+                return bool(list(
+                    ScopedLockModel.objects.select_for_update().filter(
+                        scope=scope).values_list('pk', flat=True)))
+        except OperationalError:
+            raise scoped_lock_stuck(scope)
+
+
+def advisory_lock_key(*parts):
+    """map a string key to the signed 64 bit int that pg_advisory_lock
+    expects
+
+    """
+    key = ':'.join(str(part) for part in parts).encode('utf-8')
+    return struct.unpack('>q', hashlib.md5(key).digest()[:8])[0]
+
+
+class AdvisoryLockBackend(BaseLockBackend):
+    """Postgres session-level advisory locks. Postgres releases them
+    if the connection is closed, so a crashed request can't leave a
+    participant locked.
+
+    """
+
+    def __init__(self):
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured(
+                'LOCK_BACKEND "advisory" requires Postgres, '
+                'but the database is {}.'.format(connection.vendor))
+        super(AdvisoryLockBackend, self).__init__()
+
+    recheck_interval = 0.05
+
+    @contextlib.contextmanager
+    def _advisory_lock(self, key, stuck_exception):
+        # pg_advisory_lock would wait forever, so poll until LOCK_TIMEOUT
+        deadline = time.time() + LOCK_TIMEOUT
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+                if cursor.fetchone()[0]:
+                    break
+                if time.time() >= deadline:
+                    raise stuck_exception
+                time.sleep(self.recheck_interval)
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+
+    def _acquire_participant(self, participant_code):
+        return self._advisory_lock(
+            advisory_lock_key('participant', participant_code),
+            participant_lock_stuck(participant_code))
+
+    def _acquire_scope(self, scope, session_pk=None):
+        return self._advisory_lock(
+            advisory_lock_key('scope', scope), scoped_lock_stuck(scope))
+
+
+class InProcessLockBackend(BaseLockBackend):
+    """keeps the set of locked keys in memory. Waiting requests sleep on a
+    condition variable until the lock is released.
+
+    """
+
+    def __init__(self):
+        super(InProcessLockBackend, self).__init__()
+        self._condition = threading.Condition()
+        self._locked = set()
+
+    @contextlib.contextmanager
+    def _lock_key(self, key, stuck_exception):
+        deadline = time.time() + LOCK_TIMEOUT
+        with self._condition:
+            while key in self._locked:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise stuck_exception
+                self._condition.wait(remaining)
+            self._locked.add(key)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._locked.discard(key)
+                self._condition.notify_all()
+
+    def _acquire_participant(self, participant_code):
+        return self._lock_key(
+            ('participant', participant_code),
+            participant_lock_stuck(participant_code))
+
+    def _acquire_scope(self, scope, session_pk=None):
+        return self._lock_key(('scope', scope), scoped_lock_stuck(scope))
+
+
+LOCK_BACKENDS = {
+    'table': TableLockBackend,
+    'select_for_update': SelectForUpdateLockBackend,
+    'advisory': AdvisoryLockBackend,
+    'inprocess': InProcessLockBackend,
+}
+
+# one instance per backend and process, so that in-process locks and
+# stats are shared by all threads
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_lock_backend(name=None):
+    if name is None:
+        name = settings.LOCK_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name in LOCK_BACKENDS:
+                BackendClass = LOCK_BACKENDS[name]
+            else:
+                try:
+                    BackendClass = import_string(name)
+                except ImportError:
+                    raise ImproperlyConfigured(
+                        'Unknown LOCK_BACKEND "{}". Choices are: {}'.format(
+                            name, ', '.join(sorted(LOCK_BACKENDS))))
+            _backends[name] = BackendClass()
+        return _backends[name]
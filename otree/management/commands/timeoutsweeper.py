@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from otree.timeout.sweeper import sweep_expired_timeouts
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "oTree: Submit the pages whose timeout expired, for all sessions. "
+        "Runs until stopped, unless --once is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', action='store', type=float, dest='interval',
+            default=1, help='Seconds between sweeps (default: 1)')
+        parser.add_argument(
+            '--once', action='store_true', dest='once', default=False,
+            help='Sweep once, then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                num_advanced = sweep_expired_timeouts()
+            except Exception:
+                # e.g. the database is unavailable for a moment.
+                # the sweeper keeps running
+                logger.exception('Sweeping expired timeouts failed')
+            else:
+                if num_advanced and options['verbosity'] > 1:
+                    self.stdout.write(
+                        'Advanced {} participants'.format(num_advanced))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
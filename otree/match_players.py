@@ -16,6 +16,8 @@ import random
 
 from six.moves import map
 
+from otree.models_concrete import PairHistory
+
 
 # =============================================================================
 # CONSTANTS
@@ -78,7 +80,7 @@ def players_x_groups(subssn):
     """Conver a subssn in a tuple of list of players
 
     """
-    return tuple(g.get_players() for g in subssn.get_groups())
+    return tuple(subssn.get_group_matrix())
 
 
 # =============================================================================
@@ -101,82 +103,145 @@ def players_random(subssn):
     return tuple(groups)
 
 
-@match_func("perfect_strangers", "round_robin")
-def round_robin(subssn):
-    """Try to generate every group of players with a lesser probabilty to mix
-    the same players twice.
+def pair_history(subssn):
+    """How many times each pair of participants was in the same group,
+    in the previous rounds of this app.
 
-    **Warning:** This is slow, really slow. Seriously, it is very slow.
+    Returns ``{participant_id: {other_participant_id: count}}``, with both
+    directions of each pair. Read from the session's PairHistory, which
+    only counts the rounds played since the last matcher asked for it,
+    rather than scanning all previous rounds every time. To look up a
+    single pair, use ``PairHistory.for_subsession(subssn).count(a, b)``.
 
     """
+    return PairHistory.for_subsession(subssn).counts()
 
-    def pxg2id(players):
-        participant_ids = [player.participant_id for player in players]
-        participant_ids.sort()
-        pxg_id = "|".join(map(str, participant_ids))
-        return pxg_id
-
-    def usage_counts(subssn):
-        counts = {}
-        for p_subssn in subssn.in_previous_rounds():
-            for players in players_x_groups(p_subssn):
-                size = len(players)
-                if size not in counts:
-                    counts[size] = collections.defaultdict(int)
-                pxg_id = pxg2id(players)
-                counts[size][pxg_id] += 1
-        return counts
-
-    def combinations_by_sizes(groups, players, counts):
-        sizes, combinations = [], {}
-        for group in groups:
-            size = len(group)
-            sizes.append(size)
-            if size not in combinations:
-                combs = []
-                for players in itertools.combinations(players, size):
-                    pxg_id = pxg2id(players)
-                    count = counts[size][pxg_id]
-                    combs.append((count, players))
-                combs.sort(key=lambda e: e[0])
-                combinations[size] = [comb[1] for comb in combs]
-        return tuple(sizes), combinations
-
-    def shuffle_sizes(sizes):
-        ssizes = list(sizes)
-        random.shuffle(ssizes)
-        return ssizes
-
-    def create_groups(sizes, combinations):
-        groups = []
-        used_participants = set()
-        for size in sizes:
-            comb, end, candidate = combinations[size], False, None
-            while comb and not end:
-                candidate = comb.pop(0)
-                participant_ids = [p.participant_id for p in candidate]
-                if not used_participants.intersection(participant_ids):
-                    used_participants.update(participant_ids)
-                    end = True
-            groups.append(candidate)
-        return groups
-
-    def sort_by_sizes(groups, sizes):
-        by_sizes = collections.defaultdict(list)
-        for group in groups:
-            by_sizes[len(group)].append(group)
-        sorted_groups = [by_sizes[size].pop() for size in sizes]
-        return sorted_groups
 
-    groups = players_x_groups(subssn)
-    players = tuple(itertools.chain.from_iterable(groups))
+def count_repeats(groups, counts):
+    """number of pairs in the groups (lists of participant ids)
+    that were already in the same group before"""
+    return sum(
+        1 for group in groups
+        for a, b in itertools.combinations(group, 2)
+        if counts.get(a, {}).get(b))
 
-    counts = usage_counts(subssn)
-    sizes, combinations = combinations_by_sizes(groups, players, counts)
-    ssizes = shuffle_sizes(sizes)
-    shuffled_groups = create_groups(ssizes, combinations)
-    groups = sort_by_sizes(shuffled_groups, sizes)
-    return tuple(groups)
+
+def is_prime(n):
+    return n > 1 and all(n % d for d in range(2, int(n ** 0.5) + 1))
+
+
+def strangers_grid(first_round_groups, round_number):
+    """Perfect strangers by construction, if there are m groups of k
+    players, m is prime, k <= m and round_number <= m.
+
+    Put the first round's groups as columns of a grid, with the
+    players' positions in their group as rows. In round r, the player
+    in row i and column j goes to group (j + i * (r - 1)) mod m.
+    Players in the same row are never grouped, and since m is prime,
+    two players in different rows are grouped in at most one of the
+    first m rounds.
+
+    Returns the groups as lists of participant ids, or None if the
+    conditions don't hold.
+
+    """
+    num_groups = len(first_round_groups)
+    sizes = set(len(group) for group in first_round_groups)
+    if len(sizes) != 1:
+        return None
+    size = sizes.pop()
+    if (not is_prime(num_groups) or size > num_groups or
+            round_number > num_groups):
+        return None
+    groups = [[] for _ in range(num_groups)]
+    for column, group in enumerate(first_round_groups):
+        for row, participant_id in enumerate(group):
+            groups[(column + row * (round_number - 1)) % num_groups].append(
+                participant_id)
+    return groups
+
+
+def greedy_strangers(participant_ids, sizes, counts):
+    """Fill one group after another, each time adding the remaining
+    participant who was grouped least often with the group's members.
+
+    Every added member scans the remaining participants, so it runs in
+    O(n^2) for n participants (plus the size of counts),
+    instead of enumerating all combinations of players.
+    participant_ids should be shuffled, to break ties randomly.
+
+    """
+    remaining = list(participant_ids)
+    groups = []
+    for size in sizes:
+        member = remaining.pop(0)
+        group = [member]
+        # times each participant was grouped with the group's members
+        scores = collections.Counter(counts.get(member, {}))
+        while len(group) < size:
+            best_index, best_score = 0, None
+            for index, candidate in enumerate(remaining):
+                score = scores[candidate]
+                if best_score is None or score < best_score:
+                    best_index, best_score = index, score
+                    if score == 0:
+                        break
+            member = remaining.pop(best_index)
+            group.append(member)
+            scores.update(counts.get(member, {}))
+        groups.append(group)
+    return groups
+
+
+@match_func("perfect_strangers", "round_robin")
+def round_robin(subssn):
+    """Group every player with players they were grouped with as rarely
+    as possible in the previous rounds.
+
+    If the groups allow it (see ``strangers_grid``), nobody meets twice.
+    Otherwise the groups are formed greedily (see ``greedy_strangers``).
+
+    """
+    groups = subssn.get_groups()
+    players = subssn.get_players()
+    players_by_participant = {p.participant_id: p for p in players}
+    group_sizes = collections.Counter(p.group_id for p in players)
+    sizes = [group_sizes[group.pk] for group in groups]
+
+    counts = pair_history(subssn)
+
+    PlayerClass = subssn.player_set.model
+    first_round_players = PlayerClass.objects.filter(
+        session=subssn.session, round_number=1,
+    ).order_by(
+        'group__id_in_subsession', 'id_in_group'
+    ).values_list('group__id_in_subsession', 'participant_id')
+    first_round_groups = collections.OrderedDict()
+    for id_in_subsession, participant_id in first_round_players:
+        first_round_groups.setdefault(id_in_subsession, []).append(
+            participant_id)
+
+    matrix = strangers_grid(
+        list(first_round_groups.values()), subssn.round_number)
+    grid_fits = (
+        matrix is not None and
+        sorted(map(len, matrix)) == sorted(sizes) and
+        set(itertools.chain.from_iterable(matrix)) ==
+        set(players_by_participant))
+    if not grid_fits or count_repeats(matrix, counts):
+        participant_ids = list(players_by_participant)
+        random.shuffle(participant_ids)
+        shuffled_sizes = list(sizes)
+        random.shuffle(shuffled_sizes)
+        matrix = greedy_strangers(participant_ids, shuffled_sizes, counts)
+
+    # in the order of the current groups' sizes
+    by_size = collections.defaultdict(list)
+    for group in matrix:
+        by_size[len(group)].append(group)
+    return tuple(
+        [players_by_participant[pid] for pid in by_size[size].pop()]
+        for size in sizes)
 
 
 @match_func("partners")
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0003_auto_20160531_1446'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScopedLockModel',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, verbose_name='ID', auto_created=True)),
+                ('scope', otree.db.models.CharField(max_length=255, null=True, unique=True, db_index=True)),
+                ('locked', otree.db.models.BooleanField(choices=[(True, 'Yes'), (False, 'No')], default=False)),
+            ],
+        ),
+    ]
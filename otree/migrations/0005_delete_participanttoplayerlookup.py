@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0004_scopedlockmodel'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='participanttoplayerlookup',
+            index_together=set([]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='participanttoplayerlookup',
+            unique_together=set([]),
+        ),
+        migrations.DeleteModel(
+            name='ParticipantToPlayerLookup',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0005_delete_participanttoplayerlookup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitPageArrival',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, verbose_name='ID', auto_created=True)),
+                ('participant_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('page_index', otree.db.models.PositiveIntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WaitPageArrivalCounter',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, verbose_name='ID', auto_created=True)),
+                ('page_index', otree.db.models.PositiveIntegerField(null=True)),
+                ('session_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('model_name', otree.db.models.CharField(max_length=10, null=True)),
+                ('model_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('arrivals', otree.db.models.PositiveIntegerField(default=0, null=True)),
+                ('total', otree.db.models.PositiveIntegerField(null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='waitpagearrival',
+            unique_together=set([('participant_pk', 'page_index')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='waitpagearrival',
+            index_together=set([('participant_pk', 'page_index')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='waitpagearrivalcounter',
+            unique_together=set([('page_index', 'session_pk', 'model_name', 'model_pk')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='waitpagearrivalcounter',
+            index_together=set([('page_index', 'session_pk', 'model_name', 'model_pk')]),
+        ),
+    ]
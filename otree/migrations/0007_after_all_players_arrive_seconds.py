@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0006_waitpagearrival'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedgroupwaitpage',
+            name='after_all_players_arrive_seconds',
+            field=otree.db.models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='completedsubsessionwaitpage',
+            name='after_all_players_arrive_seconds',
+            field=otree.db.models.FloatField(null=True),
+        ),
+    ]
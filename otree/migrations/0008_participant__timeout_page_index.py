@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0007_after_all_players_arrive_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='_timeout_page_index',
+            field=otree.db.models.PositiveIntegerField(null=True),
+        ),
+    ]
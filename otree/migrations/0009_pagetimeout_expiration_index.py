@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0008_participant__timeout_page_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='pagetimeout',
+            index_together=set([
+                ('participant_pk', 'page_index'),
+                ('expiration_time', 'participant_pk', 'page_index'),
+            ]),
+        ),
+    ]
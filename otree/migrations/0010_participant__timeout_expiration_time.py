@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import otree.db.models
+
+
+def copy_page_timeouts(apps, schema_editor):
+    """keep the timeouts of the pages participants are on now.
+    their timers are enforced by the timeout sweeper."""
+    PageTimeout = apps.get_model('otree', 'PageTimeout')
+    Participant = apps.get_model('otree', 'Participant')
+    page_indexes = dict(
+        Participant.objects.filter(
+            pk__in=PageTimeout.objects.values('participant_pk')
+        ).values_list('pk', '_index_in_pages'))
+    for timeout in PageTimeout.objects.all():
+        if page_indexes.get(timeout.participant_pk) == timeout.page_index:
+            Participant.objects.filter(pk=timeout.participant_pk).update(
+                _timeout_page_index=timeout.page_index,
+                _timeout_expiration_time=timeout.expiration_time)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0009_pagetimeout_expiration_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='_timeout_expiration_time',
+            field=otree.db.models.PositiveIntegerField(
+                null=True, db_index=True),
+        ),
+        migrations.RunPython(
+            copy_page_timeouts, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='PageTimeout',
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0010_participant__timeout_expiration_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairHistory',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('session_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('app_name', otree.db.models.CharField(max_length=300, null=True)),
+                ('through_round', otree.db.models.PositiveIntegerField(default=0, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PairCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('participant_a', otree.db.models.PositiveIntegerField(null=True)),
+                ('participant_b', otree.db.models.PositiveIntegerField(null=True)),
+                ('count', otree.db.models.PositiveIntegerField(null=True)),
+                ('history', otree.db.models.ForeignKey(to='otree.PairHistory')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pairhistory',
+            unique_together=set([('session_pk', 'app_name')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paircount',
+            unique_together=set([('history', 'participant_a', 'participant_b')]),
+        ),
+    ]
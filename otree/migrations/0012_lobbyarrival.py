@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import otree.db.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0011_pairhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LobbyArrival',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('session_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('page_index', otree.db.models.PositiveIntegerField(null=True)),
+                ('participant_pk', otree.db.models.PositiveIntegerField(null=True)),
+                ('group_pk', otree.db.models.PositiveIntegerField(null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='lobbyarrival',
+            unique_together=set([('participant_pk', 'page_index')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='lobbyarrival',
+            index_together=set([('session_pk', 'page_index', 'group_pk')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import otree.db.models
+
+
+def delete_unlocked_scopes(apps, schema_editor):
+    """rows created without a session_pk would never be deleted.
+    the ones that are used again are created again, with their
+    session_pk."""
+    ScopedLockModel = apps.get_model('otree', 'ScopedLockModel')
+    ScopedLockModel.objects.filter(locked=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otree', '0012_lobbyarrival'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scopedlockmodel',
+            name='session_pk',
+            field=otree.db.models.PositiveIntegerField(
+                null=True, db_index=True),
+        ),
+        migrations.RunPython(
+            delete_unlocked_scopes, migrations.RunPython.noop),
+    ]
@@ -4,9 +4,36 @@
 from otree_save_the_change.mixins import SaveTheChange
 
 from otree.db import models
+from otree.db.bulk import bulk_update, forget_changes
 from otree.common_internal import get_models_module
 
 
+def set_players_of_groups(groups_and_players):
+    """
+    put the players in the groups, with a few UPDATEs for all players.
+    groups_and_players: [(group, players_list), ...]
+    """
+    group_pks = {}
+    ids_in_group = {}
+    for group, players_list in groups_and_players:
+        for i, player in enumerate(players_list, start=1):
+            group_pks[player.pk] = group.pk
+            ids_in_group[player.pk] = i
+            PlayerClass = type(player)
+    if not group_pks:
+        return
+    bulk_update(
+        PlayerClass.objects.all(),
+        {'group': group_pks, 'id_in_group': ids_in_group})
+    for group, players_list in groups_and_players:
+        for i, player in enumerate(players_list, start=1):
+            player.group = group
+            player.id_in_group = i
+            forget_changes(player, ['group', 'id_in_group'])
+        # so that get_players doesn't return stale cache
+        group._players = players_list
+
+
 class BaseGroup(SaveTheChange, models.Model):
     """Base class for all Groups.
     """
@@ -41,12 +68,7 @@ class BaseGroup(SaveTheChange, models.Model):
         raise ValueError('No player with role {}'.format(role))
 
     def set_players(self, players_list):
-        for i, player in enumerate(players_list, start=1):
-            player.group = self
-            player.id_in_group = i
-            player.save()
-        # so that get_players doesn't return stale cache
-        self._players = players_list
+        set_players_of_groups([(self, players_list)])
 
     def in_round(self, round_number):
         '''You should not use this method if
@@ -1,15 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import django.test
+import time
+
+import django.utils.timezone
+from django.db import connection
 
 from otree import constants_internal
 import otree.common_internal
 from otree.common_internal import id_label_name, random_chars_8
 from otree.common import Currency as c
 from otree.db import models
-from otree.models_concrete import ParticipantToPlayerLookup
 from otree.models.session import Session
+from otree.page_map import get_page_map
 from otree.models.varsmixin import ModelWithVars
 
 
@@ -109,26 +112,106 @@ class Participant(ModelWithVars):
 
     _is_auto_playing = models.BooleanField(default=False)
 
+    # the page whose submit_expired_page task is pending,
+    # and when it's due. see otree/timeout/timers.py
+    _timeout_page_index = models.PositiveIntegerField(null=True)
+    _timeout_expiration_time = models.PositiveIntegerField(
+        null=True, db_index=True)
+
     def _start_auto_play(self):
+        from otree.advance import advance_participant
         self._is_auto_playing = True
         self.save()
 
-        client = django.test.Client()
-
+        # once started, each page schedules its own submission,
+        # see FormPageMixin._visit
         if not self.visited:
-            client.get(self._start_url(), follow=True)
+            advance_participant(self)
+
+    def _initialize(self, label=None, ip_address=None):
+        """the participant opened their start URL for the first time"""
+        self._index_in_pages = 1
+        self.visited = True
+
+        # participant.label might already have been set
+        self.label = self.label or label
+        self.ip_address = ip_address
+
+        self.time_started = django.utils.timezone.now()
+        self._last_page_timestamp = time.time()
+
+    @classmethod
+    def _claim_unvisited(cls, session):
+        """Mark the next unvisited participant of the session
+        (by start_order) as visited, and return it.
+        Returns None if no unvisited participants are left.
+
+        Concurrent callers never get the same participant,
+        and they don't need to take a lock:
+        on Postgres the claim is a single UPDATE whose subselect
+        skips rows other requests are claiming (SKIP LOCKED).
+        On other databases each candidate is claimed with a conditional
+        UPDATE, and a request that loses the race moves on to the next
+        candidate.
+        """
+        if (connection.vendor == 'postgresql' and
+                connection.pg_version >= 90500):
+            pk = cls._claim_unvisited_skip_locked(session)
+        else:
+            pk = cls._claim_unvisited_compare_and_set(session)
+        if pk is None:
+            return None
+        return cls.objects.get(pk=pk)
+
+    @classmethod
+    def _claim_unvisited_skip_locked(cls, session):
+        qn = connection.ops.quote_name
+        sql = (
+            'UPDATE {table} SET {visited} = %s WHERE {pk} = ('
+            'SELECT {pk} FROM {table} '
+            'WHERE {session} = %s AND {visited} = %s '
+            'ORDER BY {start_order} LIMIT 1 FOR UPDATE SKIP LOCKED'
+            ') RETURNING {pk}'
+        ).format(
+            table=qn(cls._meta.db_table),
+            pk=qn(cls._meta.pk.column),
+            visited=qn(cls._meta.get_field('visited').column),
+            session=qn(cls._meta.get_field('session').column),
+            start_order=qn(cls._meta.get_field('start_order').column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [True, session.pk, False])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def _claim_unvisited_compare_and_set(cls, session, batch_size=20):
+        while True:
+            candidate_pks = list(
+                cls.objects.filter(
+                    session=session, visited=False
+                ).order_by('start_order').values_list(
+                    'pk', flat=True
+                )[:batch_size])
+            if not candidate_pks:
+                return None
+            for pk in candidate_pks:
+                claimed = cls.objects.filter(
+                    pk=pk, visited=False
+                ).update(visited=True)
+                if claimed:
+                    return pk
 
     def _stop_auto_play(self):
         self._is_auto_playing = False
         self.save()
 
-    def player_lookup(self):
-        # this is the most reliable way to get the app name,
-        # because of WaitUntilAssigned...
-        # 2016-04-07: WaitUntilAssigned removed
-        return ParticipantToPlayerLookup.objects.get(
-            participant_pk=self.pk,
-            page_index=self._index_in_pages)
+    def _page_map(self):
+        return get_page_map(self.session.config['app_sequence'])
+
+    def _current_page_location(self):
+        """the app, round number and page class of the current page"""
+        return self._page_map().locate(self._index_in_pages)
 
     def _current_page(self):
         return '{}/{} pages'.format(self._index_in_pages, self._max_page_index)
@@ -157,7 +240,7 @@ class Participant(ModelWithVars):
 
     def _url_i_should_be_on(self):
         if self._index_in_pages <= self._max_page_index:
-            return self.player_lookup().url
+            return self._page_map().url(self, self._index_in_pages)
         else:
             if self.session.mturk_HITId:
                 assignment_id = self.mturk_assignment_id
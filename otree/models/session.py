@@ -3,25 +3,22 @@
 
 import logging
 
-import django.test
-
 from otree import constants_internal
 import otree.common_internal
 from otree.common_internal import random_chars_8, random_chars_10
 from otree.db import models
 from .varsmixin import ModelWithVars
-from otree.models_concrete import ParticipantToPlayerLookup
-from otree.models_concrete import RoomSession
+from otree.models_concrete import PairHistory, RoomSession, ScopedLockModel
+import otree.readiness
 
 
 logger = logging.getLogger('otree')
 
-client = django.test.Client()
-
 
 class GlobalSingleton(models.Model):
     """object that can hold site-wide settings. There should only be one
-    GlobalSingleton object. Also used for wait page actions.
+    GlobalSingleton object. Locking is done with ScopedLockModel
+    (see otree.locks).
     """
 
     class Meta:
@@ -151,6 +148,10 @@ class Session(ModelWithVars):
         return lst
 
     def delete(self, using=None):
+        otree.readiness.invalidate_session(self.pk)
+        # keyed by session_pk, which could be reused
+        PairHistory.objects.filter(session_pk=self.pk).delete()
+        ScopedLockModel.objects.filter(session_pk=self.pk).delete()
         for subsession in self.get_subsessions():
             subsession.delete()
         super(Session, self).delete(using)
@@ -159,7 +160,8 @@ class Session(ModelWithVars):
         return self.participant_set.all()
 
     def _create_groups_and_initialize(self):
-        # group_by_arrival_time code used to be here
+        # players are grouped here, and regrouped by arrival time
+        # on group_by_arrival_time wait pages (see otree/lobby.py)
         for subsession in self.get_subsessions():
             subsession._create_groups()
             subsession._initialize()
@@ -188,21 +190,15 @@ class Session(ModelWithVars):
         return worker_url
 
     def advance_last_place_participants(self):
+        from otree.advance import advance_participants
         participants = self.get_participants()
 
         # in case some participants haven't started
-        unvisited_participants = []
-        for p in participants:
-            if not p._current_form_page_url:
-                unvisited_participants.append(p)
-                client.get(p._start_url(), follow=True)
-
+        unvisited_participants = [
+            p for p in participants if not p._current_form_page_url]
         if unvisited_participants:
-            from otree.models import Participant
-            for p in unvisited_participants:
-                p.save()
-                Participant.flush_cached_instance(p)
-            # that's it -- just visit the start URL, advancing by 1
+            # that's it -- just start them, advancing by 1
+            advance_participants(unvisited_participants)
             return
 
         last_place_page_index = min([p._index_in_pages for p in participants])
@@ -211,52 +207,14 @@ class Session(ModelWithVars):
             if p._index_in_pages == last_place_page_index
         ]
 
-        for p in last_place_participants:
-            # what if first page is wait page?
-            # that shouldn't happen, because then they must be
-            # waiting for some other players who are even further back
-            assert p._current_form_page_url
-            try:
-                resp = client.post(
-                    p._current_form_page_url,
-                    data={constants_internal.auto_submit: True}, follow=True
-                )
-            except:
-                logging.exception("Failed to advance participants.")
-                raise
-
-            assert resp.status_code < 400
-
-    def build_participant_to_player_lookups(self):
-        subsession_app_names = self.config['app_sequence']
-
-        views_modules = {}
-        for app_name in subsession_app_names:
-            views_modules[app_name] = (
-                otree.common_internal.get_views_module(app_name))
-
-        def views_module_for_player(player):
-            return views_modules[player._meta.app_config.name]
-
-        records_to_create = []
-
-        for participant in self.get_participants():
-            page_index = 0
-            for player in participant.get_players():
-                for View in views_module_for_player(player).page_sequence:
-                    page_index += 1
-                    records_to_create.append(ParticipantToPlayerLookup(
-                        participant_pk=participant.pk,
-                        page_index=page_index,
-                        app_name=player._meta.app_config.name,
-                        player_pk=player.pk,
-                        url=View.url(participant, page_index)
-                    ))
-
-            # technically could be stored at the session level
-            participant._max_page_index = page_index
-            participant.save()
-        ParticipantToPlayerLookup.objects.bulk_create(records_to_create)
+        # what if first page is wait page?
+        # that shouldn't happen, because then they must be
+        # waiting for some other players who are even further back
+        try:
+            advance_participants(last_place_participants)
+        except:
+            logging.exception("Failed to advance participants.")
+            raise
 
     def get_room(self):
         from otree.room import ROOM_DICT
@@ -3,14 +3,92 @@
 
 from __future__ import division
 
+import collections
+from decimal import Decimal
+import math
+
 import six
 from six.moves import zip
 
+from django.core.exceptions import ValidationError
+from django.db import models as django_models
 from otree_save_the_change.mixins import SaveTheChange
 from otree.db import models
-from otree.common_internal import (
-    get_models_module, flatten)
+from otree.db.bulk import bulk_save, bulk_update, forget_changes
+from otree.common_internal import get_models_module
+import otree.readiness
 from otree import match_players
+from otree.models.group import set_players_of_groups
+from otree.models_concrete import PairHistory
+
+
+def _import_numpy(feature):
+    # NumPy is optional; only these array APIs need it
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            '{} needs NumPy. Install it with: pip install numpy'.format(
+                feature))
+    return numpy
+
+
+def _is_money_field(field):
+    return isinstance(
+        field, (models.CurrencyField, models.RealWorldCurrencyField))
+
+
+def _values_array(numpy, field, values):
+    """the values of a field, as an array that NumPy can compute with.
+    numbers and currencies are floats (None is nan) unless they are
+    all integers; other fields are left to NumPy."""
+    is_number = isinstance(field, (
+        django_models.DecimalField, django_models.FloatField,
+        django_models.IntegerField)) or _is_money_field(field)
+    if not is_number:
+        return numpy.array(values)
+    if (isinstance(field, django_models.IntegerField) and
+            None not in values):
+        return numpy.array(values, dtype=int)
+    return numpy.array(
+        [numpy.nan if value is None else float(value) for value in values],
+        dtype=float)
+
+
+def _field_value(field, value):
+    """an element of an array (from tolist()), as the field's value.
+    money is rounded to its decimal places, like Currency(value) is.
+    raises ValueError if the field would store another value,
+    e.g. 1.5 in an IntegerField, or if a validator of the field fails.
+    """
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is None:
+        return field.to_python(value)
+    if _is_money_field(field):
+        if isinstance(value, float):
+            # from the shortest repr, so 0.1 is Currency(0.1),
+            # not Currency(0.1000000000000000055511151231257827)
+            value = Decimal(repr(value))
+        python_value = field.MONEY_CLASS(value)
+    else:
+        python_value = field.to_python(value)
+    # to_python truncates floats to ints
+    truncated = (isinstance(field, django_models.IntegerField) and
+                 python_value != value)
+    if (truncated or
+            field.to_python(field.get_prep_value(python_value)) !=
+            python_value):
+        raise ValueError(
+            'set_player_values: {} cannot store {!r}'.format(
+                field.name, value))
+    try:
+        field.run_validators(python_value)
+    except ValidationError as exc:
+        raise ValueError(
+            'set_player_values: {!r} is not valid for {}: {}'.format(
+                value, field.name, '; '.join(exc.messages)))
+    return python_value
 
 
 class BaseSubsession(SaveTheChange, models.Model):
@@ -95,11 +173,12 @@ class BaseSubsession(SaveTheChange, models.Model):
         e.g., if group_by_arrival_time is true, and some players have not
         been assigned to groups yet
         '''
-        players = self.get_players()
-        groups = [g.get_players() for g in self.get_groups()]
-        players_from_groups = flatten(groups)
-
-        assert set(players) == set(players_from_groups)
+        # every player is in a group of this subsession
+        assert not self.player_set.exclude(group__subsession=self).exists()
+        # and the groups have no players from elsewhere
+        PlayerClass = self.player_set.model
+        assert not PlayerClass.objects.filter(
+            group__subsession=self).exclude(subsession=self).exists()
 
     def _set_groups(self, groups, check_integrity=True):
         """elements in the list can be sublists, or group objects.
@@ -108,7 +187,9 @@ class BaseSubsession(SaveTheChange, models.Model):
         that id_in_groups are consistent. Or at least we should validate.
 
 
-        warning: this deletes the groups and any data stored on them
+        warning: a group keeps its data only if it keeps the same players.
+        the other groups are deleted, with any data stored on them,
+        and new ones are created.
         TODO: we should indicate this in docs
         """
 
@@ -121,16 +202,11 @@ class BaseSubsession(SaveTheChange, models.Model):
                 players_list = group
                 matrix.append(players_list)
                 # assume it's an iterable containing the players
-        # Before deleting groups, Need to set the foreignkeys to None
-        for g in matrix:
-            for p in g:
-                p.group = None
-                p.save()
-        self.group_set.all().delete()
-        for i, row in enumerate(matrix, start=1):
-            group = self._create_group()
-            group.set_players(row)
-            group.id_in_subsession = i
+        old_groups = self._participant_groups(
+            player for players in matrix for player in players)
+        groups = self._groups_for_matrix(matrix)
+        set_players_of_groups(list(zip(groups, matrix)))
+        self._regrouped(old_groups, matrix)
 
         if check_integrity:
             self.check_group_integrity()
@@ -138,6 +214,142 @@ class BaseSubsession(SaveTheChange, models.Model):
     def set_groups(self, groups):
         self._set_groups(groups, check_integrity=True)
 
+    def get_group_matrix(self, as_array=False):
+        """the players of each group, ordered by id_in_subsession and
+        id_in_group, in one query. it's what set_groups takes, so
+        ``set_groups(get_group_matrix())`` changes nothing.
+
+        with as_array=True, returns a 2-D NumPy array of participant ids
+        instead, one row per group, which can be shuffled, rolled, etc.
+        and passed to set_group_matrix. all groups must then have the
+        same size.
+
+        """
+        players = self.player_set.filter(
+            group__isnull=False,
+        ).order_by('group__id_in_subsession', 'id_in_group')
+        if as_array:
+            numpy = _import_numpy('get_group_matrix(as_array=True)')
+            players = players.values_list('group_id', 'participant_id')
+        else:
+            players = [(p.group_id, p) for p in players]
+
+        matrix = collections.OrderedDict()
+        for group_id, player in players:
+            matrix.setdefault(group_id, []).append(player)
+        matrix = list(matrix.values())
+
+        if as_array:
+            if len(set(map(len, matrix))) > 1:
+                raise ValueError(
+                    'The groups have different sizes, so they cannot be '
+                    'an array. Use get_group_matrix() instead.')
+            return numpy.array(matrix, dtype=int)
+        return matrix
+
+    def player_values(self, field_name):
+        """the values of a player field, as a NumPy array with an element
+        per player, in the order of get_players() (by pk), which is the
+        order set_player_values expects.
+
+        numbers and currencies are floats, with nan for None,
+        except integers when none is None.
+
+        """
+        numpy = _import_numpy('player_values')
+        field = self.player_set.model._meta.get_field(field_name)
+        return _values_array(numpy, field, [
+            getattr(player, field.attname) for player in self.get_players()])
+
+    def set_player_values(self, field_name, values):
+        """set a player field to an array with an element per player,
+        in the order of player_values, with a bulk UPDATE instead of
+        saving every player. nan sets the field to None. the players
+        from get_players() are updated too.
+
+        for example, the payoffs of a public goods game, in
+        after_all_players_arrive of a subsession-wide wait page::
+
+            contributions = self.subsession.player_values('contribution')
+            group_ids = self.subsession.player_values('group_id')
+            _, group_index = numpy.unique(group_ids, return_inverse=True)
+            totals = numpy.bincount(group_index, weights=contributions)
+            shares = (
+                totals[group_index] * Constants.efficiency_factor /
+                Constants.players_per_group)
+            self.subsession.set_player_values(
+                'payoff', Constants.endowment - contributions + shares)
+
+        """
+        numpy = _import_numpy('set_player_values')
+        field = self.player_set.model._meta.get_field(field_name)
+        values = numpy.asarray(values)
+        players = self.get_players()
+        if values.shape != (len(players),):
+            raise ValueError(
+                'set_player_values needs an array with one value per player '
+                '({}), not one with shape {}'.format(
+                    len(players), values.shape))
+
+        # all values are checked before any player is changed
+        values = [_field_value(field, value) for value in values.tolist()]
+        by_pk = {}
+        for player, value in zip(players, values):
+            setattr(player, field.attname, value)
+            by_pk[player.pk] = value
+        bulk_update(self.player_set.all(), {field.name: by_pk})
+        for player in players:
+            forget_changes(player, [field.name])
+
+    def set_group_matrix(self, matrix):
+        """set the groups from a 2-D array of participant ids, one row
+        per group, like get_group_matrix(as_array=True) returns.
+        every participant in the subsession must be in it exactly once.
+        the groups are written in bulk, like set_groups does.
+
+        """
+        numpy = _import_numpy('set_group_matrix')
+        matrix = numpy.asarray(matrix)
+        if matrix.ndim != 2 or not numpy.issubdtype(
+                matrix.dtype, numpy.integer):
+            raise ValueError(
+                'set_group_matrix needs a 2-D array of participant ids, '
+                'not {!r}'.format(matrix))
+
+        players = {p.participant_id: p for p in self.get_players()}
+        participant_ids = matrix.ravel().tolist()
+        if sorted(participant_ids) != sorted(players):
+            raise ValueError(
+                'set_group_matrix: the array must contain the id of each '
+                'participant in the subsession exactly once')
+        self.set_groups([
+            [players[participant_id] for participant_id in row]
+            for row in matrix.tolist()])
+
+    @staticmethod
+    def _participant_groups(players):
+        """the participant ids of the players, grouped like the players
+        are (as far as these instances know). players without a group
+        are left out"""
+        groups = collections.OrderedDict()
+        for player in players:
+            if player.group_id is not None:
+                groups.setdefault(player.group_id, []).append(
+                    player.participant_id)
+        return list(groups.values())
+
+    def _regrouped(self, old_groups, matrix):
+        """if anyone changed partners, a PairHistory that counted this
+        round is counted again when it's next used,
+        and the cached readiness of the session's groups is dropped.
+        old_groups: see _participant_groups"""
+        new_groups = [[p.participant_id for p in players]
+                      for players in matrix]
+        if (set(frozenset(group) for group in old_groups) !=
+                set(frozenset(group) for group in new_groups)):
+            PairHistory.regrouped(self, self.round_number)
+            otree.readiness.invalidate_groups(self.session_id)
+
     @property
     def _Constants(self):
         return get_models_module(self._meta.app_config.name).Constants
@@ -145,21 +357,46 @@ class BaseSubsession(SaveTheChange, models.Model):
     def _GroupClass(self):
         return models.get_model(self._meta.app_config.label, 'Group')
 
-    def _create_group(self):
-        '''should not be public API, because could leave the players in an
-        inconsistent state,
-
-        where id_in_group is not updated. the only call should be to
-        subsession.create_groups()
-
-        '''
-        GroupClass = self._GroupClass()
-        group = GroupClass(subsession=self, session=self.session,
-                           round_number=self.round_number)
-
-        # need to save it before you assign the player.group ForeignKey
-        group.save()
-        return group
+    def _groups_for_matrix(self, matrix):
+        """the group for each row of players in matrix.
+        a group is only reused for the same players, since the data
+        stored on it is theirs. it then gets the row's id_in_subsession.
+        the other groups are deleted and new ones created.
+        """
+        old_groups = {group.pk: group for group in self.get_groups()}
+        sizes = collections.Counter(
+            player.group_id for players in matrix for player in players)
+        groups = {}
+        for id_in_subsession, players in enumerate(matrix, start=1):
+            group_pk = players[0].group_id if players else None
+            if (group_pk in old_groups and
+                    sizes[group_pk] == len(players) and
+                    all(p.group_id == group_pk for p in players)):
+                group = old_groups.pop(group_pk)
+                group.id_in_subsession = id_in_subsession
+                groups[id_in_subsession] = group
+
+        if old_groups:
+            # Before deleting groups, Need to set the foreignkeys to None
+            self.player_set.filter(
+                group_id__in=list(old_groups)).update(group=None)
+            self.group_set.filter(pk__in=list(old_groups)).delete()
+        missing = [i for i in range(1, len(matrix) + 1) if i not in groups]
+        if missing:
+            GroupClass = self._GroupClass()
+            GroupClass.objects.bulk_create([
+                GroupClass(
+                    subsession=self, session=self.session,
+                    round_number=self.round_number, id_in_subsession=i)
+                for i in missing])
+            # bulk_create doesn't set the pks.
+            # the reused groups' new id_in_subsession isn't saved yet
+            new_groups = self.group_set.filter(
+                id_in_subsession__in=missing,
+            ).exclude(pk__in=[group.pk for group in groups.values()])
+            for group in new_groups:
+                groups[group.id_in_subsession] = group
+        return [groups[i] for i in range(1, len(matrix) + 1)]
 
     def _first_round_group_matrix(self):
         players = list(self.get_players())
@@ -182,19 +419,27 @@ class BaseSubsession(SaveTheChange, models.Model):
             self.group_like_round(1)
 
     def group_like_round(self, round_number):
-        previous_round = self.in_round(round_number)
-        group_matrix = [
-            group.get_players()
-            for group in previous_round.get_groups()
-        ]
-        for i, group_list in enumerate(group_matrix):
-            for j, player in enumerate(group_list):
-                # for every entry (i,j) in the matrix, follow the pointer
-                # to the same person in the next round
-                group_matrix[i][j] = player.in_round(self.round_number)
+        # the groups of that round, as (group, participant) rows
+        # in the order of the group matrix
+        PlayerClass = self.player_set.model
+        rows = PlayerClass.objects.filter(
+            session=self.session,
+            round_number=round_number,
+            group__isnull=False,
+        ).order_by(
+            'group__id_in_subsession', 'id_in_group'
+        ).values_list('group__id_in_subsession', 'participant_id')
+
+        # for every entry (i,j) in the matrix, follow the pointer
+        # to the same person in this round
+        players = {p.participant_id: p for p in self.get_players()}
+        group_matrix = collections.OrderedDict()
+        for id_in_subsession, participant_id in rows:
+            group_matrix.setdefault(id_in_subsession, []).append(
+                players[participant_id])
 
         # save to DB
-        self.set_groups(group_matrix)
+        self.set_groups(list(group_matrix.values()))
 
     def before_session_starts(self):
         '''This gets called at the beginning of every subsession, before the
@@ -211,11 +456,9 @@ class BaseSubsession(SaveTheChange, models.Model):
         self.before_session_starts()
         # needs to be get_players and get_groups instead of
         # self.player_set.all() because that would just send a new query
-        # to the DB
-        for p in self.get_players():
-            p.save()
-        for g in self.get_groups():
-            g.save()
+        # to the DB.
+        # only what before_session_starts changed is written
+        bulk_save(self.get_players() + self.get_groups())
 
         # subsession.save() gets called in the parent method
 
@@ -223,5 +466,9 @@ class BaseSubsession(SaveTheChange, models.Model):
         if self.round_number > 1:
             match_function = match_players.MATCHS[match_name]
             pxg = match_function(self)
-            for group, players in zip(self.get_groups(), pxg):
-                group.set_players(players)
+            old_groups = self._participant_groups(
+                player for players in pxg for player in players)
+            groups = self._groups_for_matrix(pxg)
+            set_players_of_groups(list(zip(groups, pxg)))
+            self._regrouped(old_groups, pxg)
+            bulk_save(groups)
@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
+import itertools
+
+from django.db import transaction
+
 from otree.db import models
+from otree.db.bulk import bulk_update
 
 
 class PageCompletion(models.Model):
@@ -19,16 +25,6 @@ class PageCompletion(models.Model):
     auto_submitted = models.BooleanField()
 
 
-class PageTimeout(models.Model):
-    class Meta:
-        app_label = "otree"
-        index_together = ['participant_pk', 'page_index']
-
-    participant_pk = models.PositiveIntegerField()
-    page_index = models.PositiveIntegerField()
-    expiration_time = models.PositiveIntegerField()
-
-
 class CompletedGroupWaitPage(models.Model):
     class Meta:
         app_label = "otree"
@@ -39,6 +35,8 @@ class CompletedGroupWaitPage(models.Model):
     session_pk = models.PositiveIntegerField()
     group_pk = models.PositiveIntegerField()
     after_all_players_arrive_run = models.BooleanField(default=False)
+    # how long after_all_players_arrive took to execute
+    after_all_players_arrive_seconds = models.FloatField()
 
 
 class CompletedSubsessionWaitPage(models.Model):
@@ -50,19 +48,40 @@ class CompletedSubsessionWaitPage(models.Model):
     page_index = models.PositiveIntegerField()
     session_pk = models.PositiveIntegerField()
     after_all_players_arrive_run = models.BooleanField(default=False)
+    # how long after_all_players_arrive took to execute
+    after_all_players_arrive_seconds = models.FloatField()
 
 
-class ParticipantToPlayerLookup(models.Model):
+class WaitPageArrival(models.Model):
+    """a participant reached (or skipped) the wait page at page_index.
+    unique, so each participant is counted once in WaitPageArrivalCounter
+    """
     class Meta:
         app_label = "otree"
-        index_together = ['participant_pk', 'page_index']
         unique_together = ['participant_pk', 'page_index']
+        index_together = ['participant_pk', 'page_index']
 
     participant_pk = models.PositiveIntegerField()
     page_index = models.PositiveIntegerField()
-    app_name = models.CharField(max_length=300)
-    player_pk = models.PositiveIntegerField()
-    url = models.CharField(max_length=300)
+
+
+class WaitPageArrivalCounter(models.Model):
+    """how many of the players of a group or subsession
+    (model_name is 'group' or 'subsession') arrived on a wait page
+    """
+    class Meta:
+        app_label = "otree"
+        unique_together = [
+            'page_index', 'session_pk', 'model_name', 'model_pk']
+        index_together = [
+            'page_index', 'session_pk', 'model_name', 'model_pk']
+
+    page_index = models.PositiveIntegerField()
+    session_pk = models.PositiveIntegerField()
+    model_name = models.CharField(max_length=10)
+    model_pk = models.PositiveIntegerField()
+    arrivals = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField()
 
 
 class ParticipantLockModel(models.Model):
@@ -76,6 +95,188 @@ class ParticipantLockModel(models.Model):
     locked = models.BooleanField(default=False)
 
 
+class LobbyArrival(models.Model):
+    """a participant who arrived on a group_by_arrival_time wait page,
+    and the group they were put in (None while they wait).
+    the order of the pks is the order of arrival. see otree.lobby
+
+    """
+
+    class Meta:
+        app_label = "otree"
+        unique_together = ['participant_pk', 'page_index']
+        index_together = ['session_pk', 'page_index', 'group_pk']
+
+    session_pk = models.PositiveIntegerField()
+    page_index = models.PositiveIntegerField()
+    participant_pk = models.PositiveIntegerField()
+    group_pk = models.PositiveIntegerField(null=True)
+
+
+class ScopedLockModel(models.Model):
+    """one row per lock scope (session, subsession, group).
+    the rows of a session and its subsessions are created with the
+    session, and all of them are deleted with it. see otree.locks
+
+    """
+
+    class Meta:
+        app_label = "otree"
+
+    scope = models.CharField(max_length=255, db_index=True, unique=True)
+    session_pk = models.PositiveIntegerField(null=True, db_index=True)
+
+    locked = models.BooleanField(default=False)
+
+
+class PairHistory(models.Model):
+    """who was in the same group as whom, in the rounds of one app
+    of a session, for the matching algorithms (see
+    otree.match_players.pair_history).
+
+    only built when a matcher asks for it: the pairs of the rounds
+    before the subsession's are counted from the players' groups,
+    in PairCount rows. the next matcher then only counts the rounds
+    that were played since. if the groups of a counted round are set
+    again, the history is counted again from the start the next time
+    it's used (see regrouped).
+
+    """
+
+    class Meta:
+        app_label = "otree"
+        unique_together = ['session_pk', 'app_name']
+
+    session_pk = models.PositiveIntegerField()
+    app_name = models.CharField(max_length=300)
+
+    # the rounds 1 to through_round are counted
+    through_round = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def for_subsession(cls, subsession):
+        """the history of the rounds before the subsession's"""
+        # locked, so that matchers running at the same time
+        # don't count the same rounds twice
+        with transaction.atomic():
+            queryset = cls.objects.select_for_update()
+            history, created = queryset.get_or_create(
+                session_pk=subsession.session_id,
+                app_name=subsession._meta.app_config.name)
+            history._count_rounds(subsession, subsession.round_number - 1)
+        return history
+
+    @classmethod
+    def regrouped(cls, subsession, round_number):
+        """the groups of round_number (and maybe later rounds) of the
+        subsession's app changed. one query, and nothing to write if
+        the history doesn't count that round."""
+        cls.objects.filter(
+            session_pk=subsession.session_id,
+            app_name=subsession._meta.app_config.name,
+            through_round__gte=round_number,
+        ).update(through_round=0)
+
+    def _count_rounds(self, subsession, through_round):
+        if self.through_round > through_round:
+            # counts rounds that we aren't asked about
+            self.through_round = 0
+        if self.through_round == 0:
+            PairCount.objects.filter(history=self).delete()
+        if self.through_round == through_round:
+            return
+
+        PlayerClass = subsession.player_set.model
+        rows = PlayerClass.objects.filter(
+            session_id=self.session_pk,
+            round_number__gt=self.through_round,
+            round_number__lte=through_round,
+            group__isnull=False,
+        ).values_list('group_id', 'participant_id')
+        groups = collections.defaultdict(list)
+        for group_id, participant_id in rows:
+            groups[group_id].append(participant_id)
+        increments = collections.Counter()
+        for group in groups.values():
+            for a, b in itertools.combinations(sorted(group), 2):
+                increments[a, b] += 1
+        self._add_counts(increments)
+
+        self.through_round = through_round
+        PairHistory.objects.filter(pk=self.pk).update(
+            through_round=through_round)
+
+    def _add_counts(self, increments):
+        """increments: {(smaller id, larger id): count}.
+        only the rows of these pairs are written"""
+        counts = {}
+        first_ids = sorted(set(a for a, b in increments))
+        for start in range(0, len(first_ids), MAX_IDS_PER_QUERY):
+            counts.update(
+                ((a, b), (pk, count))
+                for pk, a, b, count in PairCount.objects.filter(
+                    history=self,
+                    participant_a__in=first_ids[
+                        start:start + MAX_IDS_PER_QUERY],
+                ).values_list(
+                    'pk', 'participant_a', 'participant_b', 'count'))
+
+        new_rows = []
+        new_counts = {}
+        for (a, b), increment in increments.items():
+            if (a, b) in counts:
+                pk, count = counts[a, b]
+                new_counts[pk] = count + increment
+            else:
+                new_rows.append(PairCount(
+                    history=self, participant_a=a, participant_b=b,
+                    count=increment))
+        PairCount.objects.bulk_create(new_rows)
+        if new_counts:
+            bulk_update(PairCount.objects.all(), {'count': new_counts})
+
+    def count(self, a, b):
+        """number of counted rounds in which the participants
+        with ids a and b were in the same group"""
+        a, b = sorted([a, b])
+        count = PairCount.objects.filter(
+            history=self, participant_a=a, participant_b=b,
+        ).values_list('count', flat=True).first()
+        return count or 0
+
+    def counts(self):
+        """{participant_id: {other_participant_id: count}}
+        with both directions of each pair"""
+        counts = collections.defaultdict(collections.Counter)
+        rows = PairCount.objects.filter(history=self).values_list(
+            'participant_a', 'participant_b', 'count')
+        for a, b, count in rows:
+            counts[a][b] = count
+            counts[b][a] = count
+        return counts
+
+
+class PairCount(models.Model):
+    """the number of counted rounds in which 2 participants were in
+    the same group. participant_a is the smaller participant id.
+    see PairHistory.
+
+    """
+
+    class Meta:
+        app_label = "otree"
+        unique_together = ['history', 'participant_a', 'participant_b']
+
+    history = models.ForeignKey(PairHistory)
+    participant_a = models.PositiveIntegerField()
+    participant_b = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+
+
+# participant ids in an IN filter. SQLite allows 999 query parameters
+MAX_IDS_PER_QUERY = 500
+
+
 class StubModel(models.Model):
     """To be used as the model for an empty form, so that form_class can be
     omitted. Consider using SingletonModel for this. Right now, I'm not
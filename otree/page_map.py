@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Where a participant is in the session, derived from ``_index_in_pages``.
+
+Every participant of a session goes through the same pages:
+each app of the app sequence, ``num_rounds`` times, each time through the
+app's ``page_sequence``. So the app, round and page class of a page index
+can be computed from the app sequence alone, without storing a row per
+participant and page.
+
+"""
+
+import collections
+import threading
+
+from otree.common_internal import (
+    get_app_constants, get_views_module, url as page_url)
+
+
+PageLocation = collections.namedtuple(
+    'PageLocation', ['app_name', 'round_number', 'Page'])
+
+
+class PageMap(object):
+
+    def __init__(self, app_sequence):
+        # (app_name, index of the app's first page, page_sequence,
+        # num_rounds), in the order of the app sequence
+        self.apps = []
+        offset = 1
+        for app_name in app_sequence:
+            page_sequence = list(get_views_module(app_name).page_sequence)
+            num_rounds = get_app_constants(app_name).num_rounds
+            self.apps.append((app_name, offset, page_sequence, num_rounds))
+            offset += len(page_sequence) * num_rounds
+        self.max_page_index = offset - 1
+
+    def locate(self, page_index):
+        if not 1 <= page_index <= self.max_page_index:
+            raise IndexError(
+                'Page index {} is out of range (1-{})'.format(
+                    page_index, self.max_page_index))
+        for app_name, offset, page_sequence, num_rounds in self.apps:
+            index_in_app = page_index - offset
+            if index_in_app < len(page_sequence) * num_rounds:
+                round_index, index_in_round = divmod(
+                    index_in_app, len(page_sequence))
+                return PageLocation(
+                    app_name=app_name,
+                    round_number=round_index + 1,
+                    Page=page_sequence[index_in_round])
+
+    def url(self, participant, page_index):
+        Page = self.locate(page_index).Page
+        return page_url(Page, participant, page_index)
+
+
+# app sequences and page sequences don't change while the server runs,
+# so one map per app sequence is built the first time it's needed
+_page_maps = {}
+_page_maps_lock = threading.Lock()
+
+
+def get_page_map(app_sequence):
+    key = tuple(app_sequence)
+    with _page_maps_lock:
+        if key not in _page_maps:
+            _page_maps[key] = PageMap(app_sequence)
+        return _page_maps[key]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Whether a wait page is ready, i.e. all players arrived and
+after_all_players_arrive has run.
+
+Wait page views (on every poll) and websocket consumers (on every
+(re)connect) ask this many times for the same wait page, so the answer is
+cached in the memory of the process. Only positive answers are cached,
+and only once they are committed: once a wait page is ready, it stays
+ready. Entries are removed when their session is deleted, and a
+session's group entries when its players are regrouped, since the pk of
+a deleted session or group could be reused. The oldest entries are
+dropped when the cache is full.
+
+The cache is per process, and invalidation only reaches the process
+that deleted or regrouped. With several processes, this relies on the
+database not reusing the pks of deleted rows (as Postgres sequences
+don't), so that other processes' entries for them are never asked for.
+
+"""
+
+import collections
+import threading
+
+from django.db import connection
+
+from otree.models_concrete import (
+    CompletedGroupWaitPage, CompletedSubsessionWaitPage, LobbyArrival)
+
+
+MAX_CACHED = 10000
+
+_ready = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(session_pk, page_index, model_name, model_pk):
+    return (int(session_pk), int(page_index), model_name, int(model_pk))
+
+
+def mark_ready(session_pk, page_index, model_name, model_pk):
+    """call when after_all_players_arrive_run is set and committed"""
+    key = _key(session_pk, page_index, model_name, model_pk)
+    with _lock:
+        _ready[key] = True
+        while len(_ready) > MAX_CACHED:
+            _ready.popitem(last=False)
+
+
+def is_ready(session_pk, page_index, model_name, model_pk):
+    """model_name is 'group' or 'subsession',
+    or 'lobby' for a group_by_arrival_time wait page,
+    whose model_pk is the participant's pk (see otree.lobby)"""
+    key = _key(session_pk, page_index, model_name, model_pk)
+    with _lock:
+        if key in _ready:
+            return True
+
+    if model_name == 'group':
+        ready = CompletedGroupWaitPage.objects.filter(
+            page_index=page_index,
+            group_pk=model_pk,
+            session_pk=session_pk,
+            after_all_players_arrive_run=True).exists()
+    elif model_name == 'lobby':
+        # ready once the participant is in a group
+        ready = LobbyArrival.objects.filter(
+            page_index=page_index,
+            participant_pk=model_pk,
+            session_pk=session_pk,
+            group_pk__isnull=False).exists()
+    else:  # subsession
+        ready = CompletedSubsessionWaitPage.objects.filter(
+            page_index=page_index,
+            session_pk=session_pk,
+            after_all_players_arrive_run=True).exists()
+    # inside a transaction, the answer might be rolled back
+    if ready and not connection.in_atomic_block:
+        mark_ready(session_pk, page_index, model_name, model_pk)
+    return ready
+
+
+def _invalidate(matches):
+    with _lock:
+        for key in [key for key in _ready if matches(key)]:
+            del _ready[key]
+
+
+def invalidate_session(session_pk):
+    session_pk = int(session_pk)
+    _invalidate(lambda key: key[0] == session_pk)
+
+
+def invalidate_groups(session_pk):
+    """call when the session's players are regrouped"""
+    session_pk = int(session_pk)
+    _invalidate(lambda key: key[0] == session_pk and key[2] == 'group')
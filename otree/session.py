@@ -27,6 +27,8 @@ from otree.common import RealWorldCurrency
 from decimal import Decimal
 from otree import deprecate
 from otree.models_concrete import ParticipantLockModel
+from otree.locks import create_lock_scopes
+from otree.page_map import get_page_map
 
 
 def gcd(a, b):
@@ -199,14 +201,19 @@ def create_session(session_config_name, label='', num_participants=None,
     if session_config.get('random_start_order'):
         random.shuffle(start_order)
 
+    page_map = get_page_map(session_config['app_sequence'])
+
     participants = bulk_create(
         Participant,
-        [{'id_in_session': i + 1, 'start_order': j}
+        [{'id_in_session': i + 1, 'start_order': j,
+          '_max_page_index': page_map.max_page_index}
          for i, j in enumerate(start_order)])
 
-    for participant in participants:
-        ParticipantLockModel(participant_code=participant.code).save()
+    ParticipantLockModel.objects.bulk_create([
+        ParticipantLockModel(participant_code=participant.code)
+        for participant in participants])
 
+    lock_scopes = [session]
     try:
         for app_name in session_config['app_sequence']:
 
@@ -228,7 +235,9 @@ def create_session(session_config_name, label='', num_participants=None,
                     participant=participant)
                 for round_number, subsession in zip(round_numbers, subs)
                 for participant in participants])
+            lock_scopes.extend(subs)
 
+        create_lock_scopes(lock_scopes)
         session._create_groups_and_initialize()
     # handle case where DB has missing column or table
     # missing table: OperationalError: no such table: pg_subsession
@@ -242,8 +251,6 @@ def create_session(session_config_name, label='', num_participants=None,
                 sys.exc_info()[2])
         raise
 
-
-    session.build_participant_to_player_lookups()
     if room is not None:
         room.session = session
     session.save()
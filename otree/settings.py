@@ -161,6 +161,25 @@ def get_default_settings(initial_settings=None):
         # for convenience within oTree
         'REDIS_URL': REDIS_URL,
 
+        # how oTree prevents a participant from loading a page twice
+        # concurrently. one of 'table', 'select_for_update', 'advisory',
+        # 'inprocess', or a dotted path. see otree/locks.py
+        'LOCK_BACKEND': 'table',
+
+        # record query count, SQL time, lock wait and render time
+        # of every page request. see otree/instrumentation.py
+        'PAGE_INSTRUMENTATION': False,
+
+        # if > 0, PageCompletion records are written in batches of this
+        # size, or after PAGE_COMPLETION_BUFFER_SECONDS at the latest,
+        # instead of on every page. they show up in the admin with a delay.
+        'PAGE_COMPLETION_BUFFER_SIZE': 0,
+        'PAGE_COMPLETION_BUFFER_SECONDS': 5,
+
+        # run each page request in one transaction, so that its writes
+        # are committed together rather than one by one
+        'ATOMIC_PAGE_REQUESTS': False,
+
         # since workers on Amazon MTurk can return the hit
         # we need extra participants created on the
         # server.
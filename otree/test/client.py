@@ -186,6 +186,19 @@ class ParticipantBot(six.with_metaclass(abc.ABCMeta, test.Client)):
     def get(self, path, data={}, follow=False, **extra):
         return super(ParticipantBot, self).get(path, data, follow, **extra)
 
+    def request(self, **request):
+        # check every response, including the redirects that
+        # follow=True doesn't return
+        response = super(ParticipantBot, self).request(**request)
+        header = constants_internal.query_budget_exceeded_http_header
+        queries_and_budget = response.get(header)
+        if queries_and_budget:
+            msg = (
+                "Query budget exceeded (queries/budget: {}). Path: {}"
+            ).format(queries_and_budget, request.get('PATH_INFO'))
+            raise AssertionError(msg)
+        return response
+
     def is_on(self, ViewClass):
         return re.match(ViewClass.url_pattern(), self.path.lstrip('/'))
 
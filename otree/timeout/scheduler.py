@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Run timeout tasks in this process, without huey and Redis.
+
+Used when ``otree.common_internal.USE_REDIS`` is False (e.g. runserver),
+so that page timeouts are still enforced on the server.
+
+Pending timers are kept in a heap ordered by due time, and a single daemon
+thread sleeps until the earliest one is due. Scheduling and cancelling
+are O(log n) and O(1). Cancelled timers stay in the heap and are
+dropped when they come up.
+
+Timers are lost when the process exits.
+
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimerScheduler(object):
+
+    def __init__(self):
+        self._heap = []
+        # {key: heap entry}, for timers that were scheduled with a key
+        self._keyed_entries = {}
+        # tie-breaker, so timers due at the same time run in order
+        # of scheduling, and functions are never compared
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._num_pending = 0
+
+    def schedule(self, delay, func, args=(), key=None):
+        """
+        call func(*args) in delay seconds.
+        if a timer with the same key is pending, it's replaced.
+        """
+        due = time.time() + delay
+        entry = [due, next(self._counter), func, args, key]
+        with self._condition:
+            if key is not None:
+                self._cancel(key)
+                self._keyed_entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            self._num_pending += 1
+            self._start()
+            # wake up the thread, in case this timer is due
+            # before the one it's waiting for
+            self._condition.notify()
+
+    def cancel(self, key):
+        with self._condition:
+            return self._cancel(key)
+
+    def _cancel(self, key):
+        entry = self._keyed_entries.pop(key, None)
+        if entry is None:
+            return False
+        # the thread skips entries without a function
+        entry[2] = None
+        self._num_pending -= 1
+        return True
+
+    def __len__(self):
+        """number of pending timers"""
+        with self._condition:
+            return self._num_pending
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='otree-timer-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _next_due(self):
+        """wait until a timer is due, and remove it from the heap"""
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                entry = self._heap[0]
+                if entry[2] is None:
+                    # cancelled
+                    heapq.heappop(self._heap)
+                    continue
+                wait = entry[0] - time.time()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._num_pending -= 1
+                key = entry[4]
+                if key is not None and self._keyed_entries.get(key) is entry:
+                    del self._keyed_entries[key]
+                return entry
+
+    def _run(self):
+        while True:
+            due, _, func, args, key = self._next_due()
+            try:
+                # the thread has its own DB connection
+                close_old_connections()
+                func(*args)
+            except Exception:
+                logger.exception('Timer {} failed'.format(key or func))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TimerScheduler()
+        return _scheduler
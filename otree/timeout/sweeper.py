@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Submit all pages whose timeout expired, in batches.
+
+Rather than relying on one task per page view, the sweeper finds the
+expired timeouts of all sessions with one indexed query on
+``Participant._timeout_expiration_time``, and advances those participants
+with ``otree.advance.advance_participants``.
+Since it only looks at the database, nothing is lost when a worker
+restarts. Run it with ``otree timeoutsweeper``.
+
+"""
+
+import logging
+import time
+
+from django.db.models import F
+
+from otree.advance import advance_participants
+from otree.models.participant import Participant
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+
+def sweep_expired_timeouts(now=None, batch_size=BATCH_SIZE):
+    """
+    advance every participant whose page timeout expired,
+    and who is still on that page.
+    a participant who can't be advanced is logged and skipped,
+    and their timeout is cleared.
+    returns the number of participants advanced.
+    """
+    if now is None:
+        now = int(time.time())
+    num_advanced = 0
+    while True:
+        # uses the _timeout_expiration_time index
+        participants = list(
+            Participant.objects.filter(
+                _timeout_expiration_time__lte=now,
+                # participants who already left the page are skipped
+                _timeout_page_index=F('_index_in_pages'),
+            ).order_by('_timeout_expiration_time')[:batch_size])
+        if not participants:
+            return num_advanced
+        failed = advance_participants(participants, skip_errors=True)
+        # advancing clears the timeouts, but not those of the
+        # participants who failed, so that they're not retried forever
+        if failed:
+            Participant.objects.filter(
+                pk__in=[p.pk for p in failed],
+            ).update(
+                _timeout_expiration_time=None, _timeout_page_index=None)
+        num_advanced += len(participants) - len(failed)
+        if len(participants) < batch_size:
+            return num_advanced
@@ -1,21 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import django.test
+from huey.contrib.djhuey import db_task
 
-from huey.contrib.djhuey import task, db_task
 
-from otree import constants_internal
+@db_task()
+def submit_expired_page(participant_code, page_index):
+    """The page's timeout expired (or the participant is auto playing),
+    so submit it with its timeout_submission values.
+    Does nothing if the participant already left the page.
 
+    """
 
-test_client = django.test.Client()
+    from otree.advance import advance_participant
+    from otree.models.participant import Participant
 
+    # if the timer was cancelled, the participant already left the page
+    participant = Participant.objects.filter(
+        code=participant_code,
+        _index_in_pages=page_index,
+        _timeout_page_index=page_index,
+    ).first()
+    if participant is not None:
+        try:
+            advance_participant(participant, page_index=page_index)
+        except Exception:
+            # so that the next visit of the page schedules a new timer
+            Participant.objects.filter(
+                pk=participant.pk,
+                _timeout_page_index=page_index,
+            ).update(
+                _timeout_page_index=None, _timeout_expiration_time=None)
+            raise
 
-@task()
+
+@db_task()
 def submit_expired_url(url):
+    """What submit_expired_page used to be.
+    Kept so that the tasks queued before an upgrade still run.
+
+    """
+
+    from otree.advance import advance_participant
+    from otree.models.participant import Participant
 
-    test_client.post(
-        url, data={constants_internal.auto_submit: True}, follow=True)
+    # the URL of the page, see otree.common_internal.url
+    parts = url.strip('/').split('/')
+    participant_code, page_index = parts[1], int(parts[-1])
+    participant = Participant.objects.filter(
+        code=participant_code,
+        _index_in_pages=page_index,
+    ).first()
+    if participant is not None:
+        advance_participant(participant, page_index=page_index)
 
 
 @db_task()
@@ -27,19 +64,15 @@ def ensure_pages_visited(participant_pk_set, wait_page_index):
 
     """
 
+    from otree.advance import advance_participants
     from otree.models.participant import Participant
 
+    # participants who are still on the wait page, or on a page
+    # before it. their current page is loaded, not submitted.
     unvisited_participants = Participant.objects.filter(
         pk__in=participant_pk_set,
         _index_in_pages__lte=wait_page_index,
     )
-    for participant in unvisited_participants:
-
-        # if the wait page is the first page,
-        # then _current_form_page_url could be null.
-        # in this case, use the start_url() instead,
-        # because that will redirect to the current wait page.
-        # (alternatively we could define _current_page_url or
-        # current_wait_page_url)
-        url = participant._current_form_page_url or participant._start_url()
-        test_client.get(url, follow=True)
+    # one participant's error doesn't stop the others
+    advance_participants(
+        unvisited_participants, submit=False, skip_errors=True)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""At most one pending timer per participant and page.
+
+A timer is a ``submit_expired_page`` task, scheduled when a page with a
+timeout is visited (or any page, for auto-playing participants).
+The page index of the pending timer and when it expires are stored on
+the participant (``_timeout_page_index``, ``_timeout_expiration_time``),
+so that visiting the same page again (a reload, or the auto-advance
+socket reconnecting) keeps the existing timer rather than adding
+another one, and the page can show the remaining time without a query.
+Once the timer expired, or its task failed, a visit schedules a new one.
+
+When the participant leaves the page, the timer is cancelled:
+the task still runs, but it finds the timer gone and does nothing.
+
+Tasks are run by huey, or without Redis (``USE_REDIS = False``)
+by the scheduler thread of this process (see otree/timeout/scheduler.py).
+
+"""
+
+import threading
+import time
+
+import otree.common_internal
+import otree.timeout.tasks
+from otree.timeout.scheduler import get_scheduler
+
+
+def schedule_task(task, args, delay, key=None):
+    """run the huey task with args in delay seconds.
+    key identifies the timer for cancel_task (only used in process).
+    """
+    if otree.common_internal.USE_REDIS:
+        task.schedule(args, delay=delay)
+    else:
+        get_scheduler().schedule(delay, task.call_local, args, key=key)
+
+
+def cancel_task(key):
+    # huey tasks check themselves whether they are still needed
+    if not otree.common_internal.USE_REDIS:
+        get_scheduler().cancel(key)
+
+
+class TimerStats(object):
+    """what the scheduler did, in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.scheduled = 0
+            self.suppressed = 0
+            self.cancelled = 0
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'scheduled': self.scheduled,
+                'suppressed': self.suppressed,
+                'cancelled': self.cancelled,
+            }
+
+
+timer_stats = TimerStats()
+
+
+def schedule_page_timer(participant, page_index, delay):
+    """
+    submit the page after delay seconds, unless the participant
+    has left it by then.
+    returns False if a timer for this page was already pending.
+    the participant must be saved afterwards.
+    """
+    # once the timer expired, its task might have been lost
+    # (e.g. a worker restarted), so the next visit schedules another one.
+    # the tasks check the page index, so a late duplicate does nothing.
+    if (participant._timeout_page_index == page_index and
+            participant._timeout_expiration_time is not None and
+            participant._timeout_expiration_time > time.time()):
+        timer_stats.increment('suppressed')
+        return False
+    participant._timeout_page_index = page_index
+    participant._timeout_expiration_time = int(time.time() + delay)
+    schedule_task(
+        otree.timeout.tasks.submit_expired_page,
+        (participant.code, page_index), delay,
+        key=('page_timer', participant.code, page_index))
+    timer_stats.increment('scheduled')
+    return True
+
+
+def cancel_page_timer(participant):
+    """the participant left the page, so its timer must not fire"""
+    if participant._timeout_page_index is not None:
+        cancel_task(
+            ('page_timer', participant.code, participant._timeout_page_index))
+        participant._timeout_page_index = None
+        participant._timeout_expiration_time = None
+        timer_stats.increment('cancelled')
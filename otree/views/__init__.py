@@ -28,6 +28,8 @@ class WaitPage(abstract.InGameWaitPage):
 
     wait_for_all_groups = False
 
+    group_by_arrival_time = False
+
     title_text = None
 
     body_text = None
@@ -13,6 +13,8 @@ import json
 import contextlib
 
 import django.db
+from django.db import transaction
+from django.db.models import F
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 from django.shortcuts import get_object_or_404
@@ -28,13 +30,20 @@ import channels
 
 import vanilla
 
+import otree.channels.broadcast
 import otree.forms
 import otree.common_internal
 
 import otree.models.session
 import otree.timeout.tasks
+import otree.timeout.timers
 import otree.models
+import otree.db.bulk
 import otree.db.idmap
+import otree.instrumentation
+import otree.lobby
+import otree.locks
+import otree.readiness
 import otree.constants_internal as constants
 from otree.models.participant import Participant
 from otree.models.session import Session
@@ -42,9 +51,9 @@ from otree.common_internal import get_app_label_from_import_path
 
 from otree.models_concrete import (
     PageCompletion, CompletedSubsessionWaitPage,
-    CompletedGroupWaitPage, PageTimeout, StubModel, ParticipantLockModel)
+    CompletedGroupWaitPage, StubModel,
+    WaitPageArrival, WaitPageArrivalCounter)
 from otree_save_the_change.mixins import SaveTheChange
-from otree.models.session import GlobalSingleton
 
 
 # Get an instance of a logger
@@ -58,23 +67,24 @@ NO_PARTICIPANTS_LEFT_MSG = (
 DebugTable = collections.namedtuple('DebugTable', ['title', 'rows'])
 
 
-@contextlib.contextmanager
-def lock_on_this_code_path(recheck_interval=0.1):
-    TIMEOUT = 10
-    start_time = time.time()
-    while time.time() - start_time < TIMEOUT:
-        updated_locks = GlobalSingleton.objects.filter(
-            locked=False
-        ).update(locked=True)
-        if not updated_locks:
-            time.sleep(recheck_interval)
-        else:
-            try:
-                yield
-            finally:
-                GlobalSingleton.objects.update(locked=False)
-            return
-    raise Exception('Request for global lock is stuck')
+_page_completion_buffer = None
+
+
+def get_page_completion_buffer():
+    '''
+    if settings.PAGE_COMPLETION_BUFFER_SIZE is set, PageCompletion records
+    are inserted in batches by a BulkCreateBuffer, rather than one INSERT
+    per page. returns None if buffering is off.
+    '''
+    global _page_completion_buffer
+    if not settings.PAGE_COMPLETION_BUFFER_SIZE:
+        return None
+    if _page_completion_buffer is None:
+        _page_completion_buffer = otree.db.bulk.BulkCreateBuffer(
+            PageCompletion,
+            max_size=settings.PAGE_COMPLETION_BUFFER_SIZE,
+            max_seconds=settings.PAGE_COMPLETION_BUFFER_SECONDS)
+    return _page_completion_buffer
 
 
 @contextlib.contextmanager
@@ -83,34 +93,13 @@ def participant_lock(participant_code):
     prevent the same participant from executing the page twice
     use this instead of a transaction because it's more lightweight.
     transactions make it harder to reason about wait pages
+
+    how the lock is taken depends on settings.LOCK_BACKEND
+    (see otree.locks). yields the seconds spent waiting for the lock.
     '''
-    TIMEOUT = 10
-    start_time = time.time()
-    while time.time() - start_time < TIMEOUT:
-        updated_locks = ParticipantLockModel.objects.filter(
-            participant_code=participant_code,
-            locked=False
-        ).update(locked=True)
-        if not updated_locks:
-            time.sleep(0.2)
-        else:
-            try:
-                yield
-            finally:
-                ParticipantLockModel.objects.filter(
-                    participant_code=participant_code,
-                ).update(locked=False)
-            return
-    exists = ParticipantLockModel.objects.filter(
-        participant_code=participant_code
-    ).exists()
-    if not exists:
-        raise Http404((
-            "This user ({}) does not exist in the database. "
-            "Maybe the database was recreated."
-        ).format(participant_code))
-    raise Exception(
-        'Request for participant {} is stuck'.format(participant_code))
+    backend = otree.locks.get_lock_backend()
+    with backend.participant_lock(participant_code) as wait:
+        yield wait
 
 
 class SaveObjectsMixin(object):
@@ -148,6 +137,12 @@ class SaveObjectsMixin(object):
             if is_monitored:
                 cached_instances = list(model_cache.values())
                 instances.extend(cached_instances)
+        # the form's object, in case it's not in the cache
+        # (it's saved with commit=False, see FormPageMixin.post)
+        form_object = getattr(self, 'object', None)
+        if (isinstance(form_object, monitored_classes) and
+                not any(form_object is instance for instance in instances)):
+            instances.append(form_object)
         return instances
 
     def _save_objects_shall_save(self, instance):
@@ -166,9 +161,24 @@ class SaveObjectsMixin(object):
         return True
 
     def save_objects(self):
-        for instance in self._get_save_objects_model_instances():
-            if self._save_objects_shall_save(instance):
+        """
+        Issue at most one UPDATE per changed instance, with only the
+        changed columns (that's what SaveTheChange does), all in one
+        transaction.
+        """
+        instances = self._get_save_objects_model_instances()
+        instances_to_save = [
+            instance for instance in instances
+            if self._save_objects_shall_save(instance)]
+        if len(instances_to_save) > 1:
+            atomic = otree.common_internal.transaction_atomic()
+        else:
+            atomic = otree.common_internal.no_op_context_manager()
+        with atomic:
+            for instance in instances_to_save:
                 instance.save()
+        otree.instrumentation.save_stats.record(
+            checked=len(instances), written=len(instances_to_save))
 
 
 class OTreeMixin(SaveObjectsMixin, object):
@@ -300,10 +310,8 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
         because used by all views, not just sequence
         """
 
-        player_lookup = self.participant.player_lookup()
-
-        app_name = player_lookup.app_name
-        player_pk = player_lookup.player_pk
+        location = self.participant._current_page_location()
+        app_name = location.app_name
 
         # for the participant changelist
         self.participant._current_app_name = app_name
@@ -317,7 +325,9 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
         self.player = self.PlayerClass.objects\
             .select_related(
                 'group', 'subsession', 'session'
-            ).get(pk=player_pk)
+            ).get(
+                participant=self.participant,
+                round_number=location.round_number)
 
         self.group = self.player.group
 
@@ -328,13 +338,67 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
         # for public API
         self.round_number = self.subsession.round_number
 
+    # maximum number of SQL queries a request to this page should run.
+    # bots fail if it's exceeded. see otree/instrumentation.py
+    query_budget = None
+
     @method_decorator(never_cache)
     @method_decorator(cache_control(must_revalidate=True, max_age=0,
                                     no_cache=True, no_store=True))
     def dispatch(self, request, *args, **kwargs):
+        # e.g. send channel messages only once the transaction committed,
+        # otherwise the clients they redirect would not see the changes.
+        # besides ATOMIC_PAGE_REQUESTS, the lock backend can also run the
+        # request in a transaction (select_for_update).
+        self._after_commit_calls = []
+
+        if otree.instrumentation.is_enabled(self):
+            self._measurement = otree.instrumentation.PageMeasurement(self)
+            with self._measurement.measure():
+                response = self._dispatch(request, *args, **kwargs)
+            otree.instrumentation.record(self._measurement)
+            self._measurement.add_headers(response)
+        else:
+            self._measurement = None
+            response = self._dispatch(request, *args, **kwargs)
+
+        # the request's transactions are closed now.
+        # if it failed, they were rolled back and the calls are dropped.
+        for func, args in self._after_commit_calls:
+            func(*args)
+        return response
+
+    def _run_after_commit(self, func, *args):
+        """run func now, or if a transaction is open,
+        once the request's outermost transaction committed"""
+        after_commit_calls = getattr(self, '_after_commit_calls', None)
+        if (after_commit_calls is None or
+                not django.db.connection.in_atomic_block):
+            func(*args)
+        else:
+            after_commit_calls.append((func, args))
+
+    def _send_channel_message(self, channel, message):
+        """channel is a channels.Group or channels.Channel"""
+        self._run_after_commit(channel.send, message)
+
+    def _request_transaction(self):
+        """
+        with settings.ATOMIC_PAGE_REQUESTS, everything the request writes
+        after taking the participant lock is committed at once
+        """
+        if settings.ATOMIC_PAGE_REQUESTS:
+            return transaction.atomic()
+        return otree.common_internal.no_op_context_manager()
+
+    def _dispatch(self, request, *args, **kwargs):
         participant_code = kwargs.pop(constants.participant_code)
 
-        with participant_lock(participant_code), otree.db.idmap.use_cache():
+        with participant_lock(participant_code) as lock_wait, \
+                otree.db.idmap.use_cache(), \
+                self._request_transaction():
+            if self._measurement:
+                self._measurement.lock_wait_ms = lock_wait * 1000
 
             self._index_in_pages = int(
                 kwargs.pop(constants.index_in_pages))
@@ -342,8 +406,9 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
             self.index_in_pages = self._index_in_pages
 
             try:
-                self.participant = Participant.objects.get(
-                    code=participant_code)
+                # the session is needed to find the current page
+                self.participant = Participant.objects.select_related(
+                    'session').get(code=participant_code)
             except Participant.DoesNotExist:
                 msg = (
                     "This user ({}) does not exist in the database. "
@@ -372,7 +437,11 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
             # because the template might call a method that modifies
             # player/group/etc.
             if hasattr(response, 'render'):
-                response.render()
+                if self._measurement:
+                    with self._measurement.timing('render_ms'):
+                        response.render()
+                else:
+                    response.render()
             self.save_objects()
             return response
 
@@ -394,16 +463,8 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
         # we should allow a user to move beyond the last page if it's mturk
         # also in general maybe we should show the 'out of sequence' page
 
-        # the timeout record is irrelevant at this point, delete it
-        # wait pages don't have a has_timeout attribute
-        if hasattr(self, 'has_timeout') and self.has_timeout():
-            PageTimeout.objects.filter(
-                participant_pk=self.participant.pk,
-                page_index=self.participant._index_in_pages).delete()
-        # this is causing crashes because of the weird DB issue
-        # ParticipantToPlayerLookup.objects.filter(
-        #    participant_pk=self.participant.pk,
-        #    page_index=self.participant._index_in_pages).delete()
+        # the timeout is irrelevant at this point
+        otree.timeout.timers.cancel_page_timer(self.participant)
 
         # performance optimization:
         # we skip any page that is a sequence page where is_displayed
@@ -432,19 +493,19 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
             # because the user has to pass through them
             # so we record that they visited
             if hasattr(Page, 'is_displayed') and not page.is_displayed():
-                if hasattr(Page, '_tally_unvisited'):
+                # a skipped lobby doesn't regroup, so nobody waits there
+                is_lobby = getattr(Page, 'group_by_arrival_time', False)
+                if hasattr(Page, '_record_arrival') and not is_lobby:
                     page._index_in_pages = (
                         self._index_in_pages + pages_to_jump_by)
                     if page.wait_for_all_groups:
                         page._group_or_subsession = self.subsession
                     else:
                         page._group_or_subsession = self.group
-                    with lock_on_this_code_path():
-                        unvisited_participants = page._tally_unvisited()
-                    # don't count myself; i only need to visit this page
-                    # if everybody else already passed it
-                    unvisited_participants.discard(self.participant.id)
-                    if not unvisited_participants:
+                    page.participant = self.participant
+                    # skipping the page counts as arriving on it.
+                    # i only need to visit this page if i'm the last one
+                    if not page._record_arrival():
                         # if it's the last person
                         # because they need to complete the wait page
                         # don't skip past the wait page
@@ -456,12 +517,21 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
         self.player._index_in_game_pages += pages_to_jump_by
         self.participant._index_in_pages += pages_to_jump_by
 
-        channels.Group(
-            'auto-advance-{}'.format(self.participant.code)
-        ).send(
-            {'text': json.dumps(
-                {'new_index_in_pages': self.participant._index_in_pages})}
-        )
+        if self._batched_new_indexes is None:
+            self._send_channel_message(
+                channels.Group(
+                    'auto-advance-{}'.format(self.participant.code)),
+                {'text': json.dumps(
+                    {'new_index_in_pages': self.participant._index_in_pages})}
+            )
+        else:
+            # sent for all participants at once, see otree/advance.py
+            self._batched_new_indexes[self.participant.id_in_session] = (
+                self.participant._index_in_pages)
+
+    # {id_in_session: new _index_in_pages} when many participants
+    # are advanced together by otree.advance.advance_participants
+    _batched_new_indexes = None
 
     def is_displayed(self):
         return True
@@ -495,8 +565,16 @@ class FormPageOrInGameWaitPageMixin(OTreeMixin):
             participant_pk=self.participant.pk,
             session_pk=self.subsession.session.pk,
             auto_submitted=timeout_happened)
-        completion.save()
-        self.participant.save()
+        buffer = get_page_completion_buffer()
+        if buffer is None:
+            completion.save()
+        else:
+            # a flush writes other participants' completions too,
+            # so it must not happen in this request's transaction,
+            # which could still roll back
+            self._run_after_commit(buffer.add, completion)
+        # the participant is saved at the end of the request
+        # by save_objects()
 
 
 class GenericWaitPageMixin(object):
@@ -594,25 +672,34 @@ class InGameWaitPageMixin(object):
     """
 
     def dispatch(self, request, *args, **kwargs):
+        if self._arrive():
+            return self._response_when_ready()
+        return self._get_wait_page()
+
+    def _arrive(self):
+        """
+        the participant arrived on the wait page.
+        returns True if they can proceed, False if they need to wait.
+        if they are the last to arrive, complete the wait page.
+        """
+        if self.group_by_arrival_time:
+            return self._arrive_in_lobby()
         if self.wait_for_all_groups:
             self._group_or_subsession = self.subsession
         else:
             self._group_or_subsession = self.group
         if self._is_ready():
-            return self._response_when_ready()
-        # take a lock because we set "waiting for" list here
-        with lock_on_this_code_path():
-            unvisited_participants = self._tally_unvisited()
-        if unvisited_participants:
+            return True
+        if self._record_arrival():
             # only skip the wait page if there are still
             # unvisited participants. otherwise, you need to
             # mark the page as completed.
             # see _increment_index_in_pages, which needs to
             # handle this case also
             if not self.is_displayed():
-                return self._response_when_ready()
+                return True
             self.participant.is_on_wait_page = True
-            return self._get_wait_page()
+            return False
         else:
             try:
                 if self.wait_for_all_groups:
@@ -626,17 +713,29 @@ class InGameWaitPageMixin(object):
                         group_pk=self.group.pk,
                         session_pk=self.session.pk
                     )
-                completion.save()
+                # savepoint, so that if this request runs in a transaction
+                # (ATOMIC_PAGE_REQUESTS), it can continue after the error
+                with transaction.atomic():
+                    completion.save()
             # if the record already exists
             # (enforced through unique_together)
             except django.db.IntegrityError:
                 self.participant.is_on_wait_page = True
-                return self._get_wait_page()
+                return False
             try:
                 # need to check this before deleting
                 # reference to self.player
                 is_displayed = self.is_displayed()
 
+                in_background = self.after_all_players_arrive_in_background
+                if is_displayed and in_background:
+                    # the worker sends the 'ready' message when done
+                    self._send_channel_message(
+                        channels.Channel('otree.after_all_players_arrive'),
+                        self._after_all_players_arrive_message(completion))
+                    self.participant.is_on_wait_page = True
+                    return False
+
                 # in case there is a timeout on the next page, we
                 # should ensure the next pages are visited promptly
                 # TODO: can we make this run only if next page is a
@@ -689,29 +788,35 @@ class InGameWaitPageMixin(object):
                 # as a shortcut, we just check if is_displayed is true
                 # for the last player.
                 if is_displayed:
+                    start_time = time.time()
                     self.after_all_players_arrive()
+                    completion.after_all_players_arrive_seconds = (
+                        time.time() - start_time)
             except:
                 completion.delete()
                 raise
 
             self.player = player
 
-            if otree.common_internal.USE_REDIS:
-                # 2015-07-27:
-                #   why not check if the next page has_timeout?
-                otree.timeout.tasks.ensure_pages_visited.schedule(
-                    kwargs={
-                        'participant_pk_set': participant_pk_set,
-                        'wait_page_index': self._index_in_pages}, delay=10)
+            # 2015-07-27:
+            #   why not check if the next page has_timeout?
+            otree.timeout.timers.schedule_task(
+                otree.timeout.tasks.ensure_pages_visited,
+                (participant_pk_set, self._index_in_pages), delay=10)
 
             completion.after_all_players_arrive_run = True
             completion.save()
+            self._run_after_commit(
+                otree.readiness.mark_ready,
+                self.session.pk, self._index_in_pages, self._model_name(),
+                self._group_or_subsession.pk)
 
             # send a message to the channel to move forward
             # this should happen at the very end,
-            channels.Group(channels_group_name).send(
-                {'text': json.dumps(
-                    {'status': 'ready'})}
+            self._send_channel_message(
+                channels.Group(channels_group_name),
+                otree.channels.broadcast.wait_page_ready_message(
+                    len(participant_pk_set))
             )
 
             # we can assume it's ready because
@@ -719,93 +824,172 @@ class InGameWaitPageMixin(object):
             # created it, and therefore that whole code block
             # finished executing (including the after_all_players_arrive)
             # inside the transaction
-            return self._response_when_ready()
+            return True
+
+    # run after_all_players_arrive on a channel worker rather than
+    # in the last player's request. use this if it takes long.
+    # the players stay on the wait page until it has finished.
+    after_all_players_arrive_in_background = False
+
+    # group the players in the order they arrive on this page,
+    # players_per_group at a time, instead of waiting for the group
+    # they were put in at session creation. see otree/lobby.py.
+    # after_all_players_arrive is not run on such a page.
+    group_by_arrival_time = False
+
+    def _arrive_in_lobby(self):
+        self._group_or_subsession = self.subsession
+        if otree.lobby.arrive(self):
+            # put in a new group
+            self.group = self.player.group
+            return True
+        self.participant.is_on_wait_page = True
+        return False
+
+    def _after_all_players_arrive_message(self, completion):
+        return {
+            'app_name': self.subsession._meta.app_config.name,
+            'page_name': self.__class__.__name__,
+            'page_index': self._index_in_pages,
+            'session_pk': self.session.pk,
+            'model_name': self._model_name(),
+            'model_pk': self._group_or_subsession.pk,
+            'completion_pk': completion.pk,
+        }
 
     def channels_group_name(self):
-        if self.wait_for_all_groups:
-            model_name = 'subsession'
-        else:
-            model_name = 'group'
-
         return otree.common_internal.channels_wait_page_group_name(
             session_pk=self.session.pk,
             page_index=self._index_in_pages,
-            model_name=model_name,
-            model_pk=self._group_or_subsession.pk)
+            model_name=self._model_name(),
+            model_pk=self._model_pk())
 
     def socket_url(self):
-        if self.wait_for_all_groups:
-            model_name = 'subsession'
-        else:
-            model_name = 'group'
-
         params = ','.join([
             str(self.session.pk),
             str(self._index_in_pages),
-            model_name,
-            str(self._group_or_subsession.pk)
+            self._model_name(),
+            str(self._model_pk())
         ])
 
         return '/wait_page/{}/'.format(params)
 
     def _is_ready(self):
         """all participants visited, AND action has been run"""
-        if self.wait_for_all_groups:
-            return CompletedSubsessionWaitPage.objects.filter(
-                page_index=self._index_in_pages,
-                session_pk=self.session.pk,
-                after_all_players_arrive_run=True).exists()
-        else:
-            return CompletedGroupWaitPage.objects.filter(
-                page_index=self._index_in_pages,
-                group_pk=self.group.pk,
-                session_pk=self.session.pk,
-                after_all_players_arrive_run=True).exists()
-
-    def _tally_unvisited(self):
-        """side effect: set _waiting_for_ids"""
+        return otree.readiness.is_ready(
+            session_pk=self.session.pk,
+            page_index=self._index_in_pages,
+            model_name=self._model_name(),
+            model_pk=self._model_pk())
 
+    def _model_name(self):
+        if self.group_by_arrival_time:
+            # the participant waits for a group that doesn't exist yet
+            return 'lobby'
+        if self.wait_for_all_groups:
+            return 'subsession'
+        return 'group'
+
+    def _model_pk(self):
+        if self.group_by_arrival_time:
+            return self.participant.pk
+        return self._group_or_subsession.pk
+
+    def _arrival_counter(self):
+        lookup = {
+            'page_index': self._index_in_pages,
+            'session_pk': self.session.pk,
+            'model_name': self._model_name(),
+            'model_pk': self._group_or_subsession.pk,
+        }
+        try:
+            return WaitPageArrivalCounter.objects.get(**lookup)
+        except WaitPageArrivalCounter.DoesNotExist:
+            total = self._group_or_subsession.player_set.count()
+            counter, created = WaitPageArrivalCounter.objects.get_or_create(
+                defaults={'total': total}, **lookup)
+            return counter
+
+    def _record_arrival(self):
+        """
+        count the participant as arrived on this wait page
+        (only once, even if they load the page again),
+        and return the number of participants who haven't arrived yet.
+        side effect: set _waiting_for_ids
+        """
+        counter = self._arrival_counter()
+        try:
+            with transaction.atomic():
+                WaitPageArrival.objects.create(
+                    participant_pk=self.participant.pk,
+                    page_index=self._index_in_pages)
+                WaitPageArrivalCounter.objects.filter(
+                    pk=counter.pk
+                ).update(arrivals=F('arrivals') + 1)
+        except django.db.IntegrityError:
+            # already arrived
+            pass
+        arrivals = WaitPageArrivalCounter.objects.filter(
+            pk=counter.pk).values_list('arrivals', flat=True)[0]
+        num_unvisited = counter.total - arrivals
+        if 1 <= num_unvisited <= 3:
+            self._set_waiting_for_ids()
+        return num_unvisited
+
+    def _set_waiting_for_ids(self):
         participant_ids = set(
             self._group_or_subsession.player_set.values_list(
                 'participant_id', flat=True))
-
-        participant_data = Participant.objects.filter(
-            id__in=participant_ids
-        ).values('id', 'id_in_session', '_index_in_pages')
-
-        visited = []
-        unvisited = []
-        for p in participant_data:
-            if p['_index_in_pages'] < self._index_in_pages:
-                unvisited.append(p)
-            else:
-                visited.append(p)
-
-        if 1 <= len(unvisited) <= 3:
-
-            unvisited_description = ', '.join(
-                'P{}'.format(p['id_in_session']) for p in unvisited)
-
-            visited_ids = [p['id'] for p in visited]
-            Participant.objects.filter(
-                id__in=visited_ids
-            ).update(_waiting_for_ids=unvisited_description)
-
-        return {p['id'] for p in unvisited}
+        visited_ids = set(
+            WaitPageArrival.objects.filter(
+                participant_pk__in=participant_ids,
+                page_index=self._index_in_pages
+            ).values_list('participant_pk', flat=True))
+        unvisited_ids_in_session = Participant.objects.filter(
+            id__in=participant_ids - visited_ids
+        ).order_by('id_in_session').values_list('id_in_session', flat=True)
+
+        unvisited_description = ', '.join(
+            'P{}'.format(id_in_session)
+            for id_in_session in unvisited_ids_in_session)
+
+        Participant.objects.filter(
+            id__in=visited_ids
+        ).update(_waiting_for_ids=unvisited_description)
 
     def is_displayed(self):
         return True
 
     def _response_when_ready(self):
+        self._pass_wait_page()
+        return self._redirect_to_page_the_user_should_be_on()
+
+    def _pass_wait_page(self):
         self.participant.is_on_wait_page = False
         self.participant._waiting_for_ids = None
         self._increment_index_in_pages()
-        return self._redirect_to_page_the_user_should_be_on()
+
+    def _visit(self):
+        """
+        what loading the page does, without rendering it
+        (see otree/advance.py).
+        returns True if the participant stays on this page.
+        """
+        if self._arrive():
+            self._pass_wait_page()
+            return False
+        return True
+
+    def _advance(self, auto_submit):
+        # a wait page can't be skipped, only arrived on
+        self._visit()
 
     def after_all_players_arrive(self):
         pass
 
     def _get_default_body_text(self):
+        if self.group_by_arrival_time:
+            return _('Waiting for the other participants.')
         num_other_players = len(self._group_or_subsession.get_players()) - 1
         if num_other_players > 1:
             return _('Waiting for the other participants.')
@@ -814,6 +998,96 @@ class InGameWaitPageMixin(object):
         return ''
 
 
+# times run_after_all_players_arrive tries, before giving up
+AFTER_ALL_PLAYERS_ARRIVE_ATTEMPTS = 3
+
+AFTER_ALL_PLAYERS_FAILED = (
+    'An error occurred on the server. Please reload this page to try again.')
+
+
+def run_after_all_players_arrive(message):
+    """
+    executed by a channel worker, for wait pages with
+    after_all_players_arrive_in_background.
+    message comes from InGameWaitPageMixin._after_all_players_arrive_message
+    """
+    app_name = message['app_name']
+    views_module = otree.common_internal.get_views_module(app_name)
+    models_module = otree.common_internal.get_models_module(app_name)
+    page = getattr(views_module, message['page_name'])()
+    page._models_module = models_module
+    page.SubsessionClass = models_module.Subsession
+    page.GroupClass = models_module.Group
+    page.PlayerClass = models_module.Player
+    page._index_in_pages = message['page_index']
+
+    if message['model_name'] == 'group':
+        CompletionModel = CompletedGroupWaitPage
+    else:
+        CompletionModel = CompletedSubsessionWaitPage
+
+    with otree.db.idmap.use_cache():
+        page.session = Session.objects.get(pk=message['session_pk'])
+        if message['model_name'] == 'group':
+            page.group = page.GroupClass.objects.select_related(
+                'subsession').get(pk=message['model_pk'])
+            page.subsession = page.group.subsession
+            page._group_or_subsession = page.group
+        else:
+            page.subsession = page.SubsessionClass.objects.get(
+                pk=message['model_pk'])
+            page._group_or_subsession = page.subsession
+        page.round_number = page.subsession.round_number
+
+        # _group_or_subsession might be deleted
+        # in after_all_players_arrive, so calculate these first
+        participant_pk_set = set(
+            page._group_or_subsession.player_set.values_list(
+                'participant_id', flat=True))
+        channels_group_name = page.channels_group_name()
+
+        completion = CompletionModel.objects.get(pk=message['completion_pk'])
+        try:
+            with otree.common_internal.transaction_atomic():
+                start_time = time.time()
+                page.after_all_players_arrive()
+                completion.after_all_players_arrive_seconds = (
+                    time.time() - start_time)
+                page.save_objects()
+                completion.after_all_players_arrive_run = True
+                completion.save()
+        except Exception:
+            attempt = message.get('attempt', 1)
+            logger.exception(
+                'after_all_players_arrive of {} failed (attempt {})'.format(
+                    message['page_name'], attempt))
+            if attempt < AFTER_ALL_PLAYERS_ARRIVE_ATTEMPTS:
+                # the completion stays, so that no request
+                # starts it again in the meantime
+                channels.Channel('otree.after_all_players_arrive').send(
+                    dict(message, attempt=attempt + 1))
+            else:
+                # tell the players, who are waiting for 'ready'.
+                # reloading the wait page tries again,
+                # since the completion is gone
+                completion.delete()
+                channels.Group(channels_group_name).send(
+                    {'text': json.dumps({'error': AFTER_ALL_PLAYERS_FAILED})})
+            return
+        otree.readiness.mark_ready(
+            message['session_pk'], message['page_index'],
+            message['model_name'], message['model_pk'])
+
+    otree.timeout.timers.schedule_task(
+        otree.timeout.tasks.ensure_pages_visited,
+        (participant_pk_set, page._index_in_pages), delay=10)
+
+    channels.Group(channels_group_name).send(
+        otree.channels.broadcast.wait_page_ready_message(
+            len(participant_pk_set))
+    )
+
+
 class FormPageMixin(object):
     """mixin rather than subclass because we want these methods only to be
     first in MRO
@@ -868,20 +1142,33 @@ class FormPageMixin(object):
         return response
 
     def get(self, request, *args, **kwargs):
-        if not self.is_displayed():
-            self._increment_index_in_pages()
+        if not self._visit():
             return self._redirect_to_page_the_user_should_be_on()
+        return super(FormPageMixin, self).get(request, *args, **kwargs)
 
-        self.participant._current_form_page_url = self.request.path
-        if otree.common_internal.USE_REDIS:
-            if self.participant._is_auto_playing:
-                otree.timeout.tasks.submit_expired_url.schedule(
-                    (self.request.path,), delay=2)  # 2 seconds
-            elif self.has_timeout():
-                otree.timeout.tasks.submit_expired_url.schedule(
-                    (self.request.path,), delay=self.timeout_seconds)
+    def _visit(self):
+        """
+        what loading the page does, without rendering it
+        (see otree/advance.py).
+        returns True if the participant stays on this page,
+        False if it's not displayed and was skipped.
+        """
+        if not self.is_displayed():
+            self._increment_index_in_pages()
+            return False
 
-        return super(FormPageMixin, self).get(request, *args, **kwargs)
+        self.participant._current_form_page_url = self.url(
+            self.participant, self._index_in_pages)
+        if self.participant._is_auto_playing:
+            delay = 2  # 2 seconds
+        elif self.has_timeout():
+            delay = self.timeout_seconds
+        else:
+            return True
+        # a reload keeps the timer that is already pending
+        otree.timeout.timers.schedule_page_timer(
+            self.participant, self._index_in_pages, delay)
+        return True
 
     def post(self, request, *args, **kwargs):
 
@@ -896,19 +1183,44 @@ class FormPageMixin(object):
                 data=request.POST, files=request.FILES, instance=self.object)
             if form.is_valid():
                 self.form = form
-                self.object = form.save()
+                # the object is written at the end of the request
+                # by save_objects(), together with the other changes
+                self.object = form.save(commit=False)
             else:
                 return self.form_invalid(form)
+        self._complete_page()
+        return self._redirect_to_page_the_user_should_be_on()
+
+    def _complete_page(self):
         self.before_next_page()
         self._increment_index_in_pages()
-        return self._redirect_to_page_the_user_should_be_on()
+
+    def _advance(self, auto_submit):
+        """
+        submit the page without a request (see otree/advance.py).
+        with auto_submit, the timeout_submission values are used,
+        like when the page times out.
+        otherwise, the fields keep their current values.
+        """
+        if not self.is_displayed():
+            self._increment_index_in_pages()
+            return
+        self.object = self.get_object()
+        self.timeout_happened = auto_submit  # for public API
+        if auto_submit:
+            self._set_auto_submit_values()
+        self._complete_page()
 
     def socket_url(self):
         '''called from template. can't start with underscore because used
         in template
 
         '''
-        params = ','.join([self.participant.code, str(self._index_in_pages)])
+        params = ','.join([
+            self.participant.code,
+            str(self._index_in_pages),
+            str(self.session.pk)
+        ])
         return '/auto_advance/{}/'.format(params)
 
     def absolute_redirect_url(self):
@@ -940,14 +1252,12 @@ class FormPageMixin(object):
     def remaining_timeout_seconds(self):
         if not self.has_timeout():
             return
-        current_time = int(time.time())
-        expiration_time = current_time + self.timeout_seconds
-        timeout, created = PageTimeout.objects.get_or_create(
-            participant_pk=self.participant.pk,
-            page_index=self.participant._index_in_pages,
-            defaults={'expiration_time': expiration_time})
-
-        return timeout.expiration_time - current_time
+        # set by _visit, which runs before the page is rendered
+        expiration_time = self.participant._timeout_expiration_time
+        if (expiration_time is None or
+                self.participant._timeout_page_index != self._index_in_pages):
+            return self.timeout_seconds
+        return expiration_time - int(time.time())
 
     timeout_seconds = None
 
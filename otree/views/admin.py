@@ -26,7 +26,9 @@ from collections import OrderedDict
 import easymoney
 
 import otree.constants_internal
+import otree.instrumentation
 import otree.models.session
+import otree.timeout.timers
 from otree.common_internal import (
     get_models_module, app_name_format,
     channels_create_session_group_name,
@@ -953,4 +955,24 @@ class ServerCheck(vanilla.TemplateView):
             'heroku': heroku,
             'runserver': runserver,
             'db_synced': db_synced
-        }
\ No newline at end of file
+        }
+
+
+class PageStats(vanilla.TemplateView):
+    template_name = 'otree/admin/PageStats.html'
+
+    @classmethod
+    def url_pattern(cls):
+        return r"^page_stats/$"
+
+    @classmethod
+    def url_name(cls):
+        return 'page_stats'
+
+    def get_context_data(self, **kwargs):
+        return {
+            'enabled': settings.PAGE_INSTRUMENTATION,
+            'page_stats': otree.instrumentation.get_page_stats(),
+            'save_stats': otree.instrumentation.save_stats.as_dict(),
+            'timer_stats': otree.timeout.timers.timer_stats.as_dict(),
+        }
@@ -6,9 +6,6 @@
 # IMPORTS
 # =============================================================================
 
-import time
-
-import django.utils.timezone
 from django.core.urlresolvers import reverse
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
@@ -28,7 +25,6 @@ from otree.views.mturk import MTurkConnection
 import otree.common_internal
 from otree.views.abstract import (
     NonSequenceUrlMixin, OTreeMixin,
-    lock_on_this_code_path,
     NO_PARTICIPANTS_LEFT_MSG
 )
 from otree.room import ROOM_DICT
@@ -67,19 +63,9 @@ class InitializeParticipant(vanilla.UpdateView):
         )
 
         if participant._index_in_pages == 0:
-            participant._index_in_pages = 1
-            participant.visited = True
-
-            # participant.label might already have been set
-            participant.label = participant.label or self.request.GET.get(
-                constants.participant_label
-            )
-            participant.ip_address = self.request.META['REMOTE_ADDR']
-
-            now = django.utils.timezone.now()
-            participant.time_started = now
-            participant._last_page_timestamp = time.time()
-
+            participant._initialize(
+                label=self.request.GET.get(constants.participant_label),
+                ip_address=self.request.META['REMOTE_ADDR'])
             participant.save()
         first_url = participant._url_i_should_be_on()
         return HttpResponseRedirect(first_url)
@@ -169,20 +155,9 @@ class MTurkStart(vanilla.View):
                 mturk_worker_id=worker_id,
                 mturk_assignment_id=assignment_id)
         except Participant.DoesNotExist:
-            with lock_on_this_code_path():
-                try:
-                    participant = (
-                        Participant.objects.filter(
-                            session=self.session,
-                            visited=False
-                        )
-                    ).order_by('start_order')[0]
-                except IndexError:
-                    return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
-
-            # 2014-10-17: needs to be here even if it's also set in
-            # the next view to prevent race conditions
-            participant.visited = True
+            participant = Participant._claim_unvisited(self.session)
+            if participant is None:
+                return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
             participant.mturk_worker_id = worker_id
             participant.mturk_assignment_id = assignment_id
             participant.save()
@@ -205,24 +180,13 @@ class JoinSessionAnonymously(vanilla.View):
         session = get_object_or_404(
             otree.models.Session, _anonymous_code=anonymous_code
         )
-        with lock_on_this_code_path():
-            try:
-                participant = (
-                    Participant.objects.filter(
-                        session=session,
-                        visited=False
-                    )
-                ).order_by('start_order')[0]
-            except IndexError:
-                return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
-
-            # 2014-10-17: needs to be here even if it's also set in
-            # the next view to prevent race conditions
-            participant.visited = True
-            participant.label = (
-                self.request.GET.get('participant_label') or participant.label
-            )
-            participant.save()
+        participant = Participant._claim_unvisited(session)
+        if participant is None:
+            return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
+        participant.label = (
+            self.request.GET.get('participant_label') or participant.label
+        )
+        participant.save()
         return HttpResponseRedirect(participant._start_url())
 
 
@@ -279,21 +243,11 @@ class AssignVisitorToRoom(vanilla.TemplateView):
                 assign_new = True
 
         if assign_new:
-            with lock_on_this_code_path():
-                try:
-                    participant = (
-                        Participant.objects.filter(
-                            session=session,
-                            visited=False)
-                    ).order_by('start_order')[0]
-                except IndexError:
-                    return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
-
-                participant.label = participant_label
-                # 2014-10-17: needs to be here even if it's also set in
-                # the next view to prevent race conditions
-                participant.visited = True
-                participant.save()
+            participant = Participant._claim_unvisited(session)
+            if participant is None:
+                return HttpResponseNotFound(NO_PARTICIPANTS_LEFT_MSG)
+            participant.label = participant_label
+            participant.save()
 
         return HttpResponseRedirect(participant._start_url())
 
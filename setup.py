@@ -49,6 +49,10 @@ setup(
     author='C. Wickens',
     author_email='c.wickens+otree@googlemail.com',
     install_requires=required,
+    extras_require={
+        # subsession.get_group_matrix(as_array=True) etc.
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',
@@ -0,0 +1,153 @@
+from django.core.management import call_command
+from django.test.utils import override_settings
+from mock import patch
+
+import otree.views.abstract
+from otree.views.abstract import get_page_completion_buffer
+
+import otree.timeout.tasks
+from otree.advance import advance_participant, advance_participants
+from otree.models.participant import Participant
+from otree.models_concrete import PageCompletion
+
+from .simple_game.models import Player
+from .simple_game.views import MyPage
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestAdvanceParticipant(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "2")
+        patchers = [
+            patch('otree.timeout.tasks.submit_expired_page'),
+            patch('otree.timeout.tasks.ensure_pages_visited'),
+            patch('otree.views.abstract.channels.Group'),
+            patch('otree.channels.broadcast.Group'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.participants = list(Participant.objects.order_by('pk'))
+
+    def reload(self, participant):
+        return Participant.objects.get(pk=participant.pk)
+
+    def test_start(self):
+        participant = self.participants[0]
+        self.assertEqual(advance_participant(participant), 1)
+        participant = self.reload(participant)
+        self.assertTrue(participant.visited)
+        self.assertIsNotNone(participant.time_started)
+        self.assertEqual(participant._current_page_name, 'MyPage')
+
+    def test_auto_submit(self):
+        participant = self.participants[0]
+        advance_participant(participant)
+        # MyPage is submitted, then the participant waits for the others
+        self.assertEqual(advance_participant(participant), 2)
+        participant = self.reload(participant)
+        self.assertTrue(participant.is_on_wait_page)
+        completion = PageCompletion.objects.get()
+        self.assertEqual(completion.page_name, 'MyPage')
+        self.assertTrue(completion.auto_submitted)
+        player = Player.objects.get(participant=participant)
+        self.assertIsNotNone(player.my_field)
+
+    def test_last_one_passes_wait_page(self):
+        for participant in self.participants:
+            advance_participant(participant)
+            advance_participant(participant)
+        last = self.reload(self.participants[-1])
+        self.assertEqual(last._index_in_pages, 3)
+        self.assertEqual(last._current_page_name, 'Results')
+        self.assertFalse(last.is_on_wait_page)
+
+    def test_page_index(self):
+        participant = self.participants[0]
+        advance_participant(participant)
+        self.assertEqual(advance_participant(participant, page_index=5), 1)
+        self.assertFalse(PageCompletion.objects.exists())
+
+    def test_batch_skips_advanced_participants(self):
+        stale = list(Participant.objects.order_by('pk'))
+        advance_participants(self.participants)
+        advance_participants(stale)
+        self.assertEqual(
+            [p._index_in_pages for p in Participant.objects.order_by('pk')],
+            [1, 1])
+
+    def test_batch(self):
+        advance_participants(self.participants)
+        with patch(
+                'otree.channels.broadcast.send_auto_advance_batch') as send:
+            advance_participants(Participant.objects.order_by('pk'))
+        session_pk = self.participants[0].session_id
+        send.assert_called_once_with(session_pk, {
+            self.participants[0].id_in_session: 2,
+            self.participants[1].id_in_session: 3,
+        })
+
+    def test_page_has_request(self):
+        participant = self.participants[0]
+        advance_participant(participant)
+        requests = []
+
+        def before_next_page(page):
+            requests.append(page.request)
+
+        with patch.object(MyPage, 'before_next_page', before_next_page):
+            advance_participant(participant)
+        request, = requests
+        self.assertEqual(request.method, 'POST')
+        self.assertEqual(request.path, MyPage.url(participant, 1))
+        self.assertTrue(request.POST.get('auto_submit'))
+
+    def test_visit_without_submit(self):
+        advance_participants(self.participants)
+        advance_participants(self.participants, submit=False)
+        self.assertEqual(
+            [p._index_in_pages for p in Participant.objects.order_by('pk')],
+            [1, 1])
+        self.assertFalse(PageCompletion.objects.exists())
+
+    def test_submit_expired_url(self):
+        # tasks queued before submit_expired_page existed
+        participant = self.participants[0]
+        advance_participant(participant)
+        url = MyPage.url(participant, 1)
+        otree.timeout.tasks.submit_expired_url.call_local(url)
+        self.assertEqual(self.reload(participant)._index_in_pages, 2)
+        # the participant already left the page
+        otree.timeout.tasks.submit_expired_url.call_local(url)
+        self.assertEqual(self.reload(participant)._index_in_pages, 2)
+
+    @override_settings(
+        ATOMIC_PAGE_REQUESTS=True, PAGE_COMPLETION_BUFFER_SIZE=2)
+    def test_buffer_not_flushed_in_failed_request(self):
+        patcher = patch.object(
+            otree.views.abstract, '_page_completion_buffer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        first, second = self.participants
+        advance_participant(first)
+        advance_participant(second)
+        # the first completion is buffered
+        advance_participant(first)
+        buffer = get_page_completion_buffer()
+        self.assertEqual(len(buffer), 1)
+
+        # the second one would fill the buffer,
+        # but its request rolls back
+        with patch(
+                'otree.views.abstract.SaveObjectsMixin.save_objects',
+                side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                advance_participant(second)
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(self.reload(second)._index_in_pages, 1)
+
+        advance_participant(second)
+        self.assertEqual(PageCompletion.objects.count(), 2)
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management import call_command
+from mock import Mock, patch
+
+from otree.channels import broadcast, consumers
+from otree.models import Participant
+
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestBroadcast(TestCase):
+
+    def test_stagger_ms(self):
+        self.assertEqual(broadcast.stagger_ms(1), 0)
+        self.assertEqual(
+            broadcast.stagger_ms(11), 10 * broadcast.STAGGER_MS_PER_CLIENT)
+        self.assertEqual(
+            broadcast.stagger_ms(100000), broadcast.MAX_STAGGER_MS)
+
+    def test_one_message_per_batch(self):
+        with patch('otree.channels.broadcast.Group') as Group:
+            broadcast.send_auto_advance_batch(5, {1: 3, 2: 4})
+        Group.assert_called_once_with('session-5')
+        message, = Group.return_value.send.call_args[0]
+        content = json.loads(message['text'])
+        # JSON object keys are strings
+        self.assertEqual(content['new_indexes'], {'1': 3, '2': 4})
+        self.assertEqual(content['stagger_ms'], broadcast.stagger_ms(2))
+
+    def test_empty_batch(self):
+        with patch('otree.channels.broadcast.Group') as Group:
+            broadcast.send_auto_advance_batch(5, {})
+        self.assertFalse(Group.called)
+
+
+class TestAutoAdvanceConsumer(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+
+    def test_params_with_session(self):
+        message = Mock()
+        params = '{},3,{}'.format(
+            self.participant.code, self.participant.session_id)
+        with patch('otree.channels.consumers.Group') as Group:
+            consumers.disconnect_auto_advance(message, params)
+        Group.assert_any_call('auto-advance-{}'.format(self.participant.code))
+        Group.assert_any_call(
+            'session-{}'.format(self.participant.session_id))
+
+    def test_session_from_participant(self):
+        # the client can't subscribe to another session's batches
+        message = Mock()
+        params = '{},3,{}'.format(
+            self.participant.code, self.participant.session_id + 1)
+        with patch('otree.channels.consumers.Group') as Group:
+            consumers.connect_auto_advance(message, params)
+        Group.assert_any_call(
+            'session-{}'.format(self.participant.session_id))
+        self.assertNotIn(
+            (('session-{}'.format(self.participant.session_id + 1),),),
+            Group.call_args_list)
+
+    def test_unknown_participant_not_subscribed(self):
+        message = Mock()
+        with patch('otree.channels.consumers.Group') as Group:
+            consumers.connect_auto_advance(message, 'abc,3,5')
+        Group.assert_called_once_with('auto-advance-abc')
+
+    def test_params_from_page_opened_before_deploy(self):
+        # 2 fields, from pages rendered before the session was in the URL
+        message = Mock()
+        with patch('otree.channels.consumers.Group') as Group:
+            consumers.disconnect_auto_advance(message, 'abc,3')
+        Group.assert_called_once_with('auto-advance-abc')
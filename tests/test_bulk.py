@@ -0,0 +1,143 @@
+import signal
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test.utils import override_settings
+from mock import Mock, patch
+
+from otree.common import Currency as c
+from otree.db.bulk import (
+    BulkCreateBuffer, bulk_save, bulk_update, flush_all_buffers,
+    install_sigterm_handler)
+from otree.models_concrete import PageCompletion
+
+from .base import TestCase
+from .simple_game.models import Player
+from .utils import capture_stdout
+
+
+def make_completion(page_index):
+    return PageCompletion(
+        app_name='tests.simple_game', page_index=page_index,
+        page_name='MyPage', time_stamp=0, seconds_on_page=1,
+        subsession_pk=1, participant_pk=1, session_pk=1,
+        auto_submitted=False)
+
+
+class TestBulkCreateBuffer(TestCase):
+
+    def test_flush_when_full(self):
+        buffer = BulkCreateBuffer(PageCompletion, max_size=3, max_seconds=60)
+        buffer.add(make_completion(1))
+        buffer.add(make_completion(2))
+        self.assertEqual(PageCompletion.objects.count(), 0)
+        self.assertEqual(len(buffer), 2)
+        buffer.add(make_completion(3))
+        self.assertEqual(PageCompletion.objects.count(), 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_explicit_flush(self):
+        buffer = BulkCreateBuffer(PageCompletion, max_size=10, max_seconds=60)
+        buffer.add(make_completion(1))
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(PageCompletion.objects.count(), 1)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_one_insert_per_batch(self):
+        # unbuffered, each completion is its own INSERT
+        with self.assertNumQueries(20):
+            for i in range(20):
+                make_completion(i).save()
+
+        buffer = BulkCreateBuffer(PageCompletion, max_size=20, max_seconds=60)
+        with self.assertNumQueries(1):
+            for i in range(20):
+                buffer.add(make_completion(i))
+        self.assertEqual(PageCompletion.objects.count(), 40)
+
+
+class TestSigtermHandler(TestCase):
+
+    def install(self, previous_handler):
+        with patch('signal.getsignal', return_value=previous_handler), \
+                patch('signal.signal') as set_handler:
+            install_sigterm_handler()
+        return set_handler
+
+    def test_exits_then_atexit_flushes(self):
+        buffer = BulkCreateBuffer(PageCompletion, max_size=10, max_seconds=60)
+        buffer.add(make_completion(1))
+        set_handler = self.install(signal.SIG_DFL)
+        (signum, handler), kwargs = set_handler.call_args
+        self.assertEqual(signum, signal.SIGTERM)
+
+        # nothing is written from the signal handler
+        with self.assertNumQueries(0):
+            with self.assertRaises(SystemExit):
+                handler(signal.SIGTERM, None)
+        self.assertEqual(len(buffer), 1)
+        flush_all_buffers()
+        self.assertEqual(PageCompletion.objects.count(), 1)
+
+    def test_keeps_server_handler(self):
+        set_handler = self.install(Mock())
+        self.assertFalse(set_handler.called)
+
+    @override_settings(PAGE_COMPLETION_BUFFER_SIZE=0)
+    def test_not_installed_without_buffering(self):
+        with patch('otree.db.bulk.install_sigterm_handler') as install:
+            apps.get_app_config('otree').setup_flush_buffers_on_sigterm()
+        self.assertFalse(install.called)
+
+
+class TestBulkUpdate(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "5")
+        self.players = list(Player.objects.order_by('pk'))
+
+    def test_bulk_update(self):
+        payoffs = {p.pk: c(i) for i, p in enumerate(self.players)}
+        with self.assertNumQueries(1):
+            bulk_update(Player.objects.all(), {
+                'payoff': payoffs,
+                # only some of the rows
+                'my_field': {self.players[0].pk: c(7)}})
+        for player in Player.objects.order_by('pk'):
+            self.assertEqual(player.payoff, payoffs[player.pk])
+        self.assertEqual(
+            [p.my_field for p in Player.objects.order_by('pk')],
+            [c(7), None, None, None, None])
+
+    def test_bulk_save_only_writes_changes(self):
+        self.players[1].payoff = c(3)
+        self.players[3].payoff = c(4)
+        with self.assertNumQueries(1):
+            bulk_save(self.players)
+        self.assertEqual(
+            [p.payoff for p in Player.objects.order_by('pk')],
+            [None, c(3), None, c(4), None])
+        self.assertFalse(self.players[1]._changed_fields)
+        with self.assertNumQueries(0):
+            bulk_save(self.players)
+
+    def test_bulk_save_runs_save_override(self):
+        self.players[1].payoff = c(3)
+        with patch.object(Player, 'save') as save:
+            bulk_save(self.players)
+        # every instance, like the per-instance saves it replaced
+        self.assertEqual(save.call_count, len(self.players))
+
+    def test_bulk_save_runs_signal_receivers(self):
+        receiver = Mock()
+        post_save.connect(receiver, sender=Player, weak=False)
+        try:
+            self.players[1].payoff = c(3)
+            bulk_save(self.players)
+        finally:
+            post_save.disconnect(receiver, sender=Player)
+        self.assertEqual(receiver.call_count, len(self.players))
+        self.assertEqual(
+            Player.objects.get(pk=self.players[1].pk).payoff, c(3))
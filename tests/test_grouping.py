@@ -0,0 +1,186 @@
+import unittest
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from otree.models import Session
+
+from .multi_player_game import models as mpg_models
+from .utils import capture_stdout
+from .base import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestSetGroups(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        self.subsession = mpg_models.Subsession.objects.get(
+            session=Session.objects.get(), round_number=1)
+
+    def group_matrix(self):
+        return [
+            [p.pk for p in group.get_players()]
+            for group in self.subsession.get_groups()]
+
+    def test_reuses_groups(self):
+        group_pks = [g.pk for g in self.subsession.get_groups()]
+        players = self.subsession.get_players()
+        matrix = [players[6:], players[3:6], players[:3]]
+        self.subsession.set_groups(matrix)
+
+        # each group keeps its players, and gets their new position
+        self.assertEqual(
+            [g.pk for g in self.subsession.get_groups()], group_pks[::-1])
+        self.assertEqual(
+            self.group_matrix(), [[p.pk for p in row] for row in matrix])
+        # the instances that were passed are up to date
+        self.assertEqual(players[6].id_in_group, 1)
+        self.assertEqual(players[6].group.id_in_subsession, 1)
+        self.assertFalse(players[6]._changed_fields)
+
+    def test_changed_groups_are_new(self):
+        groups = self.subsession.get_groups()
+        for group in groups:
+            group.in_all_groups_wait_page = 5
+            group.save()
+        players = self.subsession.get_players()
+        # swap 2 players of the first 2 groups
+        matrix = [
+            [players[3]] + players[1:3],
+            [players[0]] + players[4:6],
+            players[6:]]
+        self.subsession.set_groups(matrix)
+
+        new_groups = self.subsession.get_groups()
+        self.assertEqual(new_groups[2].pk, groups[2].pk)
+        self.assertEqual(new_groups[2].in_all_groups_wait_page, 5)
+        for group in new_groups[:2]:
+            self.assertNotIn(group.pk, [g.pk for g in groups])
+            # the data of the old group was the old players'
+            self.assertEqual(group.in_all_groups_wait_page, 0)
+        self.assertEqual(
+            [g.id_in_subsession for g in new_groups], [1, 2, 3])
+        self.assertEqual(mpg_models.Group.objects.filter(
+            subsession=self.subsession).count(), 3)
+        self.assertEqual(
+            self.group_matrix(), [[p.pk for p in row] for row in matrix])
+
+    def test_new_number_of_groups(self):
+        players = self.subsession.get_players()
+        matrix = [players[:4], players[4:]]
+        self.subsession.set_groups(matrix)
+
+        groups = self.subsession.get_groups()
+        self.assertEqual([g.id_in_subsession for g in groups], [1, 2])
+        self.assertEqual(mpg_models.Group.objects.filter(
+            subsession=self.subsession).count(), 2)
+        self.assertEqual(
+            self.group_matrix(), [[p.pk for p in row] for row in matrix])
+
+    def test_queries_dont_grow_with_players(self):
+        players = self.subsession.get_players()
+        group_pks = [g.pk for g in self.subsession.get_groups()]
+        with CaptureQueriesContext(connection) as captured:
+            self.subsession.set_groups(
+                [players[6:], players[3:6], players[:3]])
+        # the groups are reused
+        self.assertEqual(
+            sorted(g.pk for g in self.subsession.get_groups()),
+            sorted(group_pks))
+        # get groups, one UPDATE of the players, integrity check,
+        # one UPDATE of the groups' id_in_subsession
+        self.assertLessEqual(len(captured), 5)
+
+    def test_queries_same_groups(self):
+        groups = self.subsession.get_groups()
+        with CaptureQueriesContext(connection) as captured:
+            self.subsession.set_groups(groups)
+        # get players of each group, get groups, one UPDATE,
+        # integrity check
+        self.assertLessEqual(len(captured), 7)
+
+
+class TestGroupLikeRound(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        session = Session.objects.get()
+        self.round_1 = mpg_models.Subsession.objects.get(
+            session=session, round_number=1)
+        self.round_2 = mpg_models.Subsession.objects.get(
+            session=session, round_number=2)
+
+    def participant_matrix(self, subsession):
+        return [
+            [p.participant_id for p in group.get_players()]
+            for group in subsession.get_groups()]
+
+    def test_group_like_round(self):
+        players = self.round_1.get_players()
+        self.round_1.set_groups([players[6:], players[3:6], players[:3]])
+
+        with CaptureQueriesContext(connection) as captured:
+            self.round_2.group_like_round(1)
+        # doesn't depend on the number of players
+        self.assertLessEqual(len(captured), 6)
+
+        self.assertEqual(
+            self.participant_matrix(self.round_2),
+            self.participant_matrix(self.round_1))
+
+
+class TestGroupMatrix(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        self.subsession = mpg_models.Subsession.objects.get(
+            session=Session.objects.get(), round_number=1)
+
+    def participant_matrix(self):
+        return [
+            [p.participant_id for p in group.get_players()]
+            for group in self.subsession.get_groups()]
+
+    def test_get_group_matrix(self):
+        with self.assertNumQueries(1):
+            matrix = self.subsession.get_group_matrix()
+        self.assertEqual(
+            [[p.participant_id for p in row] for row in matrix],
+            self.participant_matrix())
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_as_array(self):
+        array = self.subsession.get_group_matrix(as_array=True)
+        self.assertEqual(array.shape, (3, 3))
+        self.assertEqual(array.tolist(), self.participant_matrix())
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_set_group_matrix(self):
+        array = self.subsession.get_group_matrix(as_array=True)
+        # rotate the second column by one group
+        array[:, 1] = numpy.roll(array[:, 1], 1)
+        with CaptureQueriesContext(connection) as captured:
+            self.subsession.set_group_matrix(array)
+        self.assertLessEqual(len(captured), 7)
+        self.assertEqual(self.participant_matrix(), array.tolist())
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_set_group_matrix_validates(self):
+        array = self.subsession.get_group_matrix(as_array=True)
+        duplicate = array.copy()
+        duplicate[0, 0] = duplicate[0, 1]
+        with self.assertRaises(ValueError):
+            self.subsession.set_group_matrix(duplicate)
+        with self.assertRaises(ValueError):
+            self.subsession.set_group_matrix(array.ravel())
+        with self.assertRaises(ValueError):
+            self.subsession.set_group_matrix(array.astype(float))
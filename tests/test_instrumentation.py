@@ -0,0 +1,68 @@
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import override_settings
+
+from otree import constants_internal, instrumentation
+from otree.models.participant import Participant
+
+from .simple_game.views import MyPage
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestPageStats(TestCase):
+
+    def test_aggregates(self):
+        stats = instrumentation.PageStats('MyPage')
+        for queries in range(1, 21):
+            measurement = instrumentation.PageMeasurement(MyPage())
+            measurement.queries = queries
+            stats.record(measurement)
+        rows = {row[0]: row[1:] for row in stats.as_rows()}
+        mean, p95, maximum = rows['queries']
+        self.assertEqual(mean, 10.5)
+        self.assertEqual(p95, 19)
+        self.assertEqual(maximum, 20)
+
+    def test_over_budget(self):
+        page = MyPage()
+        page.query_budget = 5
+        measurement = instrumentation.PageMeasurement(page)
+        measurement.queries = 6
+        self.assertTrue(measurement.over_budget)
+        measurement.queries = 5
+        self.assertFalse(measurement.over_budget)
+
+
+class TestPageInstrumentation(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+        instrumentation.reset()
+
+    @override_settings(PAGE_INSTRUMENTATION=True)
+    def test_header_and_stats(self):
+        response = Client().get(self.participant._start_url(), follow=True)
+        header = response[constants_internal.page_stats_http_header]
+        self.assertIn('queries=', header)
+        self.assertIn('lock_wait_ms=', header)
+        page_names = [
+            stats.page_name for stats in instrumentation.get_page_stats()]
+        self.assertIn('MyPage', page_names)
+
+    def test_disabled_by_default(self):
+        response = Client().get(self.participant._start_url(), follow=True)
+        self.assertNotIn(constants_internal.page_stats_http_header, response)
+        self.assertEqual(instrumentation.get_page_stats(), [])
+
+    def test_query_budget_exceeded(self):
+        MyPage.query_budget = 0
+        try:
+            response = Client().get(
+                self.participant._start_url(), follow=True)
+        finally:
+            MyPage.query_budget = None
+        self.assertIn(
+            constants_internal.query_budget_exceeded_http_header, response)
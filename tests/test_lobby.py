@@ -0,0 +1,96 @@
+from django.core.management import call_command
+from mock import patch
+
+from otree.lobby import form_groups
+from otree.models import Session
+from otree.models_concrete import LobbyArrival, PairHistory
+import otree.readiness
+
+from .multi_player_game import models as mpg_models
+from .utils import capture_stdout
+from .base import TestCase
+
+
+PAGE_INDEX = 1
+
+
+class TestFormGroups(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        self.session = Session.objects.get()
+        self.participants = list(
+            self.session.get_participants().order_by('id_in_session'))
+        patcher = patch('otree.channels.broadcast.Group')
+        self.Group = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def arrive(self, *indexes):
+        for index in indexes:
+            LobbyArrival.objects.create(
+                session_pk=self.session.pk,
+                page_index=PAGE_INDEX,
+                participant_pk=self.participants[index].pk)
+
+    def form_groups(self):
+        return form_groups(
+            'tests.multi_player_game', self.session.pk, 1, PAGE_INDEX)
+
+    def participant_pks(self, group):
+        return [p.participant_id for p in group.player_set.order_by(
+            'id_in_group')]
+
+    def test_waits_for_a_full_group(self):
+        self.arrive(0, 4)
+        self.assertEqual(self.form_groups(), [])
+        self.assertFalse(LobbyArrival.objects.filter(
+            group_pk__isnull=False).exists())
+        self.assertFalse(self.Group.called)
+
+    def test_in_order_of_arrival(self):
+        self.arrive(8, 0, 4, 5)
+        [group] = self.form_groups()
+        expected = [self.participants[i].pk for i in (8, 0, 4)]
+        self.assertEqual(self.participant_pks(group), expected)
+        self.assertEqual(group.id_in_subsession, 4)
+        # and in the later round
+        group_2 = mpg_models.Group.objects.get(
+            round_number=2, id_in_subsession=4)
+        self.assertEqual(self.participant_pks(group_2), expected)
+
+        # the 4th is still waiting
+        self.assertIsNone(LobbyArrival.objects.get(
+            participant_pk=self.participants[5].pk).group_pk)
+        self.assertEqual(self.Group.call_count, 3)
+        self.assertTrue(otree.readiness.is_ready(
+            self.session.pk, PAGE_INDEX, 'lobby', self.participants[8].pk))
+        self.assertFalse(otree.readiness.is_ready(
+            self.session.pk, PAGE_INDEX, 'lobby', self.participants[5].pk))
+
+    def test_empty_groups_deleted(self):
+        # the first group of the session
+        self.arrive(0, 1, 2)
+        self.form_groups()
+        for round_number in [1, 2]:
+            self.assertEqual(
+                [g.id_in_subsession for g in mpg_models.Group.objects.filter(
+                    round_number=round_number).order_by('id_in_subsession')],
+                [2, 3, 4])
+
+    def test_several_groups(self):
+        self.arrive(*range(7))
+        self.assertEqual(len(self.form_groups()), 2)
+        subsession = mpg_models.Subsession.objects.get(round_number=1)
+        subsession.check_group_integrity()
+
+    def test_pair_history(self):
+        round_2 = mpg_models.Subsession.objects.get(round_number=2)
+        a, b = self.participants[0].pk, self.participants[3].pk
+        self.assertEqual(PairHistory.for_subsession(round_2).count(a, b), 0)
+        self.arrive(0, 3, 6)
+        self.form_groups()
+        # round 1 is counted again
+        history = PairHistory.for_subsession(round_2)
+        self.assertEqual(history.count(a, b), 1)
+        self.assertEqual(history.count(a, self.participants[1].pk), 0)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import Http404
+from django.test import TransactionTestCase
+from mock import patch
+
+from otree import locks
+from otree.models import Participant, Session
+from otree.models_concrete import ParticipantLockModel, ScopedLockModel
+
+from .base import IDMapTestCaseMixin, TestCase
+from .simple_game import models as sg_models
+from .utils import capture_stdout
+
+
+class TestInProcessLockBackend(TestCase):
+
+    def setUp(self):
+        self.backend = locks.InProcessLockBackend()
+
+    def test_same_participant_is_serialized(self):
+        events = []
+
+        def hold_lock():
+            with self.backend.participant_lock('abc'):
+                events.append('start')
+                time.sleep(0.1)
+                events.append('end')
+
+        threads = [threading.Thread(target=hold_lock) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(events, ['start', 'end'] * 3)
+        stats = self.backend.stats['participant'].as_dict()
+        self.assertEqual(stats['acquisitions'], 3)
+        # the last thread waited for the 2 others
+        self.assertGreaterEqual(stats['max_wait'], 0.15)
+
+    def test_different_participants_dont_wait(self):
+        with self.backend.participant_lock('abc'):
+            with self.backend.participant_lock('def') as wait:
+                self.assertLess(wait, 0.05)
+
+    def test_lock_released_on_exception(self):
+        with self.assertRaises(ValueError):
+            with self.backend.participant_lock('abc'):
+                raise ValueError()
+        with self.backend.participant_lock('abc') as wait:
+            self.assertLess(wait, 0.05)
+
+
+class TestScopedLockThroughput(TestCase):
+    """each "session" runs requests that hold its scoped lock for a
+    short while. Since sessions don't share a scope, throughput should
+    grow about linearly with the number of concurrent sessions.
+
+    """
+
+    hold_seconds = 0.02
+    requests_per_session = 5
+
+    def throughput(self, backend, num_sessions):
+        def run_session(scope):
+            for _ in range(self.requests_per_session):
+                with backend.scoped_lock(scope):
+                    time.sleep(self.hold_seconds)
+
+        threads = [
+            threading.Thread(
+                target=run_session, args=('session-{}'.format(i),))
+            for i in range(num_sessions)]
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start_time
+        return num_sessions * self.requests_per_session / elapsed
+
+    def test_near_linear_throughput(self):
+        backend = locks.InProcessLockBackend()
+        single = self.throughput(backend, 1)
+        eight = self.throughput(backend, 8)
+        self.assertGreater(eight, 4 * single)
+
+    def test_same_scope_is_serialized(self):
+        backend = locks.InProcessLockBackend()
+        events = []
+
+        def hold_lock():
+            with backend.scoped_lock('session-1'):
+                events.append('start')
+                time.sleep(0.05)
+                events.append('end')
+
+        threads = [threading.Thread(target=hold_lock) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(events, ['start', 'end'] * 3)
+
+
+class TestTableLockBackend(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+        self.backend = locks.TableLockBackend()
+
+    def test_lock_and_release(self):
+        code = self.participant.code
+        with self.backend.participant_lock(code):
+            lock = ParticipantLockModel.objects.get(participant_code=code)
+            self.assertTrue(lock.locked)
+        lock = ParticipantLockModel.objects.get(participant_code=code)
+        self.assertFalse(lock.locked)
+        self.assertEqual(
+            self.backend.stats['participant'].as_dict()['acquisitions'], 1)
+
+    def test_scoped_lock(self):
+        scope = locks.lock_scope(Session.objects.get())
+        self.assertEqual(scope, 'otree.session-{}'.format(
+            Session.objects.get().pk))
+        with self.backend.scoped_lock(scope):
+            self.assertTrue(ScopedLockModel.objects.get(scope=scope).locked)
+        self.assertFalse(ScopedLockModel.objects.get(scope=scope).locked)
+        self.assertEqual(
+            self.backend.stats['scoped'].as_dict()['acquisitions'], 1)
+
+    def test_scopes_created_with_session(self):
+        session = Session.objects.get()
+        subsession = sg_models.Subsession.objects.get()
+        self.assertEqual(
+            set(ScopedLockModel.objects.filter(
+                session_pk=session.pk).values_list('scope', flat=True)),
+            {locks.lock_scope(session), locks.lock_scope(subsession)})
+        # one UPDATE to lock, one to unlock
+        with self.assertNumQueries(2):
+            with self.backend.scoped_lock(locks.lock_scope(subsession)):
+                pass
+
+    def test_missing_scope_is_created(self):
+        session = Session.objects.get()
+        with self.backend.scoped_lock('my_scope', session_pk=session.pk):
+            self.assertTrue(
+                ScopedLockModel.objects.get(scope='my_scope').locked)
+        session.delete()
+        self.assertFalse(ScopedLockModel.objects.exists())
+
+    def test_missing_participant(self):
+        with self.assertRaises(Http404):
+            with self.backend.participant_lock('nonexistent'):
+                pass
+
+
+class TestSelectForUpdateLockBackend(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.backend = locks.SelectForUpdateLockBackend()
+
+    def test_scoped_lock(self):
+        with self.backend.scoped_lock(
+                locks.lock_scope(Session.objects.get())):
+            pass
+        self.assertEqual(
+            self.backend.stats['scoped'].as_dict()['acquisitions'], 1)
+
+    def test_missing_scope_is_created(self):
+        session_pk = Session.objects.get().pk
+        with self.backend.scoped_lock('my_scope', session_pk=session_pk):
+            self.assertEqual(
+                ScopedLockModel.objects.get(scope='my_scope').session_pk,
+                session_pk)
+
+
+class TestDatabaseScopedLockThroughput(IDMapTestCaseMixin,
+                                       TransactionTestCase):
+    """TestScopedLockThroughput, with the backends that lock in the
+    database. each thread has its own connection.
+
+    """
+
+    hold_seconds = 0.02
+    requests_per_session = 5
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('needs Postgres (row locks from many threads)')
+        with capture_stdout():
+            for _ in range(8):
+                call_command('create_session', 'simple_game', "1")
+        self.sessions = list(Session.objects.order_by('pk'))
+
+    def throughput(self, backend, num_sessions):
+        def run_session(session):
+            try:
+                for _ in range(self.requests_per_session):
+                    with locks.get_lock_backend(backend).scoped_lock(
+                            locks.lock_scope(session)):
+                        time.sleep(self.hold_seconds)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run_session, args=(session,))
+            for session in self.sessions[:num_sessions]]
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start_time
+        return num_sessions * self.requests_per_session / elapsed
+
+    def check_near_linear_throughput(self, backend):
+        single = self.throughput(backend, 1)
+        eight = self.throughput(backend, 8)
+        self.assertGreater(eight, 4 * single)
+
+    def test_table(self):
+        self.check_near_linear_throughput('table')
+
+    def test_select_for_update(self):
+        self.check_near_linear_throughput('select_for_update')
+
+
+class TestLockTimeouts(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+        patcher = patch.object(locks, 'LOCK_TIMEOUT', 0.2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_advisory_gives_up(self):
+        with patch('otree.locks.connection') as connection:
+            connection.vendor = 'postgresql'
+            cursor = connection.cursor.return_value.__enter__.return_value
+            # someone else holds the lock
+            cursor.fetchone.return_value = (False,)
+            backend = locks.AdvisoryLockBackend()
+            start_time = time.time()
+            with self.assertRaisesRegexp(Exception, 'is stuck'):
+                with backend.participant_lock(self.participant.code):
+                    pass
+        self.assertLess(time.time() - start_time, 2)
+
+    def test_select_for_update_gives_up(self):
+        backend = locks.SelectForUpdateLockBackend()
+
+        def lock_wait_timeout():
+            raise OperationalError('canceling statement due to lock timeout')
+
+        with patch('otree.locks.database_lock_timeout', lock_wait_timeout):
+            with self.assertRaisesRegexp(Exception, 'is stuck'):
+                with backend.participant_lock(self.participant.code):
+                    pass
+            with self.assertRaisesRegexp(Exception, 'is stuck'):
+                with backend.scoped_lock('scope'):
+                    pass
+
+
+class TestGetLockBackend(TestCase):
+
+    def test_same_instance(self):
+        self.assertIs(
+            locks.get_lock_backend('inprocess'),
+            locks.get_lock_backend('inprocess'))
+
+    def test_default(self):
+        self.assertIsInstance(
+            locks.get_lock_backend(), locks.TableLockBackend)
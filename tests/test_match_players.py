@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import itertools
+import random
+import time
 
 from mock import patch
 
@@ -10,10 +13,12 @@ import six
 from django.core.management import call_command
 
 from otree.models import Session
+from otree.models_concrete import PairCount, PairHistory
 from otree import match_players
 
 from .base import TestCase
 from .multi_player_game import models as mpg_models
+from .utils import capture_stdout
 
 
 class TestMatchPlayers(TestCase):
@@ -104,3 +109,122 @@ class TestMatchPlayers(TestCase):
 
         self.assert_aliases(match_players.players_reversed, names)
         self.assert_matchs(names, validator)
+
+
+class TestPerfectStrangers(TestCase):
+
+    def add_to_history(self, counts, groups):
+        for group in groups:
+            for a, b in itertools.permutations(group, 2):
+                counts[a][b] += 1
+
+    def test_grid_never_repeats(self):
+        # 61 groups of 3 (61 is prime): 61 rounds without repeats
+        first_round = [list(range(i * 3, i * 3 + 3)) for i in range(61)]
+        counts = collections.defaultdict(collections.Counter)
+        for round_number in range(1, 62):
+            groups = match_players.strangers_grid(first_round, round_number)
+            self.assertEqual(match_players.count_repeats(groups, counts), 0)
+            self.add_to_history(counts, groups)
+
+    def test_grid_conditions(self):
+        # 4 groups: not prime
+        first_round = [[1, 2], [3, 4], [5, 6], [7, 8]]
+        self.assertIsNone(match_players.strangers_grid(first_round, 2))
+        # more rounds than groups
+        first_round = [[1, 2], [3, 4], [5, 6]]
+        self.assertIsNone(match_players.strangers_grid(first_round, 4))
+
+    def test_greedy_2000_players(self):
+        participant_ids = list(range(2000))
+        counts = collections.defaultdict(collections.Counter)
+        start_time = time.time()
+        for round_number in range(10):
+            random.shuffle(participant_ids)
+            groups = match_players.greedy_strangers(
+                participant_ids, [4] * 500, counts)
+            self.assertEqual(match_players.count_repeats(groups, counts), 0)
+            self.add_to_history(counts, groups)
+        self.assertLess(time.time() - start_time, 10)
+
+    def test_round_robin_in_session(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        subsession = mpg_models.Subsession.objects.get(round_number=2)
+        groups = match_players.round_robin(subsession)
+        counts = match_players.pair_history(subsession)
+        participant_groups = [
+            [p.participant_id for p in group] for group in groups]
+        self.assertEqual(
+            match_players.count_repeats(participant_groups, counts), 0)
+
+
+class TestPairHistory(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "6")
+        self.subsessions = list(
+            mpg_models.Subsession.objects.order_by('round_number'))
+
+    def participant_groups(self, subsession):
+        return [
+            [p.participant_id for p in group.get_players()]
+            for group in subsession.get_groups()]
+
+    def test_not_built_until_asked(self):
+        self.assertFalse(PairHistory.objects.exists())
+
+    def test_counts_previous_rounds(self):
+        history = PairHistory.for_subsession(self.subsessions[1])
+        self.assertEqual(history.through_round, 1)
+        group, other_group = self.participant_groups(self.subsessions[0])
+        self.assertEqual(history.count(group[0], group[1]), 1)
+        self.assertEqual(history.count(group[1], group[0]), 1)
+        self.assertEqual(history.count(group[0], other_group[0]), 0)
+
+    def test_counts_only_new_rounds(self):
+        history = PairHistory.for_subsession(self.subsessions[1])
+        # both rounds are grouped like round 1 at session creation
+        history._count_rounds(self.subsessions[1], 2)
+        a, b = self.participant_groups(self.subsessions[0])[0][:2]
+        self.assertEqual(history.count(a, b), 2)
+        self.assertEqual(PairHistory.objects.get().through_round, 2)
+
+    def test_regrouping_counted_round(self):
+        PairHistory.for_subsession(self.subsessions[1])
+        subsession = self.subsessions[0]
+        matrix = [group.get_players() for group in subsession.get_groups()]
+        # swap the first players of the two groups in round 1
+        matrix[0][0], matrix[1][0] = matrix[1][0], matrix[0][0]
+        subsession.set_groups(matrix)
+        self.assertEqual(PairHistory.objects.get().through_round, 0)
+
+        history = PairHistory.for_subsession(self.subsessions[1])
+        groups = self.participant_groups(subsession)
+        moved, stayed = groups[0][0], groups[0][1]
+        self.assertEqual(history.count(moved, stayed), 1)
+        self.assertEqual(history.count(moved, groups[1][1]), 0)
+
+    def test_same_partners_not_regrouped(self):
+        PairHistory.for_subsession(self.subsessions[1])
+        subsession = self.subsessions[0]
+        matrix = [group.get_players() for group in subsession.get_groups()]
+        subsession.set_groups(
+            [list(reversed(players)) for players in reversed(matrix)])
+        self.assertEqual(PairHistory.objects.get().through_round, 1)
+
+    def test_counts(self):
+        history = PairHistory.for_subsession(self.subsessions[1])
+        counts = history.counts()
+        group = self.participant_groups(self.subsessions[0])[0]
+        self.assertEqual(counts[group[0]][group[1]], 1)
+        self.assertEqual(counts[group[1]][group[0]], 1)
+        self.assertEqual(counts, match_players.pair_history(
+            self.subsessions[1]))
+
+    def test_deleted_with_session(self):
+        PairHistory.for_subsession(self.subsessions[1])
+        Session.objects.get().delete()
+        self.assertFalse(PairHistory.objects.exists())
+        self.assertFalse(PairCount.objects.exists())
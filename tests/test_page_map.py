@@ -0,0 +1,63 @@
+from django.core.management import call_command
+
+from otree.models.participant import Participant
+from otree.page_map import get_page_map
+
+from .simple_game import views as sg_views
+from .single_player_game import views as spg_views
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestPageMap(TestCase):
+
+    def setUp(self):
+        self.page_map = get_page_map(
+            ['tests.simple_game', 'tests.single_player_game'])
+
+    def test_max_page_index(self):
+        self.assertEqual(
+            self.page_map.max_page_index,
+            len(sg_views.page_sequence) + len(spg_views.page_sequence))
+
+    def test_locate(self):
+        location = self.page_map.locate(1)
+        self.assertEqual(location.app_name, 'tests.simple_game')
+        self.assertEqual(location.round_number, 1)
+        self.assertEqual(location.Page, sg_views.page_sequence[0])
+
+        location = self.page_map.locate(len(sg_views.page_sequence) + 1)
+        self.assertEqual(location.app_name, 'tests.single_player_game')
+        self.assertEqual(location.Page, spg_views.page_sequence[0])
+
+    def test_out_of_range(self):
+        with self.assertRaises(IndexError):
+            self.page_map.locate(0)
+        with self.assertRaises(IndexError):
+            self.page_map.locate(self.page_map.max_page_index + 1)
+
+    def test_cached(self):
+        self.assertIs(
+            self.page_map,
+            get_page_map(['tests.simple_game', 'tests.single_player_game']))
+
+
+class TestParticipantPages(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'two_simple_games', "1")
+        self.participant = Participant.objects.get()
+
+    def test_max_page_index_set_on_creation(self):
+        self.assertEqual(
+            self.participant._max_page_index,
+            self.participant._page_map().max_page_index)
+
+    def test_url_i_should_be_on(self):
+        participant = self.participant
+        participant._index_in_pages = len(sg_views.page_sequence) + 1
+        self.assertEqual(
+            participant._url_i_should_be_on(),
+            spg_views.page_sequence[0].url(
+                participant, participant._index_in_pages))
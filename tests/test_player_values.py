@@ -0,0 +1,102 @@
+import unittest
+
+from django.core.management import call_command
+
+from otree.common import Currency
+
+from .multi_player_game import models as mpg_models
+from .utils import capture_stdout
+from .base import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestPlayerValues(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "9")
+        self.subsession = mpg_models.Subsession.objects.get(round_number=1)
+
+    def reload_players(self):
+        return list(mpg_models.Player.objects.filter(
+            subsession=self.subsession).order_by('pk'))
+
+    def test_player_order(self):
+        ids = self.subsession.player_values('id_in_group')
+        self.assertEqual(ids.dtype.kind, 'i')
+        self.assertEqual(
+            ids.tolist(),
+            [p.id_in_group for p in self.subsession.get_players()])
+
+    def test_none_is_nan(self):
+        values = self.subsession.player_values('from_other_player')
+        self.assertTrue(numpy.isnan(values).all())
+
+    def test_set_currency(self):
+        payoffs = numpy.arange(9) * 1.5
+        with self.assertNumQueries(2):
+            # get_players, and one UPDATE
+            self.subsession.set_player_values('payoff', payoffs)
+
+        for player, payoff in zip(self.reload_players(), payoffs):
+            self.assertEqual(player.payoff, Currency(payoff))
+            self.assertIsInstance(player.payoff, Currency)
+        # the players in memory are up to date, with nothing left to save
+        player = self.subsession.get_players()[1]
+        self.assertEqual(player.payoff, Currency(1.5))
+        self.assertFalse(player._changed_fields)
+
+        self.assertEqual(
+            self.subsession.player_values('payoff').tolist(),
+            payoffs.tolist())
+
+    def test_nan_sets_none(self):
+        values = numpy.full(9, numpy.nan)
+        values[0] = 1
+        self.subsession.set_player_values('in_all_groups_wait_page', values)
+        players = self.reload_players()
+        self.assertEqual(players[0].in_all_groups_wait_page, 1)
+        self.assertIsNone(players[1].in_all_groups_wait_page)
+
+    def test_public_goods(self):
+        contributions = numpy.array([0, 10, 20] * 3)
+        self.subsession.set_player_values('payoff', contributions)
+        group_ids = self.subsession.player_values('group_id')
+        _, group_index = numpy.unique(group_ids, return_inverse=True)
+        totals = numpy.bincount(group_index, weights=contributions)
+        shares = totals[group_index] * 2 / 3
+        self.subsession.set_player_values(
+            'payoff', 100 - contributions + shares)
+        payoffs = [p.payoff for p in self.reload_players()]
+        self.assertEqual(sum(payoffs), Currency(3 * (300 - 30 + 60)))
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            self.subsession.set_player_values('payoff', numpy.zeros(8))
+
+    def test_float_in_integer_field(self):
+        values = numpy.arange(9) * 1.5
+        with self.assertRaises(ValueError):
+            self.subsession.set_player_values('id_in_group', values)
+        # nothing was written
+        self.assertEqual(
+            [p.id_in_group for p in self.reload_players()],
+            [p.id_in_group for p in self.subsession.get_players()])
+
+    def test_whole_floats_in_integer_field(self):
+        values = numpy.arange(1, 10, dtype=float)
+        self.subsession.set_player_values('id_in_group', values)
+        ids = [p.id_in_group for p in self.reload_players()]
+        self.assertEqual(ids, list(range(1, 10)))
+        self.assertIsInstance(ids[0], int)
+
+    def test_invalid_value(self):
+        # out of the range of a PositiveIntegerField
+        values = numpy.arange(9) - 1
+        with self.assertRaises(ValueError):
+            self.subsession.set_player_values('id_in_group', values)
@@ -0,0 +1,81 @@
+from django.core.management import call_command
+from django.db import connections
+from mock import patch
+
+from otree import readiness
+from otree.models import Session
+from otree.models_concrete import CompletedGroupWaitPage
+
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestReadinessCache(TestCase):
+
+    def setUp(self):
+        readiness._ready.clear()
+
+    def test_positive_answers_cached(self):
+        self.assertFalse(readiness.is_ready(1, 2, 'group', 3))
+        CompletedGroupWaitPage.objects.create(
+            session_pk=1, page_index=2, group_pk=3,
+            after_all_players_arrive_run=True)
+        # tests run in a transaction
+        with patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertTrue(readiness.is_ready(1, 2, 'group', 3))
+        with self.assertNumQueries(0):
+            self.assertTrue(readiness.is_ready(1, 2, 'group', 3))
+            # params from websocket URLs are strings
+            self.assertTrue(readiness.is_ready('1', '2', 'group', '3'))
+
+    def test_not_cached_in_transaction(self):
+        CompletedGroupWaitPage.objects.create(
+            session_pk=1, page_index=2, group_pk=3,
+            after_all_players_arrive_run=True)
+        self.assertTrue(readiness.is_ready(1, 2, 'group', 3))
+        self.assertEqual(len(readiness._ready), 0)
+
+    def test_not_run_yet(self):
+        CompletedGroupWaitPage.objects.create(
+            session_pk=1, page_index=2, group_pk=3,
+            after_all_players_arrive_run=False)
+        self.assertFalse(readiness.is_ready(1, 2, 'group', 3))
+
+    def test_mark_ready(self):
+        readiness.mark_ready(1, 2, 'subsession', 4)
+        with self.assertNumQueries(0):
+            self.assertTrue(readiness.is_ready(1, 2, 'subsession', 4))
+
+    def test_bounded(self):
+        for page_index in range(readiness.MAX_CACHED + 10):
+            readiness.mark_ready(1, page_index, 'group', 3)
+        self.assertEqual(len(readiness._ready), readiness.MAX_CACHED)
+        self.assertFalse(readiness.is_ready(1, 0, 'group', 3))
+
+    def test_session_delete_invalidates(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        session = Session.objects.get()
+        readiness.mark_ready(session.pk, 2, 'group', 3)
+        readiness.mark_ready(session.pk + 1, 2, 'group', 3)
+        session.delete()
+        self.assertEqual(
+            list(readiness._ready), [(session.pk + 1, 2, 'group', 3)])
+
+    def test_regrouping_invalidates_groups(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "6")
+        session = Session.objects.get()
+        subsession = session.get_subsessions()[0]
+        readiness.mark_ready(session.pk, 2, 'group', 3)
+        readiness.mark_ready(session.pk, 2, 'subsession', 4)
+
+        # same partners
+        subsession.set_groups(subsession.get_group_matrix())
+        self.assertEqual(len(readiness._ready), 2)
+
+        matrix = subsession.get_group_matrix()
+        matrix[0][0], matrix[1][0] = matrix[1][0], matrix[0][0]
+        subsession.set_groups(matrix)
+        self.assertEqual(
+            list(readiness._ready), [(session.pk, 2, 'subsession', 4)])
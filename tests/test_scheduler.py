@@ -0,0 +1,71 @@
+import random
+import threading
+import time
+
+from otree.timeout.scheduler import TimerScheduler
+
+from .base import TestCase
+
+
+class TestTimerScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = TimerScheduler()
+        self.calls = []
+        self.done = threading.Event()
+
+    def record(self, name, expected_calls=1):
+        self.calls.append(name)
+        if len(self.calls) == expected_calls:
+            self.done.set()
+
+    def test_order(self):
+        self.scheduler.schedule(0.2, self.record, ('b', 2))
+        self.scheduler.schedule(0.1, self.record, ('a', 2))
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.calls, ['a', 'b'])
+
+    def test_cancel(self):
+        self.scheduler.schedule(0.1, self.record, ('a',), key='a')
+        self.assertTrue(self.scheduler.cancel('a'))
+        self.assertFalse(self.scheduler.cancel('a'))
+        self.assertEqual(len(self.scheduler), 0)
+        self.scheduler.schedule(0.2, self.record, ('b',))
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.calls, ['b'])
+
+    def test_same_key_replaces(self):
+        self.scheduler.schedule(0.1, self.record, ('old',), key='page')
+        self.scheduler.schedule(0.2, self.record, ('new',), key='page')
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertTrue(self.done.wait(2))
+        time.sleep(0.1)
+        self.assertEqual(self.calls, ['new'])
+
+    def test_failing_timer(self):
+        def fail():
+            raise ValueError()
+        self.scheduler.schedule(0, fail)
+        self.scheduler.schedule(0.1, self.record, ('a',))
+        self.assertTrue(self.done.wait(2))
+
+    def test_10000_timers(self):
+        num_timers = 10000
+        lateness = []
+
+        def fire(due):
+            lateness.append(time.time() - due)
+            if len(lateness) == num_timers:
+                self.done.set()
+
+        start_time = time.time()
+        for i in range(num_timers):
+            delay = random.uniform(0, 2)
+            self.scheduler.schedule(
+                delay, fire, (time.time() + delay,), key=i)
+        scheduling_seconds = time.time() - start_time
+
+        self.assertTrue(self.done.wait(10))
+        self.assertLess(scheduling_seconds, 1)
+        self.assertLess(max(lateness), 1)
+        self.assertEqual(len(self.scheduler), 0)
@@ -0,0 +1,94 @@
+import time
+
+from django.core.management import call_command
+from mock import patch
+
+from otree.advance import advance_participant
+from otree.models.participant import Participant
+from otree.timeout.sweeper import sweep_expired_timeouts
+
+from .simple_game.views import MyPage
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestSweepExpiredTimeouts(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "3")
+        patchers = [
+            patch('otree.timeout.tasks.submit_expired_page'),
+            patch('otree.timeout.tasks.ensure_pages_visited'),
+            patch('otree.views.abstract.channels.Group'),
+            patch('otree.channels.broadcast.Group'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for participant in Participant.objects.all():
+            advance_participant(participant)
+
+    def add_timeout(self, participant, expiration_time, page_index=1):
+        Participant.objects.filter(pk=participant.pk).update(
+            _timeout_page_index=page_index,
+            _timeout_expiration_time=expiration_time)
+
+    def test_sweep(self):
+        now = int(time.time())
+        expired, other_expired, pending = Participant.objects.order_by('pk')
+        self.add_timeout(expired, now - 5)
+        self.add_timeout(other_expired, now)
+        self.add_timeout(pending, now + 60)
+
+        self.assertEqual(sweep_expired_timeouts(now=now, batch_size=1), 2)
+
+        indexes = [
+            p._index_in_pages for p in Participant.objects.order_by('pk')]
+        self.assertEqual(indexes, [2, 2, 1])
+        self.assertEqual(
+            list(Participant.objects.filter(
+                _timeout_expiration_time__isnull=False
+            ).values_list('pk', flat=True)),
+            [pending.pk])
+
+    def test_already_advanced(self):
+        participant = Participant.objects.order_by('pk')[0]
+        # the participant is on page 1, not 3
+        self.add_timeout(participant, 0, page_index=3)
+        self.assertEqual(sweep_expired_timeouts(), 0)
+        self.assertEqual(
+            Participant.objects.get(pk=participant.pk)._index_in_pages, 1)
+
+    def test_failed_participant_is_skipped(self):
+        now = int(time.time())
+        failing, other = Participant.objects.order_by('pk')[:2]
+        self.add_timeout(failing, now)
+        self.add_timeout(other, now)
+
+        def before_next_page(page):
+            if page.participant.pk == failing.pk:
+                raise ValueError
+
+        with patch.object(MyPage, 'before_next_page', before_next_page), \
+                patch('otree.advance.logger') as logger:
+            self.assertEqual(sweep_expired_timeouts(now=now), 1)
+        self.assertEqual(logger.exception.call_count, 1)
+
+        failing = Participant.objects.get(pk=failing.pk)
+        self.assertEqual(failing._index_in_pages, 1)
+        self.assertIsNone(failing._timeout_expiration_time)
+        self.assertEqual(
+            Participant.objects.get(pk=other.pk)._index_in_pages, 2)
+
+
+class TestTimeoutSweeperCommand(TestCase):
+
+    def test_error_is_logged(self):
+        with patch(
+                'otree.management.commands.timeoutsweeper.'
+                'sweep_expired_timeouts', side_effect=ValueError), \
+                patch('otree.management.commands.timeoutsweeper.logger') \
+                as logger:
+            call_command('timeoutsweeper', once=True)
+        self.assertEqual(logger.exception.call_count, 1)
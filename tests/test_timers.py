@@ -0,0 +1,88 @@
+import time
+
+from django.core.management import call_command
+from mock import patch
+
+from otree.models.participant import Participant
+from otree.timeout import tasks, timers
+
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestPageTimers(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+        timers.timer_stats.reset()
+
+    def test_reload_keeps_timer(self):
+        with patch.object(tasks.submit_expired_page, 'schedule') as schedule:
+            self.assertTrue(
+                timers.schedule_page_timer(self.participant, 1, 10))
+            self.assertFalse(
+                timers.schedule_page_timer(self.participant, 1, 10))
+        schedule.assert_called_once_with(
+            (self.participant.code, 1), delay=10)
+        expiration_time = self.participant._timeout_expiration_time
+        self.assertAlmostEqual(expiration_time, time.time() + 10, delta=2)
+        stats = timers.timer_stats.as_dict()
+        self.assertEqual(stats['scheduled'], 1)
+        self.assertEqual(stats['suppressed'], 1)
+
+    def test_next_page_gets_timer(self):
+        with patch.object(tasks.submit_expired_page, 'schedule') as schedule:
+            timers.schedule_page_timer(self.participant, 1, 10)
+            timers.schedule_page_timer(self.participant, 3, 10)
+        self.assertEqual(schedule.call_count, 2)
+
+    def test_cancelled_timer_does_nothing(self):
+        with patch.object(tasks.submit_expired_page, 'schedule'):
+            timers.schedule_page_timer(self.participant, 1, 10)
+        timers.cancel_page_timer(self.participant)
+        self.assertIsNone(self.participant._timeout_expiration_time)
+        self.participant.save()
+        self.assertEqual(timers.timer_stats.as_dict()['cancelled'], 1)
+
+        Participant.objects.filter(pk=self.participant.pk).update(
+            _index_in_pages=1)
+        with patch('otree.advance.advance_participant') as advance:
+            # call the task's function directly, rather than enqueuing it
+            tasks.submit_expired_page.call_local(self.participant.code, 1)
+        self.assertFalse(advance.called)
+
+    def test_expired_timer_rescheduled(self):
+        # e.g. its task was lost when the worker restarted
+        with patch.object(tasks.submit_expired_page, 'schedule') as schedule:
+            timers.schedule_page_timer(self.participant, 1, 10)
+            self.participant._timeout_expiration_time = int(time.time() - 1)
+            self.assertTrue(
+                timers.schedule_page_timer(self.participant, 1, 10))
+        self.assertEqual(schedule.call_count, 2)
+
+    def test_failed_task_clears_timer(self):
+        with patch.object(tasks.submit_expired_page, 'schedule'):
+            timers.schedule_page_timer(self.participant, 1, 10)
+        self.participant._index_in_pages = 1
+        self.participant.save()
+        with patch('otree.advance.advance_participant',
+                   side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                tasks.submit_expired_page.call_local(
+                    self.participant.code, 1)
+        participant = Participant.objects.get()
+        self.assertIsNone(participant._timeout_page_index)
+        self.assertIsNone(participant._timeout_expiration_time)
+        with patch.object(tasks.submit_expired_page, 'schedule') as schedule:
+            self.assertTrue(timers.schedule_page_timer(participant, 1, 10))
+        self.assertTrue(schedule.called)
+
+    def test_ensure_pages_visited_skips_errors(self):
+        with patch('otree.advance.advance_participants') as advance:
+            tasks.ensure_pages_visited.call_local({self.participant.pk}, 2)
+        participants, = advance.call_args[0]
+        self.assertEqual(list(participants), [self.participant])
+        self.assertEqual(
+            advance.call_args[1], {'submit': False, 'skip_errors': True})
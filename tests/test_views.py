@@ -1,5 +1,13 @@
+import threading
+
 from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models.query import QuerySet
+import django.test
+from django.test import Client
 from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from mock import Mock, patch
 
 from otree import constants_internal
 from otree.models.participant import Participant
@@ -7,7 +15,7 @@ from otree.models.participant import Participant
 from .simple_game.views import MyPage
 from .simple_game.models import Player
 from .utils import capture_stdout
-from .base import TestCase
+from .base import IDMapTestCaseMixin, TestCase
 
 
 class Attribute(object):
@@ -56,3 +64,148 @@ class TestPageView(BaseViewTestCase):
         self.view = MyPage.as_view()
 
         self.reload_objects()
+
+
+class TestClaimUnvisited(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "3")
+        self.session = Participant.objects.all()[0].session
+
+    def test_claims_in_start_order(self):
+        claimed = [
+            Participant._claim_unvisited(self.session) for _ in range(3)]
+        self.assertEqual(
+            [p.start_order for p in claimed],
+            sorted(p.start_order for p in claimed))
+        self.assertEqual(len(set(p.pk for p in claimed)), 3)
+        self.assertTrue(all(p.visited for p in claimed))
+
+    def test_none_left(self):
+        Participant.objects.update(visited=True)
+        self.assertIsNone(Participant._claim_unvisited(self.session))
+
+    def test_skips_participants_claimed_elsewhere(self):
+        first = Participant.objects.order_by('start_order')[0]
+        Participant.objects.filter(pk=first.pk).update(visited=True)
+        claimed = Participant._claim_unvisited(self.session)
+        self.assertNotEqual(claimed.pk, first.pk)
+
+
+class TestAtomicPageRequests(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'simple_game', "1")
+        self.participant = Participant.objects.get()
+        self.client = Client()
+
+    def submit_my_page(self):
+        response = self.client.get(
+            self.participant._start_url(), follow=True)
+        url = response.redirect_chain[-1][0]
+        with patch('otree.views.abstract.channels.Group') as Group:
+            self.client.post(url, {'my_field': 5}, follow=True)
+        return Group
+
+    @override_settings(ATOMIC_PAGE_REQUESTS=True)
+    def test_submit(self):
+        Group = self.submit_my_page()
+        player = Player.objects.get()
+        self.assertEqual(player.my_field, 5)
+        participant = Participant.objects.get()
+        self.assertGreater(participant._index_in_pages, 1)
+        # channel messages are sent after the transaction
+        Group.assert_any_call(
+            'auto-advance-{}'.format(participant.code))
+        self.assertTrue(Group.return_value.send.called)
+
+    def test_submit_without_transaction(self):
+        Group = self.submit_my_page()
+        self.assertEqual(Player.objects.get().my_field, 5)
+        self.assertTrue(Group.return_value.send.called)
+
+    def test_deferred_while_transaction_open(self):
+        # e.g. the select_for_update lock backend, without the setting
+        page = MyPage()
+        page._after_commit_calls = []
+        func = Mock()
+        with transaction.atomic():
+            page._run_after_commit(func, 1)
+        self.assertFalse(func.called)
+        self.assertEqual(page._after_commit_calls, [(func, (1,))])
+
+    def test_run_now_without_transaction(self):
+        page = MyPage()
+        page._after_commit_calls = []
+        func = Mock()
+        with patch.object(connections['default'], 'in_atomic_block', False):
+            page._run_after_commit(func, 1)
+        func.assert_called_once_with(1)
+        self.assertEqual(page._after_commit_calls, [])
+
+    def test_race_between_read_and_claim(self):
+        # another arrival claims the first candidate after this one read
+        # the candidates, but before its UPDATE.
+        # like two requests on different connections.
+        other_claim = []
+        real_update = QuerySet.update
+
+        def update(queryset, **kwargs):
+            if not other_claim:
+                other_claim.append(None)
+                other_claim[0] = (
+                    Participant._claim_unvisited_compare_and_set(
+                        self.session))
+            return real_update(queryset, **kwargs)
+
+        with patch.object(QuerySet, 'update', update):
+            pk = Participant._claim_unvisited_compare_and_set(self.session)
+        self.assertIsNotNone(other_claim[0])
+        self.assertNotEqual(pk, other_claim[0])
+        self.assertEqual(
+            Participant.objects.filter(visited=True).count(), 2)
+
+
+class TestConcurrentClaims(IDMapTestCaseMixin,
+                           django.test.TransactionTestCase):
+    """many arrivals at once, each on its own connection"""
+
+    num_arrivals = 200
+
+    def setUp(self):
+        if not (connection.vendor == 'postgresql' and
+                connection.pg_version >= 90500):
+            self.skipTest('needs Postgres 9.5+ (FOR UPDATE SKIP LOCKED)')
+        with capture_stdout():
+            call_command(
+                'create_session', 'simple_game', str(self.num_arrivals))
+        self.session = Participant.objects.all()[0].session
+
+    def test_no_participant_claimed_twice(self):
+        claimed = []
+        start = threading.Event()
+
+        def arrive():
+            start.wait()
+            try:
+                participant = Participant._claim_unvisited(self.session)
+                claimed.append(participant and participant.pk)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=arrive)
+            for _ in range(self.num_arrivals + 10)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        claimed_pks = [pk for pk in claimed if pk is not None]
+        self.assertEqual(len(claimed_pks), self.num_arrivals)
+        self.assertEqual(len(set(claimed_pks)), self.num_arrivals)
+        # the 10 arrivals too many get nothing
+        self.assertEqual(claimed.count(None), 10)
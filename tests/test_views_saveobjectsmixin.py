@@ -8,6 +8,7 @@ from .base import TestCase
 from otree.models import Participant
 from otree.models import Session
 from otree.views.abstract import SaveObjectsMixin
+import otree.instrumentation
 
 
 class SaveObjectsMixinTest(TestCase):
@@ -115,3 +116,36 @@ class SaveObjectsMixinTest(TestCase):
             mixin.save_objects()
 
         self.assertTrue(group.save.called)
+
+    def test_one_write_per_changed_instance(self):
+        call_command('create_session', 'simple_game', '2')
+
+        from .simple_game.models import Group
+        from .simple_game.models import Player
+        from .simple_game.models import Subsession
+
+        mixin = SaveObjectsMixin()
+        mixin.GroupClass = Group
+        mixin.PlayerClass = Player
+        mixin.SubsessionClass = Subsession
+
+        idmap.tls.init_idmap()
+        otree.instrumentation.save_stats.reset()
+
+        players = list(Player.objects.all())
+        players[0].payoff = 10
+        # the form's object is saved with commit=False, and written
+        # by save_objects()
+        mixin.object = Player.objects.get(pk=players[1].pk)
+        mixin.object.payoff = 20
+
+        with self.assertNumQueries(2):
+            mixin.save_objects()
+        # nothing left to write
+        with self.assertNumQueries(0):
+            mixin.save_objects()
+
+        stats = otree.instrumentation.save_stats.as_dict()
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['written'], 2)
+        self.assertEqual(stats['coalesced'], stats['checked'] - 2)
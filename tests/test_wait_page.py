@@ -0,0 +1,129 @@
+import json
+
+from django.core.management import call_command
+from mock import patch
+
+from otree.models.participant import Participant
+from otree.models_concrete import (
+    CompletedGroupWaitPage, WaitPageArrival, WaitPageArrivalCounter)
+from otree.views.abstract import (
+    AFTER_ALL_PLAYERS_ARRIVE_ATTEMPTS, run_after_all_players_arrive)
+
+from .multi_player_game.models import Player
+from .multi_player_game.views import AllGroupsWaitPage, PickWinner
+from .utils import capture_stdout
+from .base import TestCase
+
+
+class TestWaitPageArrivals(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "6")
+        self.players = list(
+            Player.objects.filter(subsession__round_number=1).order_by('pk'))
+
+    def make_page(self, PageClass, player, page_index=2):
+        page = PageClass()
+        page.player = player
+        page.participant = player.participant
+        page.session = player.session
+        page._index_in_pages = page_index
+        if PageClass.wait_for_all_groups:
+            page._group_or_subsession = player.subsession
+        else:
+            page._group_or_subsession = player.group
+        return page
+
+    def test_last_one_in(self):
+        group_players = self.players[0].group.get_players()
+        remaining = [
+            self.make_page(PickWinner, player)._record_arrival()
+            for player in group_players]
+        self.assertEqual(remaining, [2, 1, 0])
+        counter = WaitPageArrivalCounter.objects.get()
+        self.assertEqual(counter.model_name, 'group')
+        self.assertEqual(counter.total, 3)
+
+    def test_arrival_counted_once(self):
+        page = self.make_page(PickWinner, self.players[0])
+        self.assertEqual(page._record_arrival(), 2)
+        self.assertEqual(page._record_arrival(), 2)
+        self.assertEqual(WaitPageArrival.objects.count(), 1)
+
+    def test_subsession_counter(self):
+        page = self.make_page(AllGroupsWaitPage, self.players[0])
+        self.assertEqual(page._record_arrival(), 5)
+
+    def test_waiting_for_ids(self):
+        group_players = self.players[0].group.get_players()
+        for player in group_players[:2]:
+            self.make_page(PickWinner, player)._record_arrival()
+        last = group_players[2].participant
+        for player in group_players[:2]:
+            participant = Participant.objects.get(pk=player.participant.pk)
+            self.assertEqual(
+                participant._waiting_for_ids,
+                'P{}'.format(last.id_in_session))
+
+
+class TestAfterAllPlayersArriveInBackground(TestCase):
+
+    def setUp(self):
+        with capture_stdout():
+            call_command('create_session', 'multi_player_game', "3")
+        self.player = Player.objects.filter(
+            subsession__round_number=1)[0]
+
+    def make_message(self):
+        page = PickWinner()
+        page.session = self.player.session
+        page.subsession = self.player.subsession
+        page.group = self.player.group
+        page._group_or_subsession = self.player.group
+        page._index_in_pages = 2
+        completion = CompletedGroupWaitPage.objects.create(
+            page_index=2, group_pk=page.group.pk,
+            session_pk=page.session.pk)
+        return page, page._after_all_players_arrive_message(completion)
+
+    def test_run(self):
+        page, message = self.make_message()
+
+        with patch('otree.views.abstract.channels.Group') as Group, \
+                patch('otree.timeout.tasks.ensure_pages_visited'):
+            run_after_all_players_arrive(message)
+
+        Group.assert_called_with(page.channels_group_name())
+        self.assertTrue(Group.return_value.send.called)
+        completion = CompletedGroupWaitPage.objects.get()
+        self.assertTrue(completion.after_all_players_arrive_run)
+        self.assertIsNotNone(completion.after_all_players_arrive_seconds)
+        winners = Player.objects.filter(
+            group=page.group, is_winner=True)
+        self.assertEqual(len(winners), 1)
+
+    def test_failure_is_retried(self):
+        page, message = self.make_message()
+        with patch.object(PickWinner, 'after_all_players_arrive',
+                          side_effect=ValueError), \
+                patch('otree.views.abstract.channels') as channels:
+            run_after_all_players_arrive(message)
+        channels.Channel.return_value.send.assert_called_once_with(
+            dict(message, attempt=2))
+        # nobody else starts it meanwhile
+        self.assertTrue(CompletedGroupWaitPage.objects.exists())
+
+    def test_players_told_after_last_attempt(self):
+        page, message = self.make_message()
+        message['attempt'] = AFTER_ALL_PLAYERS_ARRIVE_ATTEMPTS
+        with patch.object(PickWinner, 'after_all_players_arrive',
+                          side_effect=ValueError), \
+                patch('otree.views.abstract.channels') as channels:
+            run_after_all_players_arrive(message)
+        self.assertFalse(channels.Channel.return_value.send.called)
+        channels.Group.assert_called_with(page.channels_group_name())
+        sent = channels.Group.return_value.send.call_args[0][0]
+        self.assertIn('error', json.loads(sent['text']))
+        # reloading the wait page runs it again
+        self.assertFalse(CompletedGroupWaitPage.objects.exists())